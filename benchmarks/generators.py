@@ -0,0 +1,87 @@
+"""Synthetic fire and met data for benchmarking
+
+Data are random, but reproducible given the seed, and shaped like real
+inputs to SEVPlumeRise and FEPSPlumeRise.
+"""
+
+__author__      = "Joel Dubowy"
+
+import datetime
+
+import numpy as np
+
+NUM_LEVELS = 31
+START = datetime.datetime(2014, 5, 29, 0)
+
+
+def timestamps(n_hours):
+    return [(START + datetime.timedelta(hours=h)).strftime('%Y-%m-%dT%H:%M:%S')
+        for h in range(n_hours)]
+
+def met_arrays(n_fires, n_hours, seed=0, num_levels=NUM_LEVELS):
+    """Returns dict of PBL height, TPOT, and HGTS arrays, as passed to
+    SEVPlumeRise.compute_batch, plus 'frp', of shape (n_fires, 1); with
+    the default num_levels, fire i's values match those of the i'th fire
+    yielded by sev_fires
+    """
+    arrays = [_fire_met(seed, i, n_hours, num_levels) for i in range(n_fires)]
+    return {k: np.stack([a[k] for a in arrays])
+        for k in ('height_abl', 'potential_temperature', 'height', 'frp')}
+
+def sev_fires(n_fires, n_hours, seed=0):
+    """Generator yielding dicts with 'local_met', 'fire_area', and 'frp',
+    as passed to SEVPlumeRise.compute
+    """
+    dts = timestamps(n_hours)
+    for i in range(n_fires):
+        arrays = _fire_met(seed, i, n_hours, NUM_LEVELS)
+        local_met = {}
+        for h, dt in enumerate(dts):
+            local_met[dt] = {
+                'HGTS': arrays['height'][h].tolist(),
+                'TPOT': arrays['potential_temperature'][h].tolist(),
+                'RELH': [50.0] * NUM_LEVELS,
+                'PBLH': float(arrays['height_abl'][h])
+            }
+        yield {
+            'local_met': local_met,
+            'fire_area': arrays['fire_area'],
+            'frp': float(arrays['frp'][0])
+        }
+
+def _fire_met(seed, i, n_hours, num_levels):
+    rng = np.random.default_rng([seed, i])
+    fire_area = float(rng.uniform(1, 5000))
+    return {
+        'fire_area': fire_area,
+        'frp': np.array([4180.8 * fire_area]),
+        'height_abl': rng.uniform(50, 3000, n_hours),
+        'potential_temperature': 290 + np.cumsum(
+            rng.uniform(0.1, 3, (n_hours, num_levels)), axis=-1),
+        'height': np.cumsum(rng.uniform(50, 1000, (n_hours, num_levels)),
+            axis=-1)
+    }
+
+def feps_fires(n_fires, n_hours, seed=0):
+    """Generator yielding dicts with 'timeprofile', 'consumption', and
+    'fire_location_info', as passed to FEPSPlumeRise.compute_many
+    """
+    dts = timestamps(n_hours)
+    for i in range(n_fires):
+        rng = np.random.default_rng([seed, i])
+        fractions = rng.uniform(0, 1, n_hours)
+        fractions /= fractions.sum()
+        timeprofile = {dt: {
+                'area_fraction': float(f),
+                'flaming': float(f),
+                'smoldering': float(f),
+                'residual': float(f)
+            } for dt, f in zip(dts, fractions)}
+        area = float(rng.uniform(1, 5000))
+        consumption = {k: area * float(rng.uniform(1, 20))
+            for k in ('flaming', 'smoldering', 'residual', 'duff')}
+        yield {
+            'timeprofile': timeprofile,
+            'consumption': consumption,
+            'fire_location_info': {'area': area}
+        }
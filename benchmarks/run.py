@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""Benchmarks plume rise throughput and latency
+
+Runs offline: FEPS benchmarks use the stand-in feps_weather and
+feps_plumerise executables in benchmarks/stubs, with configurable latency.
+Results are written as JSON, for comparison across commits.
+
+Examples:
+
+    ./benchmarks/run.py --scale small --hours 24 72 -o bench.json
+    ./benchmarks/run.py --scale tiny --stub-latency 0.05 --only feps
+"""
+
+__author__      = "Joel Dubowy"
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import numpy as np
+
+import generators
+from plumerise import compute_plumerise_hour, __version__
+from plumerise.feps import FEPSPlumeRise
+from plumerise.met import LocalMet
+from plumerise.parallel import ParallelSEV
+from plumerise.result import PlumeRiseResult
+from plumerise.sev import SEVPlumeRise, parameter_grid
+from plumerise.workdir import WorkingDirManager
+
+SCALES = {
+    'tiny': 1,
+    'small': 1000,
+    'large': 100000
+}
+STUBS_DIR = os.path.join(BENCHMARKS_DIR, 'stubs')
+# Number of fires generated at a time by benchmarks of dict inputs, whose
+# per-level met lists would take several GB at the large scale
+CHUNK_SIZE = 1000
+
+
+## Benchmarks
+# Each takes the number of fires and hours and the parsed args, and returns
+# a callable that runs the benchmark once.  Input generation isn't timed:
+# the callable either runs on inputs generated up front, or generates them
+# itself, in chunks, and returns the seconds spent on the rest.  Those that
+# hold resources, e.g. worker processes or working dirs, set a 'close'
+# attribute of the callable to a function releasing them, which is called
+# after the last run.
+
+def _in_chunks(fires, compute):
+    """Returns callable that calls compute on each fire yielded by
+    fires(), generating them CHUNK_SIZE at a time, and returns the seconds
+    spent in compute
+    """
+    def run():
+        seconds = 0.0
+        remaining = fires()
+        while True:
+            chunk = list(itertools.islice(remaining, CHUNK_SIZE))
+            if not chunk:
+                return seconds
+            t = time.perf_counter()
+            for f in chunk:
+                compute(f)
+            seconds += time.perf_counter() - t
+    return run
+
+def sev_compute(n_fires, n_hours, args):
+    sev = SEVPlumeRise()
+    def compute(f):
+        sev.compute(f['local_met'], f['fire_area'], frp=f['frp'])
+    return _in_chunks(lambda: generators.sev_fires(n_fires, n_hours), compute)
+
+def sev_compute_local_met(n_fires, n_hours, args):
+    sev = SEVPlumeRise()
+    def fires():
+        return (dict(f, local_met=LocalMet.from_dict(f['local_met']))
+            for f in generators.sev_fires(n_fires, n_hours))
+    def compute(f):
+        sev.compute(f['local_met'], f['fire_area'], frp=f['frp'])
+    return _in_chunks(fires, compute)
+
+def sev_iter_compute(n_fires, n_hours, args):
+    sev = SEVPlumeRise()
+    def compute(f):
+        for r in sev.iter_compute(sorted(f['local_met'].items()),
+                f['fire_area'], frp=f['frp']):
+            pass
+    return _in_chunks(lambda: generators.sev_fires(n_fires, n_hours), compute)
+
+def sev_compute_batch(n_fires, n_hours, args):
+    # batched in chunks, to bound memory at large scales
+    chunk_size = 10000
+    chunks = [generators.met_arrays(min(chunk_size, n_fires - i), n_hours,
+        seed=i, num_levels=2) for i in range(0, n_fires, chunk_size)]
+    sev = SEVPlumeRise()
+    def run():
+        for c in chunks:
+            sev.compute_batch(c['height_abl'], c['potential_temperature'],
+                c['height'], frp=c['frp'])
+    return run
+
+def sev_compute_parallel(n_fires, n_hours, args):
+    c = generators.met_arrays(n_fires, n_hours, num_levels=2)
+    # workers are started on the first run; the best of repeats excludes it
+    parallel_sev = ParallelSEV(processes=args.workers)
+    def run():
+        parallel_sev.compute_batch(c['height_abl'],
+            c['potential_temperature'], c['height'], frp=c['frp'])
+    run.close = parallel_sev.close
+    return run
+
+def sev_compute_ensemble(n_fires, n_hours, args):
+    # 100 parameter sets, over the first 1000 fires
+    c = generators.met_arrays(min(n_fires, 1000), n_hours, num_levels=2)
+    params = parameter_grid(alpha=np.linspace(0.1, 0.4, 10),
+        delta=np.linspace(0.3, 0.9, 10))
+    sev = SEVPlumeRise()
+    def run():
+        sev.compute_ensemble(params, c['height_abl'],
+            c['potential_temperature'], c['height'], frp=c['frp'])
+    return run
+
+def compute_plumerise_hour_dicts(n_fires, n_hours, args):
+    def run():
+        for i in range(n_fires * n_hours):
+            compute_plumerise_hour(0.1, 2000.0, 1000.0)
+    return run
+
+def plume_rise_result_to_dict(n_fires, n_hours, args):
+    dts = generators.timestamps(n_hours)
+    result = PlumeRiseResult(dts, np.full(n_hours, 1000.0),
+        np.full(n_hours, 2000.0), np.full(n_hours, 0.1))
+    def run():
+        for i in range(n_fires):
+            result.to_dict()
+    return run
+
+def _feps_fires(n_fires, n_hours, args):
+    return list(generators.feps_fires(min(n_fires, args.max_feps_fires),
+        n_hours))
+
+def _feps(args, working_dir_manager):
+    return FEPSPlumeRise(
+        feps_weather_binary=os.path.join(STUBS_DIR, 'feps_weather'),
+        feps_plumerise_binary=os.path.join(STUBS_DIR, 'feps_plumerise'),
+        working_dir_manager=working_dir_manager)
+
+def feps_compute(n_fires, n_hours, args):
+    fires = _feps_fires(n_fires, n_hours, args)
+    # removes each fire's working dir after use
+    manager = WorkingDirManager()
+    feps = _feps(args, manager)
+    def run():
+        for f in fires:
+            feps.compute(f['timeprofile'], f['consumption'],
+                f['fire_location_info'])
+    run.close = manager.cleanup
+    return run
+
+def feps_compute_many(n_fires, n_hours, args):
+    fires = _feps_fires(n_fires, n_hours, args)
+    manager = WorkingDirManager()
+    feps = _feps(args, manager)
+    def run():
+        for r in feps.compute_many(fires, max_workers=args.workers):
+            if r[2]:
+                raise r[2]
+    run.close = manager.cleanup
+    return run
+
+BENCHMARKS = [
+    ('sev', sev_compute),
+    ('sev', sev_compute_local_met),
+    ('sev', sev_iter_compute),
+    ('sev', sev_compute_batch),
+    ('sev', sev_compute_parallel),
+    ('sev', sev_compute_ensemble),
+    ('layers', compute_plumerise_hour_dicts),
+    ('layers', plume_rise_result_to_dict),
+    ('feps', feps_compute),
+    ('feps', feps_compute_many)
+]
+
+
+## Running
+
+def run_benchmark(name, func, n_fires, n_hours, args):
+    run = func(n_fires, n_hours, args)
+    # FEPS benchmarks run on a subset of fires
+    if name.startswith('feps'):
+        n_fires = min(n_fires, args.max_feps_fires)
+    times = []
+    try:
+        for i in range(args.repeat):
+            t = time.perf_counter()
+            seconds = run()
+            times.append(time.perf_counter() - t if seconds is None
+                else seconds)
+    finally:
+        if hasattr(run, 'close'):
+            run.close()
+    best = min(times)
+    return {
+        'name': name,
+        'n_fires': n_fires,
+        'n_hours': n_hours,
+        'repeat': args.repeat,
+        'seconds': times,
+        'best_seconds': best,
+        'median_seconds': statistics.median(times),
+        'fires_per_second': n_fires / best if best else None,
+        'fire_hours_per_second': n_fires * n_hours / best if best else None,
+        'seconds_per_fire': best / n_fires
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default=['tiny', 'small'], nargs='+',
+        choices=list(SCALES), help="number of fires; default: tiny small")
+    parser.add_argument('--hours', default=[24], nargs='+', type=int,
+        help="number of hours per fire; default: 24")
+    parser.add_argument('--only', nargs='+',
+        choices=sorted(set(g for g, f in BENCHMARKS)),
+        help="run only these groups of benchmarks")
+    parser.add_argument('--repeat', default=3, type=int,
+        help="times to run each benchmark; default: 3")
+    parser.add_argument('--stub-latency', default=0.0, type=float,
+        help="seconds each stub FEPS executable sleeps; default: 0")
+    parser.add_argument('--max-feps-fires', default=100, type=int,
+        help="cap on number of fires run through FEPS; default: 100")
+    parser.add_argument('--workers', default=None, type=int,
+        help="max workers for batch FEPS and parallel SEV benchmarks;"
+        " default: number of CPUs")
+    parser.add_argument('-o', '--output', help="JSON output file; default: stdout")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.environ['PLUMERISE_STUB_LATENCY'] = str(args.stub_latency)
+
+    results = []
+    for scale in args.scale:
+        for n_hours in args.hours:
+            for group, func in BENCHMARKS:
+                if args.only and group not in args.only:
+                    continue
+                r = run_benchmark(func.__name__, func, SCALES[scale],
+                    n_hours, args)
+                r['scale'] = scale
+                sys.stderr.write("{name} ({scale}, {n_hours}h): "
+                    "{best_seconds:.4f}s\n".format(**r))
+                results.append(r)
+
+    output = {
+        'plumerise_version': __version__,
+        'git_commit': git_commit(),
+        'python_version': platform.python_version(),
+        'numpy_version': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'stub_latency': args.stub_latency,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+if __name__ == "__main__":
+    main()
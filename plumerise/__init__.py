@@ -4,7 +4,8 @@ __version_info__ = (2,0,4)
 __version__ = '.'.join([str(n) for n in __version_info__])
 
 
-def compute_plumerise_hour(smoldering_fraction, plume_top_meters, plume_bottom_meters):
+def compute_plumerise_hour(smoldering_fraction, plume_top_meters,
+        plume_bottom_meters, num_layers=20):
     plume_rise_hr = {
         'smolder_fraction': smoldering_fraction #,
         # 'plume_bottom_meters': plume_bottom_meters,
@@ -12,11 +13,11 @@ def compute_plumerise_hour(smoldering_fraction, plume_top_meters, plume_bottom_m
     }
 
     if plume_top_meters is not None and plume_bottom_meters is not None:
-        # evenly distribute emissions among 20 vertical layers between
-        # plume bottom and plume top
-        spacing = (plume_top_meters - plume_bottom_meters) / 20
+        # evenly distribute emissions among vertical layers (20, by
+        # default) between plume bottom and plume top
+        spacing = (plume_top_meters - plume_bottom_meters) / num_layers
         plume_rise_hr['heights'] = [plume_bottom_meters + n * spacing
-            for n in range(21)]
-        plume_rise_hr['emission_fractions'] = [0.05] * 20
+            for n in range(num_layers + 1)]
+        plume_rise_hr['emission_fractions'] = [1.0 / num_layers] * num_layers
 
     return plume_rise_hr
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""plumerise.batch
+"""
+
+__author__      = "Joel Dubowy"
+
+import concurrent.futures
+import os
+
+
+def run_many(func, items, max_workers=None, ordered=True,
+        use_processes=False):
+    """Calls func on each item, concurrently, with bounded concurrency
+
+    Generator yielding (index, result, error) for each item, where index is
+    the item's position in items, and where error is the exception raised
+    by func (in which case result is None).  A failure for one item doesn't
+    affect the others.
+
+    args
+     - func -- callable taking a single item
+     - items -- iterable of items; it's consumed lazily, so it may be
+        arbitrarily long
+    kwargs
+     - max_workers -- number of concurrent calls; defaults to number of CPUs
+     - ordered -- if True, results are yielded in input order; otherwise,
+        they're yielded as they complete
+     - use_processes -- use a process pool rather than a thread pool; func
+        and items must then be picklable
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    # limit how many items are read from the input and held in memory,
+    # whether waiting to run or (if ordered) waiting on an earlier item
+    max_held = 2 * max_workers
+
+    executor_class = (concurrent.futures.ProcessPoolExecutor if use_processes
+        else concurrent.futures.ThreadPoolExecutor)
+
+    items = enumerate(items)
+    exhausted = False
+    pending = {}
+    completed = {}
+    next_index = 0
+    with executor_class(max_workers=max_workers) as executor:
+        while True:
+            while not exhausted and len(pending) + len(completed) < max_held:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = index
+
+            if not pending:
+                break
+
+            done, not_done = concurrent.futures.wait(pending,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                r = (index, None if error else future.result(), error)
+                if ordered:
+                    completed[index] = r
+                else:
+                    yield r
+
+            while next_index in completed:
+                yield completed.pop(next_index)
+                next_index += 1
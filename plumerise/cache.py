@@ -0,0 +1,288 @@
+"""plumerise.cache
+"""
+
+__author__      = "Joel Dubowy"
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class LRUCache(object):
+    """Bounded, thread-safe, in-memory least-recently-used cache
+    """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+
+class DiurnalCache(object):
+    """Cache of feps_weather output, keyed on feps_weather's input
+
+    The key is the content of the weather file passed to feps_weather,
+    which normalizes the fire location info to just the eleven values
+    feps_weather sees, formatted as it sees them.  Entries are kept in
+    a bounded in-memory LRU and, if cache_dir is specified, on disk, where
+    they persist across processes and runs.
+    """
+
+    def __init__(self, max_size=128, cache_dir=None):
+        self._memory = LRUCache(max_size)
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, weather):
+        """Returns cached diurnal file content, or None if not cached"""
+        diurnal = self._memory.get(weather)
+        if diurnal is None and self.cache_dir:
+            try:
+                with open(self._filename(weather), 'r') as f:
+                    diurnal = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                self._memory.set(weather, diurnal)
+
+        if diurnal is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return diurnal
+
+    def set(self, weather, diurnal):
+        self._memory.set(weather, diurnal)
+        if self.cache_dir:
+            # write then rename, so that concurrent readers never see a
+            # partially written file
+            fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(diurnal)
+            os.replace(tmp_filename, self._filename(weather))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._memory),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+    def _filename(self, weather):
+        key = hashlib.sha256(weather.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + '.txt')
+
+
+class StabilityCache(object):
+    """Cache of SEV's free troposphere stability term, by met column
+
+    The term, exp(-DELTA * N^2 / REF_N), depends only on met and model
+    parameters, not on the fire, so fires in the same met grid cell can
+    share it.  Each entry holds the terms of a range of hours, and is
+    keyed on (met_cell, met values, GRAVITY, DELTA, REF_N), where met
+    values are the bytes of the hours' lowest two HGTS and TPOT levels,
+    and met_cell is any hashable identifier the caller uses for the
+    column.  One instance may be shared by many SEVPlumeRise objects.
+    """
+
+    def __init__(self, max_size=100000):
+        self._memory = LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def get(self, key):
+        """Returns cached stability term, or None if not cached"""
+        return self._memory.get(key)
+
+    def set(self, key, stability):
+        self._memory.set(key, stability)
+
+    def stats(self):
+        return self._memory.stats()
+
+
+class ResultCache(object):
+    """Persistent, content-addressed cache of plume rise results
+
+    Results are stored, JSON serialized, in a SQLite database, keyed on a
+    hash of everything that determines them (see make_key).  Timestamps,
+    whether dict keys or values, are stored as strings, and converted back
+    by get, given the input's.  Entries older than max_age seconds are
+    dropped, and, if there are more than max_entries, the least recently
+    used are dropped.  The database may be shared by multiple processes.
+    """
+
+    def __init__(self, filename, max_entries=None, max_age=None):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, timeout=30,
+            check_same_thread=False, isolation_level=None)
+        # every hit writes its access time; with the default rollback
+        # journal, each of those writes is synced, which costs more than
+        # computing many results.  In WAL mode, with NORMAL sync, the
+        # database stays consistent, and only the last writes can be lost
+        # on power failure, which is harmless for a cache
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed "
+            "ON results (accessed)")
+
+    @staticmethod
+    def make_key(data):
+        """Returns hash of JSON serializable data, insensitive to dict order"""
+        canonical = _dumps(data, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key, timestamps=None):
+        """Returns cached result, or None if not cached or expired
+
+        kwargs
+         - timestamps -- timestamps of the input the result was computed
+            from, e.g. datetimes; those of the result, which are stored as
+            strings, are converted back to them, so that a hit returns the
+            same types as a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM results WHERE key = ?",
+                (key,)).fetchone()
+            if row and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                (now, key))
+            self.hits += 1
+        return _restore_timestamps(json.loads(row[0]), timestamps)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results "
+                "(key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, _dumps(value), now, now))
+            self._evict(now)
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        if self.max_age is not None:
+            self._conn.execute("DELETE FROM results WHERE created < ?",
+                (now - self.max_age,))
+        if self.max_entries is not None:
+            self._conn.execute("DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def _dumps(data, **kwargs):
+    """json.dumps, with values that aren't JSON serializable, e.g.
+    datetimes, as strings, whether dict keys or values
+    """
+    try:
+        return json.dumps(data, default=str, **kwargs)
+    except TypeError:
+        # walking the data is costly, so is done only if there are keys
+        # json.dumps can't handle
+        return json.dumps(_str_keys(data), default=str, **kwargs)
+
+def _str_keys(data):
+    """Returns data with dict keys, e.g. datetimes, converted to strings,
+    which json.dumps's default doesn't do; values are left to default=str
+    """
+    if isinstance(data, dict):
+        return {str(k): _str_keys(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_str_keys(v) for v in data]
+    return data
+
+def _restore_timestamps(result, timestamps):
+    """Returns cached plume rise with its timestamps, stored as strings,
+    replaced by those of the input with the same string form
+    """
+    if timestamps is None or not isinstance(result, dict):
+        return result
+    by_str = {str(dt): dt for dt in timestamps}
+    if 'hours' in result:
+        result['hours'] = {by_str.get(dt, dt): hour
+            for dt, hour in result['hours'].items()}
+    if 'timestamps' in result:
+        result['timestamps'] = [by_str.get(dt, dt)
+            for dt in result['timestamps']]
+    return result
@@ -0,0 +1,224 @@
+"""plumerise.cli
+"""
+
+__author__      = "Joel Dubowy"
+
+import argparse
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+
+from .batch import run_many
+from .feps import FEPSPlumeRise
+from .result import PlumeRiseResult
+from .sev import SEVPlumeRise
+
+DESCRIPTION = """Computes plume rise for fires read as JSON Lines
+
+Each input line is a JSON object for one fire.  For the SEV model, its keys
+are the args of SEVPlumeRise.compute -- 'local_met', 'fire_area', and,
+optionally, 'smolder_fraction' and 'frp'.  For FEPS, they're the args of
+FEPSPlumeRise.compute -- 'timeprofile', 'consumption', and
+'fire_location_info'.  An 'id' may also be included.
+
+For each fire, a line is written with its 'id' (if specified), the 'line'
+number of its input, and either its 'plumerise' or an 'error'.  Output is
+in input order and is written as fires complete, so memory use doesn't
+depend on input size.
+"""
+
+EPILOG = """Examples:
+
+    plumerise -m sev -i fires.jsonl -o plumerise.jsonl --workers 8
+    plumerise -m feps -c plume_top_behavior='"briggs"' < fires.jsonl
+
+If --resume is specified, the number of input lines processed, and the
+size of the output written for them, are recorded in the checkpoint file as
+the run progresses, and a subsequent run with the same checkpoint file skips
+those lines, truncates the output file to that size, discarding output
+written after the checkpoint, e.g. a partial last line, and appends to it.
+Up to --checkpoint-interval lines may be recomputed after a crash.
+"""
+
+MODELS = {
+    'sev': SEVPlumeRise,
+    'feps': FEPSPlumeRise
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='plumerise',
+        description=DESCRIPTION, epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-m', '--model', required=True, choices=list(MODELS),
+        help="plume rise model")
+    parser.add_argument('-i', '--input',
+        help="input JSON Lines file; default: stdin")
+    parser.add_argument('-o', '--output',
+        help="output JSON Lines file; default: stdout")
+    parser.add_argument('-c', '--config', action='append', default=[],
+        metavar='KEY=VALUE', help="model config setting, with JSON value;"
+        " may be repeated")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="number of fires to compute concurrently; default: 1")
+    parser.add_argument('--resume', metavar='CHECKPOINT_FILE',
+        help="record progress in, and resume from, this file")
+    parser.add_argument('--checkpoint-interval', type=int, default=100,
+        help="lines between checkpoint updates; default: 100")
+    parser.add_argument('--log-level', default='WARNING',
+        help="default: WARNING")
+    args = parser.parse_args(argv)
+    args.config = parse_config(parser, args.config)
+
+    if args.output is None and args.resume:
+        parser.error("--resume requires --output")
+
+    return args
+
+
+def parse_config(parser, settings):
+    """Returns model config dict from list of 'KEY=VALUE' strings, where
+    values are JSON
+    """
+    config = {}
+    for c in settings:
+        key, sep, value = c.partition('=')
+        if not sep:
+            parser.error("Invalid config setting: {}".format(c))
+        try:
+            config[key.lower()] = json.loads(value)
+        except ValueError:
+            parser.error("Invalid JSON value for {}: {}".format(key, value))
+    return config
+
+def compute_fire(plume_rise_model, fire):
+    """Computes plume rise for one fire, returning it in dict form
+
+    args
+     - plume_rise_model -- SEVPlumeRise or FEPSPlumeRise object
+     - fire -- dict of args of the model's compute method
+    """
+    if isinstance(plume_rise_model, SEVPlumeRise):
+        plume_rise = plume_rise_model.compute(fire['local_met'],
+            fire['fire_area'],
+            smolder_fraction=fire.get('smolder_fraction', 0.0),
+            frp=fire.get('frp'))
+    else:
+        plume_rise = plume_rise_model.compute(fire['timeprofile'],
+            fire['consumption'], fire['fire_location_info'])
+    if isinstance(plume_rise, PlumeRiseResult):
+        plume_rise = plume_rise.to_dict()
+    return plume_rise
+
+def compute_line(model, config, numbered_line):
+    """Computes plume rise for one input line
+
+    Returns output line, or None if input line is blank.  Module level,
+    so that it can be run in a process pool.
+
+    args
+     - model -- 'sev' or 'feps'
+     - config -- model config
+     - numbered_line -- (line, line_number) tuple
+    """
+    line, index = numbered_line
+    if not line.strip():
+        return None
+
+    output = {'line': index}
+    try:
+        fire = json.loads(line)
+        if 'id' in fire:
+            output['id'] = fire.pop('id')
+        output['plumerise'] = compute_fire(MODELS[model](**config), fire)
+
+    except Exception as e:
+        logging.error("Failed to compute plume rise for line %d: %s",
+            index, e)
+        output['error'] = str(e)
+
+    return json.dumps(output) + '\n'
+
+
+def read_checkpoint(filename):
+    """Returns (lines_processed, output_offset) tuple, where output_offset
+    is None if the checkpoint predates its being recorded
+    """
+    try:
+        with open(filename) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0, None
+    return checkpoint['lines_processed'], checkpoint.get('output_offset')
+
+def write_checkpoint(filename, lines_processed, output_offset):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump({'lines_processed': lines_processed,
+            'output_offset': output_offset}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+def checkpoint(filename, lines_processed, output_file):
+    """Syncs output to disk and records, after it's durable, how much of it
+    is complete
+    """
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    write_checkpoint(filename, lines_processed, output_file.tell())
+
+
+def run(args):
+    skip, output_offset = (read_checkpoint(args.resume) if args.resume
+        else (0, None))
+    if skip:
+        logging.info("Resuming after %d lines", skip)
+
+    input_file = open(args.input) if args.input else sys.stdin
+    output_file = (open(args.output, 'a' if skip else 'w') if args.output
+        else sys.stdout)
+    try:
+        if skip and output_offset is not None:
+            # drop anything written after the checkpoint, which may end
+            # with a partial line
+            output_file.truncate(output_offset)
+            output_file.seek(output_offset)
+
+        lines = itertools.islice(zip(input_file, itertools.count(1)), skip,
+            None)
+        func = functools.partial(compute_line, args.model, args.config)
+        results = run_many(func, lines, max_workers=args.workers,
+            # SEV is CPU bound, and so needs processes to run in parallel;
+            # FEPS mostly waits on its subprocesses
+            use_processes=(args.model == 'sev' and args.workers > 1))
+
+        lines_processed = skip
+        for i, output, error in results:
+            if error:
+                # e.g. unpicklable output
+                raise error
+            if output:
+                output_file.write(output)
+            lines_processed += 1
+            if args.resume and lines_processed % args.checkpoint_interval == 0:
+                checkpoint(args.resume, lines_processed, output_file)
+
+        output_file.flush()
+        if args.resume:
+            checkpoint(args.resume, lines_processed, output_file)
+
+    finally:
+        if args.input:
+            input_file.close()
+        if args.output:
+            output_file.close()
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+        format='%(asctime)s %(levelname)s: %(message)s')
+    run(args)
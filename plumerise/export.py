@@ -0,0 +1,201 @@
+"""plumerise.export
+"""
+
+__author__      = "Joel Dubowy"
+
+import numpy as np
+
+from .result import PlumeRiseResult
+
+# Rows, one per fire-hour, have these columns, plus, if layers are
+# included, 'heights' and 'emission_fractions', each a fixed size list
+# per row
+COLUMNS = ('fire_id', 'time', 'plume_bottom', 'plume_top',
+    'smolder_fraction')
+
+
+## NumPy structured arrays
+
+def to_structured(results, layers=False, num_layers=20):
+    """Returns NumPy structured array of plume rise of many fires
+
+    args
+     - results -- iterable of (fire_id, plume_rise) tuples, where
+        plume_rise is a PlumeRiseResult or plume rise dict; the array form
+        is converted without per-hour Python objects
+    kwargs
+     - layers -- include 'heights' and 'emission_fractions' columns
+     - num_layers -- number of layers, if layers is True; all results
+        must have it
+    """
+    columns = _columns(results, layers, num_layers)
+    dtype = [
+        ('fire_id', columns['fire_id'].dtype),
+        ('time', 'datetime64[s]'),
+        ('plume_bottom', 'f8'),
+        ('plume_top', 'f8'),
+        ('smolder_fraction', 'f8')
+    ]
+    if layers:
+        dtype.extend([('heights', 'f8', (num_layers + 1,)),
+            ('emission_fractions', 'f8', (num_layers,))])
+    array = np.empty(len(columns['time']), dtype=dtype)
+    for k, v in columns.items():
+        array[k] = v
+    return array
+
+def from_structured(array, num_layers=20):
+    """Returns dict of PlumeRiseResult objects, keyed by fire id, from a
+    structured array, e.g. one returned by to_structured
+    """
+    return _results(array['fire_id'], array['time'], array['plume_bottom'],
+        array['plume_top'], array['smolder_fraction'], num_layers)
+
+
+## Arrow and Parquet
+# pyarrow is an optional dependency, imported only when these are used
+
+def to_record_batch(results, layers=False, num_layers=20):
+    """Returns pyarrow.RecordBatch of plume rise of many fires; args are
+    as for to_structured
+
+    Float columns share memory with the underlying NumPy arrays.
+    """
+    pa = _pyarrow()
+    columns = _columns(results, layers, num_layers)
+    arrays = [
+        pa.array(columns['fire_id']),
+        pa.array(columns['time']),
+        pa.array(columns['plume_bottom']),
+        pa.array(columns['plume_top']),
+        pa.array(columns['smolder_fraction'])
+    ]
+    names = list(COLUMNS)
+    if layers:
+        for k in ('heights', 'emission_fractions'):
+            values = columns[k]
+            arrays.append(pa.FixedSizeListArray.from_arrays(
+                pa.array(values.ravel()), values.shape[1]))
+            names.append(k)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+def write_parquet(filename, results, layers=False, num_layers=20,
+        row_group_size=100000):
+    """Writes plume rise of many fires to Parquet file, a row group at a
+    time, so that memory use doesn't depend on the number of fires
+
+    args
+     - filename
+     - results -- iterable of (fire_id, plume_rise) tuples, as passed to
+        to_structured; it's consumed lazily, e.g. as fires are computed
+    kwargs
+     - layers, num_layers -- as passed to to_structured
+     - row_group_size -- approximate number of rows (fire-hours) per row
+        group; each fire's hours are kept in the same group
+
+    Returns number of rows written
+    """
+    pq = _pyarrow('parquet')
+    writer = None
+    n_rows = 0
+    pending = []
+    pending_rows = 0
+
+    def flush():
+        nonlocal writer
+        batch = to_record_batch(pending, layers=layers,
+            num_layers=num_layers)
+        if writer is None:
+            writer = pq.ParquetWriter(filename, batch.schema)
+        writer.write_batch(batch, row_group_size=max(len(batch), 1))
+        del pending[:]
+
+    try:
+        for fire_id, plume_rise in results:
+            if not isinstance(plume_rise, PlumeRiseResult):
+                plume_rise = PlumeRiseResult.from_dict(plume_rise)
+            pending.append((fire_id, plume_rise))
+            n_rows += len(plume_rise)
+            pending_rows += len(plume_rise)
+            if pending_rows >= row_group_size:
+                flush()
+                pending_rows = 0
+        if pending or writer is None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+def read_parquet(filename, num_layers=20):
+    """Returns dict of PlumeRiseResult objects, keyed by fire id, read
+    from a Parquet file written by write_parquet
+    """
+    pq = _pyarrow('parquet')
+    table = pq.read_table(filename, columns=list(COLUMNS))
+    column = lambda k: table.column(k).to_numpy()
+    return _results(column('fire_id'), column('time'),
+        column('plume_bottom'), column('plume_top'),
+        column('smolder_fraction'), num_layers)
+
+
+## Helpers
+
+def _columns(results, layers, num_layers):
+    """Returns dict of concatenated per-hour arrays of all results"""
+    fire_ids = []
+    parts = []
+    for fire_id, plume_rise in results:
+        if not isinstance(plume_rise, PlumeRiseResult):
+            plume_rise = PlumeRiseResult.from_dict(plume_rise)
+        if layers and plume_rise.num_layers != num_layers:
+            raise ValueError("Results must have {} layers".format(num_layers))
+        fire_ids.append(np.full(len(plume_rise), fire_id))
+        parts.append(plume_rise)
+
+    columns = {
+        'fire_id': (np.concatenate(fire_ids) if fire_ids
+            else np.array([], dtype=str)),
+        'time': _concatenate([p.datetimes for p in parts], 'datetime64[s]'),
+        'plume_bottom': _concatenate([p.plume_bottom for p in parts], 'f8'),
+        'plume_top': _concatenate([p.plume_top for p in parts], 'f8'),
+        'smolder_fraction': _concatenate([p.smolder_fraction for p in parts],
+            'f8')
+    }
+    if layers:
+        columns['heights'] = _concatenate([p.heights for p in parts], 'f8'
+            ).reshape(-1, num_layers + 1)
+        columns['emission_fractions'] = _concatenate(
+            [p.emission_fractions for p in parts], 'f8').reshape(-1, num_layers)
+    return columns
+
+def _concatenate(arrays, dtype):
+    return np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+
+def _results(fire_ids, times, plume_bottom, plume_top, smolder_fraction,
+        num_layers):
+    timestamps = np.datetime_as_string(times.astype('datetime64[s]'),
+        unit='s')
+    fire_ids = np.asarray(fire_ids)
+    # rows of each fire are contiguous, as written, but needn't be
+    unique, inverse = np.unique(fire_ids, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    boundaries = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+    results = {}
+    for i, fire_id in enumerate(unique.tolist()):
+        rows = order[boundaries[i]:boundaries[i + 1]]
+        results[fire_id] = PlumeRiseResult(timestamps[rows],
+            plume_bottom[rows], plume_top[rows], smolder_fraction[rows],
+            num_layers=num_layers)
+    return results
+
+def _pyarrow(module=None):
+    try:
+        import pyarrow
+        if module == 'parquet':
+            import pyarrow.parquet
+            return pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required for Arrow and Parquet export;"
+            " install it with `pip install plumerise[arrow]`")
@@ -3,14 +3,25 @@
 
 __author__      = "Joel Dubowy"
 
+import asyncio
 import csv
+import io
 import logging
-import math
 import os
+import shutil
 import subprocess
 import tempfile
+import time
+import warnings
 
-from . import compute_plumerise_hour
+import numpy as np
+
+from . import __version__
+from .batch import run_many
+from .metrics import NULL_METRICS
+from .native import NativeEngine
+from .result import PlumeRiseResult, make_result
+from .workdir import NamedPipes
 
 
 class FEPSPlumeRise(object):
@@ -31,6 +42,71 @@ class FEPSPlumeRise(object):
     #             the plume bottom, in which case use the FEPS equation
     PLUME_TOP_BEHAVIOR = 'auto'
 
+    # Number of evenly spaced vertical layers between plume bottom and top
+    # among which emissions are distributed
+    NUM_LAYERS = 20
+
+    # Type of object returned by compute.  Choices are:
+    #     dict -- dict of per-hour dicts, keyed by timestamp
+    #     array -- plumerise.result.PlumeRiseResult
+    RESULT_TYPE = 'dict'
+
+    # How to compute plume rise.  Choices are:
+    #     binary -- run the feps_weather and feps_plumerise executables
+    #     native -- compute plume rise in process, with
+    #             plumerise.native.NativeEngine, a numpy reconstruction of
+    #             the binaries' calculations, fit to their output
+    #     a callable -- compute plume rise in process, with no subprocesses
+    #             or working files; it's called with the timeprofile,
+    #             consumption, and (default-filled) fire_location_info, and
+    #             must return one dict per hour, in timeprofile order, with
+    #             the feps_plumerise output columns 'heat', 'smold_frac',
+    #             'plume_bot', and 'plume_top'; its results are cached in
+    #             RESULT_CACHE only if it has a 'cache_key' attribute, a JSON
+    #             serializable value identifying what it computes (e.g. its
+    #             name, version, and parameters), or is the run_binaries
+    #             method of another FEPSPlumeRise
+    # Check native or a callable against the binaries with compare_engines
+    # before relying on it
+    ENGINE = 'binary'
+
+    # Seconds to allow each run of feps_weather or feps_plumerise before
+    # it's killed and subprocess.TimeoutExpired is raised; None for no limit
+    SUBPROCESS_TIMEOUT = None
+
+    # Optional time.monotonic() value by which all binary runs of a call
+    # must finish, e.g. as set per fire by plumerise.scheduler; each run is
+    # allowed the time left, or SUBPROCESS_TIMEOUT if that's smaller, and
+    # subprocess.TimeoutExpired is raised once the deadline has passed
+    DEADLINE = None
+
+    # Optional plumerise.cache.DiurnalCache, to reuse feps_weather output
+    # across fires with the same weather inputs; may be shared by multiple
+    # FEPSPlumeRise objects
+    DIURNAL_CACHE = None
+
+    # Optional plumerise.cache.ResultCache, to reuse results computed, in
+    # this or previous runs, from identical inputs and configuration
+    RESULT_CACHE = None
+
+    # Optional plumerise.workdir.WorkingDirManager, to manage placement,
+    # reuse, and cleanup of working dirs that aren't passed in to compute;
+    # if not specified, a new temp dir is created, and left, for each fire
+    WORKING_DIR_MANAGER = None
+
+    # Pass the timeprofile, consumption, and plume files to and from
+    # feps_plumerise through named pipes rather than regular files
+    USE_NAMED_PIPES = False
+
+    # Optional plumerise.metrics.Metrics, to record time spent in each
+    # phase of computation, subprocess resource usage, and I/O
+    METRICS = None
+
+    # Settings whose objects hold in-process state (locks, open files, and
+    # counts shared between threads), which compute_many can't pass to
+    # worker processes
+    PROCESS_LOCAL_SETTINGS = ('DIURNAL_CACHE', 'RESULT_CACHE',
+        'WORKING_DIR_MANAGER', 'METRICS')
 
     def __init__(self, **config):
         self._config = config
@@ -38,27 +114,383 @@ class FEPSPlumeRise(object):
     def config(self, key):
         return self._config.get(key.lower(), getattr(self, key))
 
+    def copy(self, **config):
+        """Returns object of the same class, with this one's config updated
+        with config, e.g. for a per-fire setting
+        """
+        return type(self)(**dict(self._config, **{k.lower(): v
+            for k, v in config.items()}))
+
+    def with_deadline(self, deadline):
+        """Returns copy with DEADLINE set to deadline"""
+        return self.copy(deadline=deadline)
+
+    @property
+    def _metrics(self):
+        return self.config("METRICS") or NULL_METRICS
+
     def compute(self, timeprofile, consumption, fire_location_info,
             working_dir=None):
-        working_dir = working_dir or tempfile.mkdtemp()
-        plume_file = self._get_plume_file(timeprofile, consumption,
+        with self._metrics.phase('compute'):
+            return self._compute_cached(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+    def _compute_cached(self, timeprofile, consumption, fire_location_info,
+            working_dir):
+        cache = self.config("RESULT_CACHE")
+        key = cache is not None and self._cache_key(cache, timeprofile,
+            consumption, fire_location_info) or None
+        if key is None:
+            return self._compute(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+        plume_rise = cache.get(key, timestamps=timeprofile.keys())
+        if plume_rise is None:
+            plume_rise = self._compute(timeprofile, consumption,
+                fire_location_info, working_dir)
+            cache.set(key, self._cacheable(plume_rise))
+        elif self.config("RESULT_TYPE") == 'array':
+            plume_rise = PlumeRiseResult.from_columns(plume_rise)
+        return plume_rise
+
+    def _cacheable(self, plume_rise):
+        if isinstance(plume_rise, PlumeRiseResult):
+            return plume_rise.to_columns()
+        return plume_rise
+
+    def _cache_key(self, cache, timeprofile, consumption, fire_location_info):
+        """Returns result cache key, or None if results of the configured
+        ENGINE can't be cached
+        """
+        engine = self._engine()
+        if callable(engine) and engine_cache_key(engine) is None:
+            logging.debug("ENGINE has no cache_key; not caching result")
+            return None
+        self._fill_fire_location_info(fire_location_info)
+        return cache.make_key(self._cache_key_data(timeprofile, consumption,
+            fire_location_info))
+
+    def _cache_key_data(self, timeprofile, consumption, fire_location_info):
+        engine = self._engine()
+        if callable(engine):
+            engine = engine_cache_key(engine)
+            binaries = None
+        else:
+            binaries = self._binary_versions()
+        return {
+            "model": "feps",
+            "version": __version__,
+            "timeprofile": timeprofile,
+            "consumption": consumption,
+            "fire_location_info": fire_location_info,
+            "plume_top_behavior": self.config("PLUME_TOP_BEHAVIOR").lower(),
+            "num_layers": int(self.config("NUM_LAYERS")),
+            "result_type": self.config("RESULT_TYPE"),
+            "engine": engine,
+            "binaries": binaries
+        }
+
+    def _binary_versions(self):
+        return [self._binary_version(self.config(k)) for k in
+            ("FEPS_WEATHER_BINARY", "FEPS_PLUMERISE_BINARY")]
+
+    def _binary_version(self, binary):
+        """Identifies binary by path, size, and modification time"""
+        path = shutil.which(binary)
+        if not path:
+            return [binary]
+        st = os.stat(path)
+        return [path, st.st_size, st.st_mtime]
+
+    def _engine(self):
+        """Returns ENGINE, with 'native' as a NativeEngine"""
+        engine = self.config("ENGINE")
+        if engine == 'native':
+            return NativeEngine()
+        return engine
+
+    def _compute(self, timeprofile, consumption, fire_location_info,
+            working_dir):
+        engine = self._engine()
+        if callable(engine):
+            self._fill_fire_location_info(fire_location_info)
+            with self._metrics.phase('engine'):
+                rows = engine(timeprofile, consumption, fire_location_info)
+            return self._build_plumerise(rows, sorted(timeprofile.keys()))
+
+        elif engine != 'binary':
+            raise Exception("Unknown value for ENGINE: %s" % (engine))
+
+        if working_dir:
+            return self._compute_in_dir(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+        manager = self.config("WORKING_DIR_MANAGER")
+        if manager is None:
+            return self._compute_in_dir(timeprofile, consumption,
+                fire_location_info, tempfile.mkdtemp())
+
+        with manager.acquire() as working_dir:
+            return self._compute_in_dir(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+    def _compute_in_dir(self, timeprofile, consumption, fire_location_info,
+            working_dir):
+        sorted_timestamps = sorted(timeprofile.keys())
+        if not self.config("USE_NAMED_PIPES"):
+            plume_file = self._get_plume_file(timeprofile, consumption,
+                fire_location_info, working_dir)
+            return self._read_plumerise(plume_file, sorted_timestamps)
+
+        pipes = NamedPipes()
+        try:
+            plume = pipes.read(os.path.join(working_dir, "plume.txt"))
+            self._get_plume_file(timeprofile, consumption,
+                fire_location_info, working_dir, pipes=pipes)
+        finally:
+            pipes.close()
+        plume = ''.join(plume)
+        self._metrics.add('bytes_read', len(plume))
+        with self._metrics.phase('read_plumerise'):
+            return self._build_plumerise_columns(
+                self._parse_plume_file(io.StringIO(plume)), sorted_timestamps)
+
+    def run_binaries(self, timeprofile, consumption, fire_location_info,
+            working_dir=None):
+        """Runs feps_weather and feps_plumerise, and returns
+        feps_plumerise's per-hour output rows, as dicts, as is
+
+        Rows are in the form returned by a callable ENGINE, so that this
+        may be used as the ENGINE of another FEPSPlumeRise, e.g. as the
+        exact fallback of a plumerise.surrogate.SurrogateEngine.
+        """
+        self._fill_fire_location_info(fire_location_info)
+
+        def run(working_dir):
+            plume_file = self._get_plume_file(timeprofile, consumption,
+                fire_location_info, working_dir)
+            with open(plume_file, 'r') as f:
+                return list(csv.DictReader(f, skipinitialspace=True))
+
+        manager = self.config("WORKING_DIR_MANAGER")
+        if working_dir or manager is None:
+            return run(working_dir or tempfile.mkdtemp())
+        with manager.acquire() as working_dir:
+            return run(working_dir)
+
+    def compute_many(self, fires, max_workers=None, ordered=True,
+            use_processes=False):
+        """Computes plume rise for many fires concurrently
+
+        Generator yielding (index, plume_rise, error) per fire, where error
+        is the exception raised for that fire, if any (in which case
+        plume_rise is None).  One fire failing or timing out (see
+        SUBPROCESS_TIMEOUT) doesn't abort the others.
+
+        args
+         - fires -- iterable of dicts, each with 'timeprofile',
+            'consumption', and 'fire_location_info', and optionally
+            'working_dir' (which must be unique per fire)
+        kwargs
+         - max_workers -- max number of fires computed at once; defaults
+            to the number of CPUs
+         - ordered -- yield results in input order, rather than as they
+            complete
+         - use_processes -- use a process pool rather than a thread pool;
+            threads suffice for the binary engine, which spends its time
+            waiting on subprocesses.  Each worker process would get its
+            own copy of this object's configuration, so it can't be used
+            with the in-process state of PROCESS_LOCAL_SETTINGS, and
+            ValueError is raised if any of them are set
+        """
+        if use_processes:
+            in_process = [k for k in self.PROCESS_LOCAL_SETTINGS
+                if self.config(k) is not None]
+            if in_process:
+                raise ValueError("use_processes can't be used with {}; "
+                    "use threads instead".format(', '.join(in_process)))
+        for index, plume_rise, error in run_many(self._compute_fire, fires,
+                max_workers=max_workers, ordered=ordered,
+                use_processes=use_processes):
+            if error:
+                logging.error("Failed to compute plume rise for fire %d: %s",
+                    index, error)
+            yield index, plume_rise, error
+
+    def _compute_fire(self, fire):
+        return self.compute(fire['timeprofile'], fire['consumption'],
+            fire['fire_location_info'], working_dir=fire.get('working_dir'))
+
+    async def compute_async(self, timeprofile, consumption,
+            fire_location_info, working_dir=None):
+        """asyncio counterpart of compute
+
+        feps_weather and feps_plumerise are run with
+        asyncio.create_subprocess_exec, and file and cache I/O is done in
+        the event loop's default executor, so that the event loop is never
+        blocked.  Cancelling the call kills any running binary.  Callable
+        engines and named pipes, which don't involve waiting on
+        subprocesses, are run in the executor as is.
+        """
+        with self._metrics.phase('compute'):
+            return await self._compute_cached_async(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+    async def _compute_cached_async(self, timeprofile, consumption,
+            fire_location_info, working_dir):
+        loop = asyncio.get_running_loop()
+        cache = self.config("RESULT_CACHE")
+        key = cache is not None and self._cache_key(cache, timeprofile,
+            consumption, fire_location_info) or None
+        if key is not None:
+            plume_rise = await loop.run_in_executor(None, cache.get, key,
+                timeprofile.keys())
+            if plume_rise is not None:
+                if self.config("RESULT_TYPE") == 'array':
+                    plume_rise = PlumeRiseResult.from_columns(plume_rise)
+                return plume_rise
+
+        plume_rise = await self._compute_async(timeprofile, consumption,
             fire_location_info, working_dir)
 
-        return self._read_plumerise(plume_file, sorted(timeprofile.keys()))
+        if key is not None:
+            await loop.run_in_executor(None, cache.set, key,
+                self._cacheable(plume_rise))
+        return plume_rise
 
+    async def compute_many_async(self, fires, max_concurrency=100,
+            timeout=None):
+        """Computes plume rise for many fires, with at most max_concurrency
+        in flight at once
+
+        Returns list of (index, plume_rise, error) per fire, in input order,
+        where error is the exception raised for that fire, if any,
+        including asyncio.TimeoutError if the fire took longer than timeout
+        seconds.  Cancelling the call cancels all fires.
+
+        args
+         - fires -- iterable of dicts, as passed to compute_many
+        kwargs
+         - max_concurrency -- max number of fires computed at once
+         - timeout -- seconds to allow each fire, once started
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _compute(index, fire):
+            async with semaphore:
+                try:
+                    plume_rise = await asyncio.wait_for(self.compute_async(
+                        fire['timeprofile'], fire['consumption'],
+                        fire['fire_location_info'],
+                        working_dir=fire.get('working_dir')), timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error("Failed to compute plume rise for fire "
+                        "%d: %s", index, e)
+                    return index, None, e
+                return index, plume_rise, None
+
+        return list(await asyncio.gather(*[_compute(i, f)
+            for i, f in enumerate(fires)]))
+
+    async def _compute_async(self, timeprofile, consumption,
+            fire_location_info, working_dir):
+        engine = self._engine()
+        if callable(engine) or self.config("USE_NAMED_PIPES"):
+            return await asyncio.get_running_loop().run_in_executor(None,
+                self._compute, timeprofile, consumption, fire_location_info,
+                working_dir)
+
+        elif engine != 'binary':
+            raise Exception("Unknown value for ENGINE: %s" % (engine))
+
+        if working_dir:
+            return await self._compute_in_dir_async(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+        manager = self.config("WORKING_DIR_MANAGER")
+        if manager is None:
+            return await self._compute_in_dir_async(timeprofile, consumption,
+                fire_location_info, tempfile.mkdtemp())
+
+        with manager.acquire() as working_dir:
+            return await self._compute_in_dir_async(timeprofile, consumption,
+                fire_location_info, working_dir)
+
+    async def _compute_in_dir_async(self, timeprofile, consumption,
+            fire_location_info, working_dir):
+        loop = asyncio.get_running_loop()
+
+        weather_args, weather, diurnal_file = await loop.run_in_executor(
+            None, self._prepare_weather_run, fire_location_info, working_dir)
+        if weather_args:
+            await self._run_binary_async(weather_args, 'feps_weather')
+            await loop.run_in_executor(None, self._cache_diurnal, weather,
+                diurnal_file)
+
+        plumerise_args, plume_file = await loop.run_in_executor(None,
+            self._prepare_plumerise_run, timeprofile, consumption,
+            fire_location_info, working_dir, diurnal_file)
+        await self._run_binary_async(plumerise_args, 'feps_plumerise')
+
+        return await loop.run_in_executor(None, self._read_plumerise,
+            plume_file, sorted(timeprofile.keys()))
+
+    async def _run_binary_async(self, args, phase):
+        timeout = self._subprocess_timeout(args)
+        with self._metrics.child_process(phase):
+            process = await asyncio.create_subprocess_exec(*args,
+                stdout=asyncio.subprocess.PIPE)
+            try:
+                output, _ = await asyncio.wait_for(process.communicate(),
+                    timeout)
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(args, timeout)
+            finally:
+                # timed out or cancelled
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, args,
+                output=output)
+        return output
 
     def _get_plume_file(self, timeprofile, consumption, fire_location_info,
-            working_dir):
+            working_dir, pipes=None):
+        diurnal_file = self._get_diurnal_file(fire_location_info,
+            working_dir)
+
+        plumerise_args, plume_file = self._prepare_plumerise_run(timeprofile,
+            consumption, fire_location_info, working_dir, diurnal_file,
+            pipes=pipes)
+        # TODO: log output?
+        self._run_binary(plumerise_args, 'feps_plumerise')
+
+        return plume_file
+
+    def _prepare_plumerise_run(self, timeprofile, consumption,
+            fire_location_info, working_dir, diurnal_file, pipes=None):
         timeprofile_file = os.path.join(working_dir, "profile.txt")
         consumption_file = os.path.join(working_dir, "cons.txt")
         plume_file = os.path.join(working_dir, "plume.txt")
 
-        diurnal_file = self._get_diurnal_file(fire_location_info,
-            working_dir)
-
         # TODO: This is rather hackish... is there a better way?
-        self._write_profile(timeprofile, timeprofile_file)
-        self._write_consumption(consumption, fire_location_info, consumption_file)
+        with self._metrics.phase('write_inputs'):
+            profile = self._profile_file_contents(timeprofile)
+            cons = self._consumption_file_contents(consumption,
+                fire_location_info)
+            if pipes:
+                pipes.write(timeprofile_file, profile)
+                pipes.write(consumption_file, cons)
+            else:
+                for filename, contents in ((timeprofile_file, profile),
+                        (consumption_file, cons)):
+                    with open(filename, 'w') as f:
+                        f.write(contents)
+        self._metrics.add('bytes_written', len(profile) + len(cons))
 
         plumerise_args = [
             self.config("FEPS_PLUMERISE_BINARY"),
@@ -68,40 +500,94 @@ class FEPSPlumeRise(object):
             "-a", str(fire_location_info["area"]),
             "-o", plume_file
         ]
-        # TODO: log output?
-        subprocess.check_output(plumerise_args)
-
-        return plume_file
+        return plumerise_args, plume_file
 
     def _get_diurnal_file(self, fire_location_info, working_dir):
+        weather_args, weather, diurnal_file = self._prepare_weather_run(
+            fire_location_info, working_dir)
+        if weather_args:
+            # TODO: log output?
+            self._run_binary(weather_args, 'feps_weather')
+            self._cache_diurnal(weather, diurnal_file)
+
+        return diurnal_file
+
+    def _prepare_weather_run(self, fire_location_info, working_dir):
+        """Writes feps_weather's input file and returns its args, unless
+        its output is cached, in which case that's written and args are None
+        """
         self._fill_fire_location_info(fire_location_info)
 
         weather_file = os.path.join(working_dir, "weather.txt")
         diurnal_file = os.path.join(working_dir, "diurnal.txt")
 
-        f = open(weather_file, 'w')
-        f.write("sunsetTime=%d\n" % fire_location_info['sunset_hour'])  # Time of sun set
-        f.write("middayTime=%d\n" % fire_location_info['max_temp_hour'])  # Time of max temp
-        f.write("predawnTime=%d\n" % fire_location_info['min_temp_hour'])   # Time of min temp
-        f.write("minHumid=%f\n" % fire_location_info['min_humid'])  # Min humid
-        f.write("maxHumid=%f\n" % fire_location_info['max_humid'])  # Max humid
-        f.write("minTemp=%f\n" % fire_location_info['min_temp'])  # Min temp
-        f.write("maxTemp=%f\n" % fire_location_info['max_temp'])  # Max temp
-        f.write("minWindAtFlame=%f\n" % fire_location_info['min_wind']) # Min wind at flame height
-        f.write("maxWindAtFlame=%f\n" % fire_location_info['max_wind']) # Max wind at flame height
-        f.write("minWindAloft=%f\n" % fire_location_info['min_wind_aloft']) # Min transport wind aloft
-        f.write("maxWindAloft=%f\n" % fire_location_info['max_wind_aloft']) # Max transport wind aloft
-        f.close()
+        weather = self._weather_file_contents(fire_location_info)
+
+        cache = self.config("DIURNAL_CACHE")
+        if cache is not None:
+            diurnal = cache.get(weather)
+            if diurnal is not None:
+                with self._metrics.phase('write_inputs'):
+                    with open(diurnal_file, 'w') as f:
+                        f.write(diurnal)
+                self._metrics.add('bytes_written', len(diurnal))
+                return None, weather, diurnal_file
+
+        with self._metrics.phase('write_inputs'):
+            with open(weather_file, 'w') as f:
+                f.write(weather)
+        self._metrics.add('bytes_written', len(weather))
 
         weather_args = [
             self.config("FEPS_WEATHER_BINARY"),
             "-w", weather_file,
             "-o", diurnal_file
         ]
-        # TODO: log output?
-        subprocess.check_output(weather_args)
-
-        return diurnal_file
+        return weather_args, weather, diurnal_file
+
+    def _cache_diurnal(self, weather, diurnal_file):
+        cache = self.config("DIURNAL_CACHE")
+        if cache is not None:
+            with open(diurnal_file, 'r') as f:
+                diurnal = f.read()
+            self._metrics.add('bytes_read', len(diurnal))
+            cache.set(weather, diurnal)
+
+    def _weather_file_contents(self, fire_location_info):
+        return "".join([
+            "sunsetTime=%d\n" % fire_location_info['sunset_hour'],  # Time of sun set
+            "middayTime=%d\n" % fire_location_info['max_temp_hour'],  # Time of max temp
+            "predawnTime=%d\n" % fire_location_info['min_temp_hour'],   # Time of min temp
+            "minHumid=%f\n" % fire_location_info['min_humid'],  # Min humid
+            "maxHumid=%f\n" % fire_location_info['max_humid'],  # Max humid
+            "minTemp=%f\n" % fire_location_info['min_temp'],  # Min temp
+            "maxTemp=%f\n" % fire_location_info['max_temp'],  # Max temp
+            "minWindAtFlame=%f\n" % fire_location_info['min_wind'], # Min wind at flame height
+            "maxWindAtFlame=%f\n" % fire_location_info['max_wind'], # Max wind at flame height
+            "minWindAloft=%f\n" % fire_location_info['min_wind_aloft'], # Min transport wind aloft
+            "maxWindAloft=%f\n" % fire_location_info['max_wind_aloft'] # Max transport wind aloft
+        ])
+
+    def _run_binary(self, args, phase):
+        timeout = self._subprocess_timeout(args)
+        with self._metrics.child_process(phase):
+            if timeout is None:
+                return subprocess.check_output(args)
+            return subprocess.check_output(args, timeout=timeout)
+
+    def _subprocess_timeout(self, args):
+        """Returns seconds to allow binary run, given SUBPROCESS_TIMEOUT
+        and DEADLINE, or raises subprocess.TimeoutExpired if the deadline
+        has passed
+        """
+        timeout = self.config("SUBPROCESS_TIMEOUT")
+        deadline = self.config("DEADLINE")
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(args, 0)
+        return remaining if timeout is None else min(timeout, remaining)
 
     FIRE_LOCATION_INFO_DEFAULTS = {
         "min_wind": 6,
@@ -127,65 +613,152 @@ class FEPSPlumeRise(object):
             if fire_location_info.get(k) is None:
                 fire_location_info[k] = v
 
-    def _write_consumption(self, consumption, fire_location_info, filename):
+    def _consumption_file_contents(self, consumption, fire_location_info):
         area = fire_location_info['area']
-        f = open(filename, 'w')
-        f.write("cons_flm=%f\n" % (consumption["flaming"] / area))
-        f.write("cons_sts=%f\n" % (consumption["smoldering"] / area))
-        f.write("cons_lts=%f\n" % (consumption["residual"] / area))
-        # TODO: what to do if duff consumption isn't defined? is 0.0 appropriate?
-        f.write("cons_duff=%f\n" % (consumption.get("duff", 0.0) / area))
-        f.write("moist_duff=%f\n" % fire_location_info['moisture_duff'])
-        f.close()
-
-    def _write_profile(self, timeprofile, timeprofile_file):
-        with open(timeprofile_file, 'w') as f:
-            f.write("hour, area_fract, flame, smolder, residual\n")
-            hour = 0
-            for dt in sorted(timeprofile.keys()):
-                f.write("%d, %f, %f, %f, %f\n" % (
-                    # TODO: should hour written to file reflect actual
-                    #  number of hours since first time (which would be
-                    #  different than 'hour' if timestep isn't one hour) ?
-                    hour,
-                    timeprofile[dt]["area_fraction"],
-                    timeprofile[dt]["flaming"],
-                    timeprofile[dt]["smoldering"],
-                    timeprofile[dt]["residual"]))
-                hour += 1
+        return "".join([
+            "cons_flm=%f\n" % (consumption["flaming"] / area),
+            "cons_sts=%f\n" % (consumption["smoldering"] / area),
+            "cons_lts=%f\n" % (consumption["residual"] / area),
+            # TODO: what to do if duff consumption isn't defined? is 0.0 appropriate?
+            "cons_duff=%f\n" % (consumption.get("duff", 0.0) / area),
+            "moist_duff=%f\n" % fire_location_info['moisture_duff']
+        ])
+
+    def _profile_file_contents(self, timeprofile):
+        lines = ["hour, area_fract, flame, smolder, residual\n"]
+        hour = 0
+        for dt in sorted(timeprofile.keys()):
+            lines.append("%d, %f, %f, %f, %f\n" % (
+                # TODO: should hour written to file reflect actual
+                #  number of hours since first time (which would be
+                #  different than 'hour' if timestep isn't one hour) ?
+                hour,
+                timeprofile[dt]["area_fraction"],
+                timeprofile[dt]["flaming"],
+                timeprofile[dt]["smoldering"],
+                timeprofile[dt]["residual"]))
+            hour += 1
+        return "".join(lines)
 
     def _read_plumerise(self, plume_file, sorted_timestamps):
+        with self._metrics.phase('read_plumerise'):
+            self._metrics.add('bytes_read', os.path.getsize(plume_file))
+            with open(plume_file, 'r') as f:
+                return self._build_plumerise_columns(
+                    self._parse_plume_file(f), sorted_timestamps)
+
+    # feps_plumerise output columns used
+    PLUME_COLUMNS = ('heat', 'smold_frac', 'plume_bot', 'plume_top')
+
+    def _parse_plume_file(self, f):
+        """Returns dict of PLUME_COLUMNS arrays read from open plume file"""
+        header = [k.strip() for k in f.readline().split(',')]
+        with warnings.catch_warnings():
+            # empty file
+            warnings.simplefilter('ignore', UserWarning)
+            data = np.loadtxt(f, delimiter=',', ndmin=2)
+        if data.size == 0:
+            # no rows, and possibly no header either
+            return {k: np.empty(0) for k in self.PLUME_COLUMNS}
+        return {k: data[:, header.index(k)] for k in self.PLUME_COLUMNS}
+
+    def _build_plumerise(self, rows, sorted_timestamps):
+        """Builds plume rise from per-hour rows, e.g. from a callable ENGINE"""
+        rows = list(rows)
+        return self._build_plumerise_columns({k: np.array(
+            [float(row[k]) for row in rows], dtype=float)
+            for k in self.PLUME_COLUMNS}, sorted_timestamps)
+
+    def _build_plumerise_columns(self, columns, sorted_timestamps):
         behavior = self.config("PLUME_TOP_BEHAVIOR").lower()
-        plume_rise = {
-            "hours": {}
-        }
+        if behavior not in ("briggs", "feps", "auto"):
+            raise Exception("Unknown value for PLUME_TOP_BEHAVIOR: %s", behavior)
+
+        no_heat = columns["heat"] == 0
+        plume_bottoms = np.where(no_heat, 0.0, columns["plume_bot"])
+        plume_tops = np.where(no_heat, 0.0, columns["plume_top"])
+
+        if behavior == "feps":
+            plume_tops = plume_bottoms * 2
+        elif behavior == "auto":
+            adjust = plume_tops < plume_bottoms
+            if adjust.any():
+                logging.debug("Adjusting plume_top for hours %s from Briggs "
+                    "to FEPS equation value", np.flatnonzero(adjust).tolist())
+                plume_tops = np.where(adjust, plume_bottoms * 2, plume_tops)
+
+        n = len(plume_tops)
+        if n > len(sorted_timestamps):
+            raise IndexError("More plume rise hours than timestamps")
+        timestamps = sorted_timestamps[:n]
+
+        self._metrics.add('hours', n)
+        if self.config("RESULT_TYPE") == 'array':
+            return make_result('array', timestamps, plume_bottoms, plume_tops,
+                columns["smold_frac"],
+                num_layers=int(self.config("NUM_LAYERS")))
+        return make_result(self.config("RESULT_TYPE"), timestamps,
+            plume_bottoms.tolist(), plume_tops.tolist(),
+            columns["smold_frac"].tolist(),
+            num_layers=int(self.config("NUM_LAYERS")))
+
+
+def engine_cache_key(engine):
+    """Returns JSON serializable identity of a callable FEPS ENGINE, for
+    result cache keys, or None if it has none (see ENGINE)
+    """
+    if getattr(engine, '__func__', None) is FEPSPlumeRise.run_binaries:
+        # results depend only on the binaries it runs
+        return ['run_binaries', engine.__self__._binary_versions()]
+    return getattr(engine, 'cache_key', None)
 
-        hour = 0
-        with open(plume_file, 'r') as f:
-            for row in csv.DictReader(f, skipinitialspace=True):
-                heat = float(row["heat"])
-
-                smoldering_fraction = float(row["smold_frac"])
-                plume_bottom_meters = float(row["plume_bot"])
-                plume_top_meters = float(row["plume_top"])
-
-                if heat == 0:
-                    plume_top_meters = 0.0
-                    plume_bottom_meters = 0.0
-
-                if behavior == "briggs":
-                    pass
-                elif behavior == "feps":
-                    plume_top_meters = plume_bottom_meters * 2
-                elif behavior == "auto":
-                    if plume_top_meters < plume_bottom_meters:
-                        logging.debug("Adjusting plume_top for hour %d from Briggs to FEPS equation value", hour)
-                        plume_top_meters = plume_bottom_meters * 2
-                else:
-                    raise Exception("Unknown value for PLUME_TOP_BEHAVIOR: %s", behavior)
-
-                dt = sorted_timestamps[hour]
-                plume_rise['hours'][dt] = compute_plumerise_hour(smoldering_fraction, plume_top_meters, plume_bottom_meters)
-                hour += 1
 
-        return plume_rise
+def compare_engines(engine, reference, fires):
+    """Compares output of a callable ENGINE with that of a reference one,
+    e.g. FEPSPlumeRise().run_binaries, over a set of fires
+
+    args
+     - engine, reference -- callable ENGINEs
+     - fires -- iterable of dicts, each with 'timeprofile', 'consumption',
+        and 'fire_location_info'
+
+    Returns dict with number of fires and, per output column, max and
+    mean absolute error and RMSE over all hours
+    """
+    errors = []
+    n_fires = 0
+    for fire in fires:
+        n_fires += 1
+        fire_location_info = dict(fire['fire_location_info'])
+        FEPSPlumeRise()._fill_fire_location_info(fire_location_info)
+        args = (fire['timeprofile'], fire['consumption'], fire_location_info)
+        expected = list(reference(*args))
+        actual = list(engine(*args))
+        if len(actual) != len(expected):
+            raise ValueError("Engines returned {} and {} hours for fire "
+                "{}".format(len(actual), len(expected), n_fires - 1))
+        errors.extend([[float(a[c]) - float(e[c])
+            for c in FEPSPlumeRise.PLUME_COLUMNS]
+            for a, e in zip(actual, expected)])
+    return {
+        'n_fires': n_fires,
+        'columns': error_stats(errors, FEPSPlumeRise.PLUME_COLUMNS)
+    }
+
+def error_stats(errors, columns):
+    """Returns dict of max and mean absolute error and RMSE per column of
+    errors, a list of per-hour lists of errors, or None per column if
+    there are none
+    """
+    errors = np.abs(np.array(errors, dtype=float).reshape(-1, len(columns)))
+    stats = {}
+    for i, c in enumerate(columns):
+        if len(errors):
+            stats[c] = {
+                'max_abs_error': float(errors[:, i].max()),
+                'mean_abs_error': float(errors[:, i].mean()),
+                'rmse': float(np.sqrt((errors[:, i] ** 2).mean()))
+            }
+        else:
+            stats[c] = None
+    return stats
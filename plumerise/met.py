@@ -0,0 +1,158 @@
+"""plumerise.met
+"""
+
+__author__      = "Joel Dubowy"
+
+import hashlib
+import warnings
+
+import numpy as np
+
+# Arrays held by LocalMet, and saved to and loaded from files
+FIELDS = ('times', 'height_abl', 'height', 'potential_temperature', 'valid')
+
+
+class LocalMet(object):
+    """Array-backed local met for one fire, for SEVPlumeRise.compute
+
+    An alternative to the dict of per-hour dicts of met variables, holding
+    just what SEV uses.
+
+    args
+     - times -- per-hour datetime64 values, or ISO 8601 strings, increasing;
+        strings, e.g. local met's keys, are kept, as given, to key results
+     - height_abl -- per-hour PBL height (m)
+     - height -- HGTS levels (m); shape (n_hours, n_levels), n_levels >= 2
+     - potential_temperature -- TPOT levels (Kelvin); same shape as height
+    kwargs
+     - valid -- per-hour booleans; hours that aren't valid, e.g. for lack
+        of data, are skipped, as they are with the dict form; defaults to
+        all valid
+    """
+
+    def __init__(self, times, height_abl, height, potential_temperature,
+            valid=None):
+        times = np.asarray(times)
+        self._timestamps = times.astype(str) if times.dtype.kind == 'U' else None
+        with warnings.catch_warnings():
+            # times with UTC offsets are converted to UTC
+            warnings.simplefilter('ignore', UserWarning)
+            self.times = times.astype('datetime64[s]')
+        self.height_abl = np.asarray(height_abl, dtype=float)
+        self.height = np.asarray(height, dtype=float)
+        self.potential_temperature = np.asarray(potential_temperature,
+            dtype=float)
+        self.valid = (np.ones(len(self.times), dtype=bool) if valid is None
+            else np.asarray(valid, dtype=bool))
+
+        n = len(self.times)
+        if (self.height_abl.shape != (n,) or self.valid.shape != (n,)
+                or self.height.ndim != 2 or self.height.shape[0] != n
+                or self.height.shape[1] < 2
+                or self.potential_temperature.shape != self.height.shape):
+            raise ValueError("Inconsistent LocalMet array shapes")
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def timestamps(self):
+        """Per-hour timestamps, in the form used as keys of plume rise:
+        times as given, if given as strings, else ISO 8601
+        """
+        if self._timestamps is not None:
+            return self._timestamps
+        return np.datetime_as_string(self.times, unit='s')
+
+    @property
+    def digest(self):
+        """Identifies the met's content, e.g. for result cache keys"""
+        h = hashlib.sha256()
+        for k in FIELDS:
+            h.update(np.ascontiguousarray(getattr(self, k)).tobytes())
+        if self._timestamps is not None:
+            h.update('\n'.join(self._timestamps.tolist()).encode())
+        return h.hexdigest()
+
+    ## Conversion
+
+    @classmethod
+    def from_dict(cls, local_met, num_levels=2):
+        """Returns LocalMet from the dict form passed to
+        SEVPlumeRise.compute
+
+        Only the lowest num_levels levels are kept; SEV uses two.  Hours
+        missing HGTS, RELH, or TPOT are not valid.
+        """
+        timestamps = sorted(local_met.keys())
+        n = len(timestamps)
+        height_abl = np.full(n, np.nan)
+        height = np.full((n, num_levels), np.nan)
+        potential_temperature = np.full((n, num_levels), np.nan)
+        valid = np.zeros(n, dtype=bool)
+        for i, dt in enumerate(timestamps):
+            met_loc = local_met[dt]
+            pbl = met_loc.get('HPBL') if met_loc.get('PBLH') is None else met_loc.get('PBLH')
+            if pbl is not None:
+                height_abl[i] = pbl
+            hgts = (met_loc.get('HGTS') or [])[:num_levels]
+            tpot = (met_loc.get('TPOT') or [])[:num_levels]
+            height[i, :len(hgts)] = hgts
+            potential_temperature[i, :len(tpot)] = tpot
+            valid[i] = bool(hgts and tpot and met_loc.get('RELH'))
+        return cls(timestamps, height_abl, height, potential_temperature,
+            valid=valid)
+
+    ## Files
+
+    def save(self, filename):
+        """Saves to .npz file"""
+        arrays = {k: getattr(self, k) for k in FIELDS}
+        if self._timestamps is not None:
+            arrays['timestamps'] = self._timestamps
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads from .npz file written by save"""
+        with np.load(filename, allow_pickle=False) as f:
+            arrays = {k: f[k] for k in FIELDS}
+            if 'timestamps' in f:
+                arrays['times'] = f['timestamps']
+        return cls(**arrays)
+
+    def save_hdf5(self, filename, group='/'):
+        """Saves to HDF5 file; requires h5py"""
+        h5py = _h5py()
+        with h5py.File(filename, 'a') as f:
+            g = f.require_group(group)
+            for k in FIELDS + ('timestamps',):
+                if k in g:
+                    del g[k]
+            for k in FIELDS:
+                values = getattr(self, k)
+                # HDF5 has no datetime type
+                g[k] = values.astype('int64') if k == 'times' else values
+            if self._timestamps is not None:
+                g['timestamps'] = np.char.encode(self._timestamps, 'utf-8')
+
+    @classmethod
+    def load_hdf5(cls, filename, group='/'):
+        """Loads from HDF5 file written by save_hdf5; requires h5py"""
+        h5py = _h5py()
+        with h5py.File(filename, 'r') as f:
+            g = f[group]
+            arrays = {k: g[k][()] for k in FIELDS}
+            timestamps = g['timestamps'][()] if 'timestamps' in g else None
+        arrays['times'] = (arrays['times'].astype('datetime64[s]')
+            if timestamps is None else np.char.decode(timestamps, 'utf-8'))
+        return cls(**arrays)
+
+
+def _h5py():
+    try:
+        import h5py
+        return h5py
+    except ImportError:
+        raise ImportError("h5py is required for HDF5 met files; install it"
+            " with `pip install plumerise[hdf5]`")
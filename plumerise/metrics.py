@@ -0,0 +1,124 @@
+"""plumerise.metrics
+"""
+
+__author__      = "Joel Dubowy"
+
+import collections
+import contextlib
+import resource
+import threading
+import time
+
+
+class Metrics(object):
+    """Collects per-phase timing and resource usage of plume rise runs
+
+    Pass an instance to SEVPlumeRise or FEPSPlumeRise via the METRICS
+    setting.  One instance may be shared by many runs, including
+    concurrent ones, to aggregate over a batch, and instances may be
+    combined with merge.
+
+    Recorded, per phase:
+     - count -- number of times the phase ran
+     - wall_time -- seconds
+    and, as totals:
+     - child_user_time, child_system_time -- CPU seconds used by
+        subprocesses (feps_weather and feps_plumerise)
+     - child_max_rss -- peak resident set size, in kilobytes on Linux, of
+        the largest subprocess
+     - bytes_written, bytes_read -- sizes of files written and read
+     - hours -- number of hours of plume rise computed
+
+    Child process usage is taken from resource.getrusage(RUSAGE_CHILDREN),
+    which covers the whole process, so it's only exact when subprocesses
+    aren't run concurrently from multiple threads.
+
+    kwargs
+     - callback -- called with (phase, wall_time) each time a phase
+        completes, e.g. to forward to an external monitoring system
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.phases = collections.defaultdict(lambda: {'count': 0, 'wall_time': 0.0})
+        self.totals = collections.defaultdict(float)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager timing the enclosed code as phase name"""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t
+            with self._lock:
+                self.phases[name]['count'] += 1
+                self.phases[name]['wall_time'] += elapsed
+            if self.callback:
+                self.callback(name, elapsed)
+
+    @contextlib.contextmanager
+    def child_process(self, name):
+        """Like phase, but also records CPU time and memory use of
+        subprocesses run within
+        """
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            with self.phase(name):
+                yield
+        finally:
+            # recorded even if the subprocess failed or timed out, since
+            # its resources were used all the same
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            with self._lock:
+                self.totals['child_user_time'] += (after.ru_utime
+                    - before.ru_utime)
+                self.totals['child_system_time'] += (after.ru_stime
+                    - before.ru_stime)
+                self.totals['child_max_rss'] = max(
+                    self.totals['child_max_rss'], after.ru_maxrss)
+
+    def add(self, key, value):
+        with self._lock:
+            self.totals[key] += value
+
+    def merge(self, other):
+        """Adds other's metrics into this one's"""
+        with other._lock:
+            phases = {k: dict(v) for k, v in other.phases.items()}
+            totals = dict(other.totals)
+        with self._lock:
+            for k, v in phases.items():
+                self.phases[k]['count'] += v['count']
+                self.phases[k]['wall_time'] += v['wall_time']
+            for k, v in totals.items():
+                if k == 'child_max_rss':
+                    self.totals[k] = max(self.totals[k], v)
+                else:
+                    self.totals[k] += v
+        return self
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'phases': {k: dict(v) for k, v in self.phases.items()},
+                'totals': dict(self.totals)
+            }
+
+
+class NullMetrics(object):
+    """No-op stand-in for Metrics, used when metrics aren't enabled"""
+
+    _context = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+    def child_process(self, name):
+        return self._context
+
+    def add(self, key, value):
+        pass
+
+NULL_METRICS = NullMetrics()
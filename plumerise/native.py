@@ -0,0 +1,183 @@
+"""plumerise.native
+"""
+
+__author__      = "Joel Dubowy"
+
+import numpy as np
+
+from . import __version__
+
+# feps_weather output columns, per hour of the day
+DIURNAL_COLUMNS = ('temp', 'humid', 'wind_flame', 'modified_wind',
+    'stability', 'dif_temp_grad')
+
+# Stability class and potential temperature gradient (K/m) feps_weather
+# assigns to daytime hours (after predawn, through sunset) and to night
+MIXED_STABILITY = ('B', -0.008)
+STABLE_STABILITY = ('F', 0.025)
+
+MPH_TO_MPS = 0.447
+
+
+class NativeEngine(object):
+    """In-process FEPS kernel, for use as FEPSPlumeRise's ENGINE
+
+    Computes feps_weather's diurnal weather and feps_plumerise's per-hour
+    heat, smoldering fraction, and plume bottom and top with numpy, with no
+    subprocesses or working files.  FEPS's source isn't distributed with
+    plumerise, so this is a reconstruction from the binaries' output:
+
+     - diurnal temperature rises as a quarter sine from min_temp at
+       min_temp_hour to max_temp at max_temp_hour, continuing until
+       sunset, and then decays exponentially toward min_temp; humidity
+       and wind at flame height vary inversely and directly with it.
+       This matches feps_weather output to its printed precision, except
+       for modified_wind at midnight, which feps_weather sometimes raises
+       above the MIN_TRANSPORT_WIND floor by an amount its inputs don't
+       explain.
+     - the hour's heat is that of its consumption, less the smoldering
+       fraction left near the ground; plume bottom scales with the cube
+       root of total heat per unit wind at flame height, and plume top
+       with that of heat times absolute temperature per unit transport
+       wind and potential temperature gradient, as in Briggs' rise in
+       stable air
+
+    The constants below are fit to recorded feps_plumerise output.  Check
+    the engine against the binaries with compare_engines on fires
+    representative of yours before relying on it.
+    """
+
+    # Hours over which temperature decays toward min_temp after sunset
+    NIGHT_TEMP_DECAY = 3.0
+
+    # Minimum transport wind (m/s); wind aloft inputs are in mph
+    MIN_TRANSPORT_WIND = 5.0
+
+    # Heat released per ton of fuel consumed, in feps_plumerise's units
+    HEAT_PER_TON = 1.0928e9
+
+    # Fraction of emissions left near the ground in the first hour, when
+    # the fire is flaming, and the least in any hour
+    MIN_SMOLDER_FRACTION = 0.05
+
+    # Fraction of emissions of the hour's smoldering and residual
+    # consumption, after the first hour, left near the ground
+    SMOLDER_WEIGHT = 0.7
+
+    # Coefficients of plume bottom and top (see class docstring)
+    PLUME_BOTTOM_COEF = 0.085897
+    PLUME_TOP_COEF = 0.118212
+
+    def __init__(self, **config):
+        self._config = config
+
+    def config(self, key):
+        return self._config.get(key.lower(), getattr(self, key))
+
+    @property
+    def cache_key(self):
+        """Identifies what the engine computes, for FEPS result caching"""
+        return ['native', __version__, {k.lower(): self.config(k) for k in (
+            'NIGHT_TEMP_DECAY', 'MIN_TRANSPORT_WIND', 'HEAT_PER_TON',
+            'MIN_SMOLDER_FRACTION', 'SMOLDER_WEIGHT', 'PLUME_BOTTOM_COEF',
+            'PLUME_TOP_COEF')}]
+
+    def __call__(self, timeprofile, consumption, fire_location_info):
+        """Returns feps_plumerise output rows, one dict per hour, in
+        timeprofile order
+
+        args
+         - timeprofile, consumption -- as passed to FEPSPlumeRise.compute
+         - fire_location_info -- as passed to FEPSPlumeRise.compute, with
+            defaults filled in
+        """
+        diurnal = self.diurnal(fire_location_info)
+        columns = self.plumerise(timeprofile, consumption, diurnal)
+        return [dict(hour=h, **{k: float(v[h]) for k, v in columns.items()})
+            for h in range(len(timeprofile))]
+
+    def diurnal(self, fire_location_info):
+        """Returns dict of DIURNAL_COLUMNS arrays for hours 0 through 23,
+        as computed by feps_weather
+        """
+        info = fire_location_info
+        predawn = info['min_temp_hour']
+        midday = info['max_temp_hour']
+        sunset = info['sunset_hour']
+        if not predawn < midday <= sunset:
+            raise ValueError("Hours of min temp, max temp, and sunset must "
+                "be in that order: {}, {}, {}".format(predawn, midday, sunset))
+        min_temp = float(info['min_temp'])
+        temp_range = float(info['max_temp']) - min_temp
+
+        hours = np.arange(24)
+        day = (hours >= predawn) & (hours <= sunset)
+        sunset_temp = min_temp + temp_range * np.sin(
+            np.pi / 2 * (sunset - predawn) / (midday - predawn))
+        temp = np.where(day,
+            min_temp + temp_range * np.sin(
+                np.pi / 2 * (hours - predawn) / (midday - predawn)),
+            min_temp + (sunset_temp - min_temp) * np.exp(
+                -((hours - sunset) % 24) / self.config("NIGHT_TEMP_DECAY")))
+
+        # fraction of the way from the coolest to the warmest part of the day
+        warmth = (temp - min_temp) / temp_range if temp_range else np.zeros(24)
+        humid = info['max_humid'] - (info['max_humid']
+            - info['min_humid']) * warmth
+        wind_flame = info['min_wind'] + (info['max_wind']
+            - info['min_wind']) * warmth
+        wind_aloft = info['min_wind_aloft'] + (info['max_wind_aloft']
+            - info['min_wind_aloft']) * warmth
+        modified_wind = np.maximum(wind_aloft * MPH_TO_MPS,
+            self.config("MIN_TRANSPORT_WIND"))
+
+        # feps_weather's stable hours include predawn itself
+        mixed = day & (hours > predawn)
+        return {
+            'temp': temp,
+            'humid': humid,
+            'wind_flame': wind_flame,
+            'modified_wind': modified_wind,
+            'stability': np.where(mixed, MIXED_STABILITY[0],
+                STABLE_STABILITY[0]),
+            'dif_temp_grad': np.where(mixed, MIXED_STABILITY[1],
+                STABLE_STABILITY[1])
+        }
+
+    def plumerise(self, timeprofile, consumption, diurnal):
+        """Returns dict of feps_plumerise output column arrays, one value
+        per hour of timeprofile, in timestamp order, given diurnal weather
+        """
+        profile = np.array([[timeprofile[dt][k] for k in
+            ('flaming', 'smoldering', 'residual')]
+            for dt in sorted(timeprofile.keys())], dtype=float).reshape(-1, 3)
+        n = len(profile)
+        # duff burns as residual, after the flaming and smoldering stages
+        tons = profile.dot([consumption["flaming"], consumption["smoldering"],
+            consumption["residual"] + consumption.get("duff", 0.0)])
+
+        # hour n of the run uses the diurnal weather of hour n % 24
+        weather = {k: np.resize(v, n) for k, v in diurnal.items()}
+
+        min_smolder = self.config("MIN_SMOLDER_FRACTION")
+        phases = profile.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            smoldering = np.where(phases > 0,
+                profile[:, 1:].sum(axis=1) / phases, 0.0)
+        smold_frac = min_smolder + (1 - min_smolder) * self.config(
+            "SMOLDER_WEIGHT") * smoldering
+        smold_frac[:1] = min_smolder
+
+        total_heat = tons * self.config("HEAT_PER_TON")
+        heat = total_heat * (1 - smold_frac)
+        plume_bot = self.config("PLUME_BOTTOM_COEF") * np.cbrt(
+            total_heat / weather['wind_flame'])
+        plume_top = self.config("PLUME_TOP_COEF") * np.cbrt(
+            heat * (weather['temp'] + 273.15) / (weather['modified_wind']
+            * np.abs(weather['dif_temp_grad'])))
+        return {
+            'heat': heat,
+            'smold_frac': smold_frac,
+            'plume_bot': plume_bot,
+            'plume_top': plume_top
+        }
@@ -0,0 +1,211 @@
+"""plumerise.parallel
+"""
+
+__author__      = "Joel Dubowy"
+
+import concurrent.futures
+import logging
+import math
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .sev import SEVPlumeRise
+
+# Rows of the shared (n_rows, n_fires, n_hours) float64 block: inputs,
+# which workers read, then outputs, which they write
+INPUT_ROWS = ('height_abl', 'theta_0', 'theta_1', 'height_0', 'height_1',
+    'frp')
+OUTPUT_ROWS = ('plume_top_meters', 'plume_bottom_meters')
+
+
+class ParallelSEV(object):
+    """Computes SEV plume rise for batches of fires across processes
+
+    Batch met arrays are copied once into shared memory, along with the
+    output buffers; each worker process computes a slice of fires in
+    place, so nothing is pickled per fire, just the block's name, shape,
+    and slice bounds per task.  Workers are started once and reused
+    across batches.
+
+    args
+     - plume_rise -- SEVPlumeRise object, whose model parameters are used;
+        defaults to SEVPlumeRise()
+    kwargs
+     - processes -- number of worker processes; defaults to the number of
+        CPUs
+     - tasks_per_process -- number of slices each batch is split into, per
+        process, to balance load
+     - mp_context -- multiprocessing context; defaults to forkserver, where
+        available, since forking a multi-threaded process is unsafe
+    """
+
+    def __init__(self, plume_rise=None, processes=None, tasks_per_process=4,
+            mp_context=None):
+        self.plume_rise = plume_rise or SEVPlumeRise()
+        self.processes = processes or os.cpu_count() or 1
+        self.tasks_per_process = tasks_per_process
+        if mp_context is None and ('forkserver'
+                in multiprocessing.get_all_start_methods()):
+            mp_context = multiprocessing.get_context('forkserver')
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.processes, mp_context=mp_context)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, e_type, value, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def compute_batch(self, height_abl, potential_temperature, height,
+            frp=None, smolder_fraction=0.0, fire_area=None):
+        """Computes plume rise as SEVPlumeRise.compute_batch does, which
+        see for args and return value
+        """
+        height_abl = np.asarray(height_abl, dtype=float)
+        potential_temperature = np.asarray(potential_temperature, dtype=float)
+        height = np.asarray(height, dtype=float)
+        frp = _frp(frp, fire_area)
+
+        def fill(block):
+            block[0] = height_abl
+            block[1] = potential_temperature[..., 0]
+            block[2] = potential_temperature[..., 1]
+            block[3] = height[..., 0]
+            block[4] = height[..., 1]
+            block[5] = frp
+        return self._compute(height_abl.shape, fill, smolder_fraction)
+
+    def compute_local_mets(self, local_mets, fire_area=None, frp=None,
+            smolder_fraction=0.0):
+        """Computes plume rise for many fires' plumerise.met.LocalMet
+        objects, which must all cover the same hours
+
+        Met is copied straight from each LocalMet into shared memory.
+        Hours that aren't valid are NaN in the output.
+
+        args
+         - local_mets -- sequence of LocalMet objects
+        kwargs
+         - fire_area, frp, smolder_fraction -- as for compute_batch, except
+            that 1-D sequences are per fire, not per hour
+
+        Returns dict as compute_batch does, plus 'timestamps'.
+        """
+        local_mets = list(local_mets)
+        if not local_mets:
+            raise ValueError("No LocalMet objects to compute")
+        times = local_mets[0].times
+        for m in local_mets[1:]:
+            if not np.array_equal(m.times, times):
+                raise ValueError("LocalMet objects must cover the same hours")
+        shape = (len(local_mets), len(times))
+        frp = _per_fire(_frp(frp, fire_area), shape)
+        smolder_fraction = _per_fire(smolder_fraction, shape)
+
+        def fill(block):
+            for i, m in enumerate(local_mets):
+                block[0, i] = m.height_abl
+                block[1, i] = m.potential_temperature[:, 0]
+                block[2, i] = m.potential_temperature[:, 1]
+                block[3, i] = m.height[:, 0]
+                block[4, i] = m.height[:, 1]
+            block[5] = frp
+        result = self._compute(shape, fill, smolder_fraction)
+
+        invalid = ~np.array([m.valid for m in local_mets])
+        for k in OUTPUT_ROWS:
+            result[k][invalid] = np.nan
+        result['timestamps'] = local_mets[0].timestamps
+        return result
+
+    def _compute(self, shape, fill, smolder_fraction):
+        """Allocates shared block for batch of given (n_fires, n_hours)
+        shape, fills inputs by calling fill with it, and computes outputs
+        across workers
+        """
+        n_rows = len(INPUT_ROWS) + len(OUTPUT_ROWS)
+        block_shape = (n_rows,) + tuple(shape)
+        size = max(1, int(np.prod(block_shape)) * 8)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            block = np.ndarray(block_shape, dtype=float, buffer=shm.buf)
+            metrics = self.plume_rise._metrics
+            with metrics.phase('fill_shared'):
+                fill(block)
+
+            parameters = {k.lower(): float(self.plume_rise.config(k))
+                for k in SEVPlumeRise.MODEL_PARAMETERS}
+            n_tasks = min(shape[0], self.processes * self.tasks_per_process)
+            step = int(math.ceil(float(shape[0]) / max(n_tasks, 1)))
+            with metrics.phase('compute_parallel'):
+                futures = [self._executor.submit(_compute_slice, shm.name,
+                    block_shape, parameters, i, min(i + step, shape[0]))
+                    for i in range(0, shape[0], step or 1)]
+                logging.debug("Computing %d fires in %d tasks", shape[0],
+                    len(futures))
+                for f in futures:
+                    f.result()
+            metrics.add('hours', int(np.prod(shape)))
+
+            result = {k: block[len(INPUT_ROWS) + i].copy()
+                for i, k in enumerate(OUTPUT_ROWS)}
+            del block
+        finally:
+            shm.close()
+            shm.unlink()
+
+        result['smolder_fraction'] = np.broadcast_to(
+            np.asarray(smolder_fraction, dtype=float), shape)
+        return result
+
+
+def _frp(frp, fire_area):
+    """Returns FRP as compute_batch determines it"""
+    if frp is None:
+        if fire_area is None:
+            raise ValueError("Specify either frp or fire_area")
+        return 4180.8 * np.asarray(fire_area, dtype=float)
+    return np.maximum(np.asarray(frp, dtype=float), 0.0)
+
+def _per_fire(a, shape):
+    """Returns a, with 1-D per-fire values shaped to broadcast across
+    hours of (n_fires, n_hours) shape
+    """
+    a = np.asarray(a, dtype=float)
+    if a.ndim == 1:
+        if len(a) != shape[0]:
+            raise ValueError("Expected {} per-fire values".format(shape[0]))
+        a = a.reshape(-1, 1)
+    return a
+
+def _attach(name):
+    try:
+        # the creating process owns, and unlinks, the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+def _compute_slice(name, block_shape, parameters, start, stop):
+    """Worker task: computes fires start through stop - 1 of the shared
+    block, in place
+    """
+    shm = _attach(name)
+    try:
+        block = np.ndarray(block_shape, dtype=float, buffer=shm.buf)
+        inputs = block[:len(INPUT_ROWS), start:stop]
+        plume_rise = SEVPlumeRise(**parameters)
+        top = plume_rise._smoke_height_array(inputs[0], inputs[5],
+            inputs[1], inputs[2], inputs[3], inputs[4])
+        block[len(INPUT_ROWS), start:stop] = top
+        block[len(INPUT_ROWS) + 1, start:stop] = (top
+            * parameters['plume_bottom_over_top'])
+        del block, inputs
+    finally:
+        shm.close()
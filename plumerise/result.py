@@ -0,0 +1,144 @@
+"""plumerise.result
+"""
+
+__author__      = "Joel Dubowy"
+
+import numpy as np
+
+from . import compute_plumerise_hour
+
+
+class PlumeRiseResult(object):
+    """Array-backed plume rise for one fire
+
+    Holds just the per-hour plume bottom, plume top, and smolder fraction,
+    as NumPy arrays, rather than a dict of per-hour dicts.  Layer heights
+    and emission fractions are derived from them on access.  A bottom or
+    top of NaN means the hour has no plume.
+    """
+
+    def __init__(self, timestamps, plume_bottom, plume_top,
+            smolder_fraction, num_layers=20):
+        self.timestamps = np.asarray(timestamps)
+        self.plume_bottom = np.asarray(plume_bottom, dtype=float)
+        self.plume_top = np.asarray(plume_top, dtype=float)
+        self.smolder_fraction = np.asarray(smolder_fraction, dtype=float)
+        self.num_layers = num_layers
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def datetimes(self):
+        """timestamps as datetime64[s], in UTC if they have a zone"""
+        return _datetime64(self.timestamps)
+
+    @property
+    def heights(self):
+        """(n_hours, num_layers + 1) array of layer boundaries, evenly
+        spaced between plume bottom and top
+        """
+        # computed the same way as in compute_plumerise_hour, so that
+        # values are identical
+        spacing = (self.plume_top - self.plume_bottom) / self.num_layers
+        return (self.plume_bottom[:, np.newaxis]
+            + np.arange(self.num_layers + 1) * spacing[:, np.newaxis])
+
+    @property
+    def emission_fractions(self):
+        """(n_hours, num_layers) array of fraction of emissions per layer"""
+        return np.full((len(self), self.num_layers), 1.0 / self.num_layers)
+
+    def to_dict(self):
+        """Returns plume rise in the dict form returned by default"""
+        hours = {}
+        for dt, sf, top, bottom in zip(self.timestamps.tolist(),
+                self.smolder_fraction.tolist(), self.plume_top.tolist(),
+                self.plume_bottom.tolist()):
+            if np.isnan(top) or np.isnan(bottom):
+                top = bottom = None
+            hours[dt] = compute_plumerise_hour(sf, top, bottom,
+                num_layers=self.num_layers)
+        return {'hours': hours}
+
+    def to_columns(self):
+        """Returns JSON serializable dict of per-hour lists"""
+        return {
+            'timestamps': self.timestamps.tolist(),
+            'plume_bottom': self.plume_bottom.tolist(),
+            'plume_top': self.plume_top.tolist(),
+            'smolder_fraction': self.smolder_fraction.tolist(),
+            'num_layers': self.num_layers
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(columns['timestamps'], columns['plume_bottom'],
+            columns['plume_top'], columns['smolder_fraction'],
+            num_layers=columns.get('num_layers', 20))
+
+    @classmethod
+    def from_dict(cls, plume_rise):
+        timestamps = sorted(plume_rise['hours'].keys())
+        hours = [plume_rise['hours'][dt] for dt in timestamps]
+        num_layers = next((len(h['heights']) - 1 for h in hours
+            if 'heights' in h), 20)
+        return cls(timestamps,
+            [h['heights'][0] if 'heights' in h else np.nan for h in hours],
+            [h['heights'][-1] if 'heights' in h else np.nan for h in hours],
+            [h['smolder_fraction'] for h in hours], num_layers=num_layers)
+
+
+def _datetime64(timestamps):
+    """Returns timestamps as datetime64[s]
+
+    np.datetime64 only warns about, and will stop accepting, a zone
+    designator (e.g. 'Z' or '-09:00') on an ISO 8601 string, so strings
+    with one are converted to UTC here
+    """
+    if timestamps.dtype.kind != 'U' or not len(timestamps):
+        return timestamps.astype('datetime64[s]')
+    utc = np.char.endswith(timestamps, 'Z')
+    # past the date's dashes
+    offset_at = np.maximum(np.char.rfind(timestamps, '+'),
+        np.char.rfind(timestamps, '-'))
+    offset = offset_at > 10
+    if not utc.any() and not offset.any():
+        return timestamps.astype('datetime64[s]')
+
+    local = np.char.rstrip(timestamps, 'Z')
+    minutes = np.zeros(len(timestamps), dtype='timedelta64[m]')
+    for i in np.flatnonzero(offset):
+        t = str(timestamps[i])
+        designator = t[offset_at[i] + 1:].replace(':', '')
+        sign = -1 if t[offset_at[i]] == '-' else 1
+        minutes[i] = sign * (int(designator[:2]) * 60
+            + int(designator[2:] or 0))
+        local[i] = t[:offset_at[i]]
+    return local.astype('datetime64[s]') - minutes
+
+
+def make_result(result_type, timestamps, plume_bottom, plume_top,
+        smolder_fraction, num_layers=20):
+    """Returns plume rise as either dict or PlumeRiseResult
+
+    args
+     - result_type -- 'dict' or 'array'
+     - timestamps, plume_bottom, plume_top, smolder_fraction -- per-hour
+        sequences
+    kwargs
+     - num_layers -- number of vertical layers between bottom and top
+    """
+    if result_type == 'array':
+        return PlumeRiseResult(timestamps, plume_bottom, plume_top,
+            smolder_fraction, num_layers=num_layers)
+
+    elif result_type == 'dict':
+        return {
+            'hours': {dt: compute_plumerise_hour(sf, top, bottom,
+                    num_layers=num_layers)
+                for dt, bottom, top, sf in zip(timestamps, plume_bottom,
+                    plume_top, smolder_fraction)}
+        }
+
+    raise Exception("Unknown value for RESULT_TYPE: %s" % (result_type))
@@ -0,0 +1,160 @@
+"""plumerise.scheduler
+"""
+
+__author__      = "Joel Dubowy"
+
+import collections
+import concurrent.futures
+import logging
+import math
+import os
+import subprocess
+import threading
+import time
+
+
+def fire_size(fire):
+    """Default priority: larger fires first"""
+    return fire['fire_location_info'].get('area') or 0.0
+
+
+class DeadlineScheduler(object):
+    """Computes a batch of fires within a wall clock budget, running FEPS
+    for as many fires as time allows and SEV for the rest
+
+    Fires are run in priority order.  Before each fire is started, the
+    time to run it with FEPS, and the rest with SEV, is projected from
+    per-fire costs observed so far; once that would pass the deadline,
+    the fire and all remaining ones are run with SEV.  Each fire's FEPS
+    binary runs share a deadline (see FEPSPlumeRise's DEADLINE) that
+    leaves time, at the end of the budget, to run SEV instead if they
+    time out.  Callable FEPS engines aren't interrupted, and so may overrun
+    the budget.
+
+    args
+     - feps -- FEPSPlumeRise object
+     - sev -- SEVPlumeRise object
+     - budget -- seconds allowed for the batch
+    kwargs
+     - max_workers -- number of fires computed at once; defaults to the
+        number of CPUs
+     - priority -- callable returning a fire's priority; higher first
+     - feps_cost, sev_cost -- initial estimates of seconds per fire, used
+        until costs are observed
+     - margin -- seconds of the budget to hold in reserve
+    """
+
+    # weight of each new observation in the running cost estimates
+    COST_SMOOTHING = 0.3
+
+    # Seconds, at the least, held back from FEPS runs at the end of the
+    # budget for SEV runs of fires whose FEPS runs time out; twice the SEV
+    # cost estimate is held back if that's more
+    FALLBACK_RESERVE = 0.05
+
+    def __init__(self, feps, sev, budget, max_workers=None,
+            priority=fire_size, feps_cost=1.0, sev_cost=0.001, margin=0.0):
+        self.feps = feps
+        self.sev = sev
+        self.budget = budget
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.priority = priority
+        self.costs = {'feps': feps_cost, 'sev': sev_cost}
+        self.margin = margin
+        self.stats = {'feps': 0, 'sev': 0, 'feps_timeouts': 0,
+            'degraded_after': None}
+        # guards costs and feps_timeouts, which workers update
+        self._lock = threading.Lock()
+
+    def compute_many(self, fires):
+        """Computes plume rise for fires
+
+        Generator yielding (index, model, plume_rise, error) per fire, as
+        fires complete, where model is 'feps' or 'sev', whichever produced
+        plume_rise.  Each fire is a dict with the args of
+        FEPSPlumeRise.compute and SEVPlumeRise.compute; SEV's fire_area
+        defaults to fire_location_info's area.
+
+        The budget starts when iteration starts.
+        """
+        fires = list(fires)
+        start = time.monotonic()
+        deadline = start + self.budget - self.margin
+        queue = collections.deque(sorted(range(len(fires)),
+            key=lambda i: self.priority(fires[i]), reverse=True))
+        degraded = False
+
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            pending = {}
+            while queue or pending:
+                while queue and len(pending) < self.max_workers:
+                    i = queue.popleft()
+                    if not degraded and not self._feps_fits(deadline,
+                            len(queue)):
+                        degraded = True
+                        self.stats['degraded_after'] = time.monotonic() - start
+                        logging.info("Running remaining %d fires with SEV to "
+                            "meet deadline", len(queue) + 1)
+                    model = 'sev' if degraded else 'feps'
+                    pending[executor.submit(self._compute, fires[i], model,
+                        deadline)] = i
+
+                done, _ = concurrent.futures.wait(pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    model, plume_rise, error = future.result()
+                    self.stats[model] += 1
+                    yield i, model, plume_rise, error
+
+    def _feps_fits(self, deadline, n_after):
+        """Returns whether running the next fire with FEPS, and the n_after
+        after it with SEV, is projected to finish by the deadline
+        """
+        now = time.monotonic()
+        # the SEV fires can't start until workers free up
+        return (now + self.costs['feps']
+            + math.ceil(float(n_after) / self.max_workers) * self.costs['sev']
+            <= deadline)
+
+    def _compute(self, fire, model, deadline):
+        """Returns (model, plume_rise, error)"""
+        if model == 'feps':
+            t = time.monotonic()
+            feps_deadline = deadline - max(self.FALLBACK_RESERVE,
+                2 * self.costs['sev'])
+            if self.feps.config("DEADLINE") is not None:
+                feps_deadline = min(feps_deadline, self.feps.config("DEADLINE"))
+            try:
+                feps = self.feps.with_deadline(feps_deadline)
+                plume_rise = feps.compute(fire['timeprofile'],
+                    fire['consumption'], fire['fire_location_info'])
+                self._observe('feps', time.monotonic() - t)
+                return 'feps', plume_rise, None
+            except subprocess.TimeoutExpired:
+                # what it cost to find out FEPS doesn't fit, which is a
+                # lower bound of what it would have cost to run it
+                self._observe('feps', time.monotonic() - t)
+                with self._lock:
+                    self.stats['feps_timeouts'] += 1
+                logging.warning("FEPS timed out; running SEV")
+            except Exception as e:
+                logging.error("Failed to compute FEPS plume rise: %s", e)
+                return 'feps', None, e
+
+        t = time.monotonic()
+        try:
+            plume_rise = self.sev.compute(fire['local_met'],
+                fire.get('fire_area', fire['fire_location_info'].get('area')),
+                smolder_fraction=fire.get('smolder_fraction', 0.0),
+                frp=fire.get('frp'))
+        except Exception as e:
+            logging.error("Failed to compute SEV plume rise: %s", e)
+            return 'sev', None, e
+        self._observe('sev', time.monotonic() - t)
+        return 'sev', plume_rise, None
+
+    def _observe(self, model, seconds):
+        with self._lock:
+            self.costs[model] += self.COST_SMOOTHING * (
+                seconds - self.costs[model])
@@ -0,0 +1,313 @@
+"""plumerise.server
+"""
+
+__author__      = "Joel Dubowy"
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from .cli import compute_fire, parse_config
+from .feps import FEPSPlumeRise
+from .sev import SEVPlumeRise
+from .workdir import WorkingDirManager
+
+# Messages are JSON objects, each preceded by its length in bytes, as a
+# four byte, big endian, unsigned int.
+#
+# Requests:
+#     {"id": <any>, "op": "compute", "model": "sev"|"feps", "fire": {...}}
+#         where "fire" has the args of the model's compute method, as in
+#         input to the plumerise script
+#     {"id": <any>, "op": "health"}
+# Responses:
+#     {"id": <request id>, "plumerise": {...}}
+#     {"id": <request id>, "health": {...}}
+#     {"id": <request id>, "error": "<message>"}
+#
+# A client may send any number of requests without waiting for responses.
+# Compute responses are sent as they complete, and so may be out of order.
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def recv_message(sock_file):
+    """Returns next message read from socket file, or None if the
+    connection is closed
+    """
+    header = sock_file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    size, = HEADER.unpack(header)
+    data = sock_file.read(size)
+    if len(data) < size:
+        return None
+    return json.loads(data.decode())
+
+
+class PlumeRiseServer(socketserver.ThreadingMixIn,
+        socketserver.UnixStreamServer):
+    """Resident plume rise worker, serving requests over a Unix socket
+
+    Models are created once, and FEPS working dirs are reused across
+    requests.  Requests from all connections share a pool of max_workers
+    threads, so SEV, which is CPU bound, is best scaled by running more
+    servers, while FEPS, which mostly waits on its binaries, scales with
+    max_workers.
+
+    args
+     - socket_path -- path of the Unix socket to create
+    kwargs
+     - config -- model config, passed to both SEVPlumeRise and
+        FEPSPlumeRise
+     - max_workers -- number of requests computed concurrently; defaults
+        to the number of CPUs
+     - working_dir_root -- where to create FEPS working dirs
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config=None, max_workers=None,
+            working_dir_root=None):
+        config = dict(config or {})
+        self._working_dirs = None
+        if 'working_dir_manager' not in config:
+            self._working_dirs = WorkingDirManager(root=working_dir_root,
+                reuse=True)
+            config['working_dir_manager'] = self._working_dirs
+        self.models = {
+            'sev': SEVPlumeRise(**config),
+            'feps': FEPSPlumeRise(**config)
+        }
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_workers)
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+            _RequestHandler)
+
+    def health(self):
+        with self._lock:
+            return {
+                'status': 'ok',
+                'pid': os.getpid(),
+                'uptime': time.time() - self._started,
+                'max_workers': self.max_workers,
+                'queue_depth': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self._executor.shutdown(wait=True)
+        if self._working_dirs:
+            self._working_dirs.cleanup()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+    def submit(self, request, respond):
+        """Queues compute request; respond is called with the response"""
+        with self._lock:
+            self.queued += 1
+        self._executor.submit(self._compute, request, respond)
+
+    def _compute(self, request, respond):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        response = {'id': request.get('id')}
+        try:
+            model = self.models[request.get('model')]
+            response['plumerise'] = compute_fire(model, request['fire'])
+        except Exception as e:
+            logging.error("Failed to compute plume rise for request %s: %s",
+                request.get('id'), e)
+            response['error'] = (str(e) if not isinstance(e, KeyError)
+                else "Missing or invalid {}".format(e))
+        with self._lock:
+            self.active -= 1
+            if 'error' in response:
+                self.failed += 1
+            else:
+                self.completed += 1
+        respond(response)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        write_lock = threading.Lock()
+        def respond(response):
+            with write_lock:
+                try:
+                    send_message(self.request, response)
+                except OSError as e:
+                    logging.warning("Failed to send response %s: %s",
+                        response.get('id'), e)
+
+        while True:
+            try:
+                request = recv_message(self.rfile)
+            except ValueError as e:
+                respond({'id': None, 'error': "Invalid message: {}".format(e)})
+                return
+            if request is None:
+                return
+            op = request.get('op')
+            if op == 'compute':
+                self.server.submit(request, respond)
+            elif op == 'health':
+                respond({'id': request.get('id'),
+                    'health': self.server.health()})
+            else:
+                respond({'id': request.get('id'),
+                    'error': "Unknown op: {}".format(op)})
+
+
+class PlumeRiseClient(object):
+    """Client of PlumeRiseServer
+
+    Requests may be pipelined: submit returns a
+    concurrent.futures.Future without waiting for the response.  A client
+    may be shared by multiple threads.
+
+    args
+     - socket_path -- path of the server's Unix socket
+    kwargs
+     - timeout -- seconds to wait to connect
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+        self._sock.settimeout(None)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, e_type, value, tb):
+        self.close()
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._reader.join()
+
+    def submit(self, model, fire):
+        """Sends compute request, returning Future of its plume rise
+
+        args
+         - model -- 'sev' or 'feps'
+         - fire -- dict of args of the model's compute method
+        """
+        return self._request({'op': 'compute', 'model': model, 'fire': fire})
+
+    def compute(self, model, fire, timeout=None):
+        return self.submit(model, fire).result(timeout)
+
+    def health(self, timeout=None):
+        return self._request({'op': 'health'}).result(timeout)
+
+    def _request(self, request):
+        future = concurrent.futures.Future()
+        with self._lock:
+            request['id'] = next(self._ids)
+            self._pending[request['id']] = future
+            send_message(self._sock, request)
+        return future
+
+    def _read(self):
+        sock_file = self._sock.makefile('rb')
+        try:
+            while True:
+                try:
+                    response = recv_message(sock_file)
+                except (OSError, ValueError):
+                    response = None
+                if response is None:
+                    break
+                with self._lock:
+                    future = self._pending.pop(response.get('id'), None)
+                if future is None:
+                    logging.warning("Unexpected response: %s", response)
+                elif 'error' in response:
+                    future.set_exception(Exception(response['error']))
+                else:
+                    future.set_result(response.get('plumerise',
+                        response.get('health')))
+        finally:
+            sock_file.close()
+            # connection closed; fail anything still waiting
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(Exception("Connection closed"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='plumerise-worker',
+        description="Serves plume rise requests over a Unix socket")
+    parser.add_argument('-s', '--socket', required=True,
+        help="path of Unix socket to create")
+    parser.add_argument('-c', '--config', action='append', default=[],
+        metavar='KEY=VALUE', help="model config setting, with JSON value;"
+        " may be repeated")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+        help="number of requests to compute concurrently; default: number"
+        " of CPUs")
+    parser.add_argument('--working-dir-root',
+        help="where to create FEPS working dirs, e.g. /dev/shm")
+    parser.add_argument('--log-level', default='WARNING',
+        help="default: WARNING")
+    args = parser.parse_args(argv)
+    config = parse_config(parser, args.config)
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+        format='%(asctime)s %(levelname)s: %(message)s')
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+
+    server = PlumeRiseServer(args.socket, config=config,
+        max_workers=args.workers, working_dir_root=args.working_dir_root)
+    logging.info("Listening on %s", args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
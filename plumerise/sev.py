@@ -3,10 +3,17 @@
 
 __author__      = "Joel Dubowy"
 
+import hashlib
 import logging
 import math
 
-from . import compute_plumerise_hour
+import numpy as np
+
+from . import compute_plumerise_hour, __version__
+from .cache import ResultCache
+from .met import LocalMet
+from .metrics import NULL_METRICS
+from .result import PlumeRiseResult, make_result
 
 class SEVPlumeRise(object):
     """
@@ -25,27 +32,287 @@ class SEVPlumeRise(object):
     #REF_PRESSURE = 1000
     PLUME_BOTTOM_OVER_TOP = 0.5
 
+    # Number of evenly spaced vertical layers between plume bottom and top
+    # among which emissions are distributed
+    NUM_LAYERS = 20
+
+    # Type of object returned by compute.  Choices are:
+    #     dict -- dict of per-hour dicts, keyed by timestamp
+    #     array -- plumerise.result.PlumeRiseResult
+    RESULT_TYPE = 'dict'
+
+    # Optional plumerise.cache.ResultCache, to reuse results computed, in
+    # this or previous runs, from identical inputs and configuration.
+    # Results are keyed on just the met values SEV uses.  SEV is cheap
+    # enough that a lookup costs about as much as computing, so this is
+    # for sharing results, e.g. with FEPS's in the same cache, not speed
+    RESULT_CACHE = None
+
+    # Optional plumerise.metrics.Metrics, to record time spent computing
+    # and number of hours computed
+    METRICS = None
+
+    # Optional plumerise.cache.StabilityCache, to compute the stability
+    # terms of a met column's hours once, and reuse them for all fires in
+    # that column with the same hours of met; used only when compute,
+    # compute_incremental, or iter_compute (which looks up each hour on
+    # its own) is passed met_cell
+    STABILITY_CACHE = None
+
+    # Settings that affect results
+    MODEL_PARAMETERS = ('ALPHA', 'BETA', 'REF_POWER', 'GAMMA', 'DELTA',
+        'REF_N', 'GRAVITY', 'PLUME_BOTTOM_OVER_TOP')
+
     def __init__(self, **config):
         self._config = config
 
     def config(self, key):
         return self._config.get(key.lower(), getattr(self, key))
 
-    def compute(self, local_met, fire_area, smolder_fraction=0.0, frp=None):
+    @property
+    def _metrics(self):
+        return self.config("METRICS") or NULL_METRICS
+
+    def compute(self, local_met, fire_area, smolder_fraction=0.0, frp=None,
+            met_cell=None):
         """
         args
-         - local_met
+         - local_met -- dict of per-hour met dicts, keyed by timestamp, or
+            plumerise.met.LocalMet; the latter is computed vectorized, with
+            results matching to within floating point rounding
          - fire_area
         kwargs
          - smoldering_fraction -- smoldering fraction of consumption (?)
          - frp -- FRP value (in units of Watts)
+         - met_cell -- identifier of the met column local_met was taken
+            from, e.g. (i, j) grid indices; see STABILITY_CACHE; not used
+            with LocalMet
         """
+        with self._metrics.phase('compute'):
+            return self._compute_cached(local_met, fire_area,
+                smolder_fraction, frp, met_cell)
+
+    def _compute_cached(self, local_met, fire_area, smolder_fraction, frp,
+            met_cell=None):
+        cache = self.config("RESULT_CACHE")
+        if cache is None:
+            return self._compute(local_met, fire_area, smolder_fraction, frp,
+                met_cell)
+
+        key = cache.make_key({
+            "model": "sev",
+            "version": __version__,
+            "local_met": (local_met.digest if isinstance(local_met, LocalMet)
+                else _local_met_digest(local_met)),
+            "fire_area": fire_area,
+            "smolder_fraction": smolder_fraction,
+            "frp": frp,
+            "config": {k: float(self.config(k)) for k in self.MODEL_PARAMETERS},
+            "num_layers": int(self.config("NUM_LAYERS")),
+            "result": "columns"
+        })
+        # cached as per-hour columns, whatever the result type, since
+        # decoding every layer of dict results would cost more than
+        # computing them
+        columns = cache.get(key, timestamps=None
+            if isinstance(local_met, LocalMet) else local_met.keys())
+        if columns is None:
+            plume_rise = self._compute(local_met, fire_area,
+                smolder_fraction, frp, met_cell, result_type='array')
+            cache.set(key, plume_rise.to_columns())
+        else:
+            plume_rise = PlumeRiseResult.from_columns(columns)
+
+        result_type = self.config("RESULT_TYPE")
+        if result_type == 'dict':
+            return plume_rise.to_dict()
+        elif result_type == 'array':
+            return plume_rise
+        raise Exception("Unknown value for RESULT_TYPE: %s" % (result_type))
+
+    def _compute(self, local_met, fire_area, smolder_fraction, frp,
+            met_cell=None, result_type=None):
         logging.info("Running SEV Plume Rise model")
 
+        result_type = result_type or self.config("RESULT_TYPE")
+
         # TODO: test this to make sure it's working correctly
-        plume_rise = {}
-        plume_rise['hours'] = {}
+        timestamps = []
+        plume_tops = []
+        plume_bottoms = []
+
+        frp = self._resolve_frp(fire_area, frp)
+        if isinstance(local_met, LocalMet):
+            return self._compute_local_met(local_met, smolder_fraction, frp,
+                result_type)
+
+        # loop over ordered list of hourly met data
+        dts = sorted(local_met.keys())
+        stability_terms = self._stability_terms(met_cell,
+            [local_met[dt] for dt in dts]) or [None] * len(dts)
+        for dt, stability_term in zip(dts, stability_terms):
+            plume_heights = self._compute_hour(local_met[dt], frp,
+                stability_term)
+            if plume_heights:
+                timestamps.append(dt)
+                plume_tops.append(plume_heights[0])
+                plume_bottoms.append(plume_heights[1])
+
+        self._metrics.add('hours', len(timestamps))
+        return make_result(result_type, timestamps,
+            plume_bottoms, plume_tops, [smolder_fraction] * len(timestamps),
+            num_layers=int(self.config("NUM_LAYERS")))
+
+    def _compute_local_met(self, local_met, smolder_fraction, frp,
+            result_type):
+        valid = local_met.valid
+        plume_tops = self._smoke_height_array(local_met.height_abl[valid],
+            frp, local_met.potential_temperature[valid, 0],
+            local_met.potential_temperature[valid, 1],
+            local_met.height[valid, 0], local_met.height[valid, 1])
+        plume_bottoms = plume_tops * float(self.config("PLUME_BOTTOM_OVER_TOP"))
+        timestamps = local_met.timestamps[valid]
+
+        self._metrics.add('hours', len(timestamps))
+        if result_type == 'array':
+            return make_result('array', timestamps, plume_bottoms, plume_tops,
+                np.full(len(timestamps), float(smolder_fraction)),
+                num_layers=int(self.config("NUM_LAYERS")))
+        return make_result(result_type, timestamps.tolist(),
+            plume_bottoms.tolist(), plume_tops.tolist(),
+            [smolder_fraction] * len(timestamps),
+            num_layers=int(self.config("NUM_LAYERS")))
+
+    def compute_incremental(self, local_met, fire_area, previous=None,
+            previous_digests=None, smolder_fraction=0.0, frp=None,
+            met_cell=None):
+        """Version of compute that reuses hours of a previous result whose
+        met hasn't changed, e.g. when a forecast cycle appends new hours
+        and revises recent ones
+
+        If FRP, fire area, smolder fraction, or configuration differ from
+        those of the previous run, all hours are recomputed.  Hours no
+        longer in local_met are dropped.
+
+        args
+         - local_met
+         - fire_area
+        kwargs
+         - previous -- plume rise returned by a previous call
+         - previous_digests -- digests returned by that call
+         - smoldering_fraction -- smoldering fraction of consumption (?)
+         - frp -- FRP value (in units of Watts)
+         - met_cell -- identifier of the met column; see compute
 
+        Returns (plume_rise, digests) tuple, where digests, which are JSON
+        serializable, are to be passed to the next call, along with
+        plume_rise
+        """
+        logging.info("Running incremental SEV Plume Rise model")
+
+        with self._metrics.phase('compute'):
+            frp = self._resolve_frp(fire_area, frp)
+            result_type = self.config("RESULT_TYPE")
+            digests = {
+                "inputs": ResultCache.make_key({
+                    "version": __version__,
+                    "frp": frp,
+                    "smolder_fraction": smolder_fraction,
+                    "config": {k: float(self.config(k))
+                        for k in self.MODEL_PARAMETERS},
+                    "num_layers": int(self.config("NUM_LAYERS")),
+                    "result_type": result_type
+                }),
+                "hours": {dt: _met_values(met_loc)
+                    for dt, met_loc in local_met.items()}
+            }
+
+            # hours whose previous results, if any, can be reused
+            unchanged = set()
+            previous_hours = {}
+            if (previous is not None and previous_digests
+                    and previous_digests['inputs'] == digests['inputs']):
+                # tuple(), in case digests were saved as JSON, which turns
+                # tuples into lists
+                previous_hours_digests = previous_digests['hours']
+                unchanged = set(dt for dt, d in digests['hours'].items()
+                    if tuple(previous_hours_digests.get(dt) or ()) == d)
+                # hour dicts or, for array results, (top, bottom) tuples
+                if result_type == 'dict':
+                    previous_hours = previous['hours']
+                else:
+                    previous_hours = {dt: (top, bottom)
+                        for dt, top, bottom in zip(previous.timestamps.tolist(),
+                            previous.plume_top.tolist(),
+                            previous.plume_bottom.tolist())}
+
+            dts = sorted(local_met.keys())
+            to_compute = [dt for dt in dts if dt not in unchanged]
+            stability_terms = dict(zip(to_compute, self._stability_terms(
+                met_cell, [local_met[dt] for dt in to_compute]) or []))
+
+            timestamps = []
+            hours = []
+            n_computed = 0
+            for dt in dts:
+                if dt in unchanged:
+                    # absent from previous result if missing data
+                    if dt in previous_hours:
+                        timestamps.append(dt)
+                        hours.append(previous_hours[dt])
+                    continue
+                plume_heights = self._compute_hour(local_met[dt], frp,
+                    stability_terms.get(dt))
+                if plume_heights:
+                    n_computed += 1
+                    timestamps.append(dt)
+                    hours.append(compute_plumerise_hour(smolder_fraction,
+                        plume_heights[0], plume_heights[1],
+                        num_layers=int(self.config("NUM_LAYERS")))
+                        if result_type == 'dict' else plume_heights)
+
+            self._metrics.add('hours', n_computed)
+            self._metrics.add('hours_reused', len(timestamps) - n_computed)
+            if result_type == 'dict':
+                plume_rise = {'hours': dict(zip(timestamps, hours))}
+            else:
+                plume_rise = make_result(result_type, timestamps,
+                    [h[1] for h in hours], [h[0] for h in hours],
+                    [smolder_fraction] * len(timestamps),
+                    num_layers=int(self.config("NUM_LAYERS")))
+            return plume_rise, digests
+
+    def iter_compute(self, met_iter, fire_area, smolder_fraction=0.0,
+            frp=None, met_cell=None):
+        """Streaming version of compute
+
+        Generator yielding (dt, plume_rise_hour) for each hour of met with
+        the required data, as it's consumed from met_iter.  Only one hour
+        is held in memory at a time.
+
+        args
+         - met_iter -- iterable of (dt, met_loc) tuples, in time order,
+            where met_loc is what would be local_met[dt] in compute
+         - fire_area
+        kwargs
+         - smoldering_fraction -- smoldering fraction of consumption (?)
+         - frp -- FRP value (in units of Watts)
+         - met_cell -- identifier of the met column; see compute
+        """
+        logging.info("Running streaming SEV Plume Rise model")
+
+        frp = self._resolve_frp(fire_area, frp)
+        num_layers = int(self.config("NUM_LAYERS"))
+        for dt, met_loc in met_iter:
+            stability_terms = self._stability_terms(met_cell, [met_loc])
+            plume_heights = self._compute_hour(met_loc, frp,
+                stability_terms and stability_terms[0])
+            if plume_heights:
+                self._metrics.add('hours', 1)
+                yield dt, compute_plumerise_hour(smolder_fraction,
+                    plume_heights[0], plume_heights[1], num_layers=num_layers)
+
+    def _resolve_frp(self, fire_area, frp):
         if frp is None:
             # FRP approximated by averaging the max values here:
             # http://www.gmes-atmosphere.eu/d/services/gac/nrt/fire_radiative_power
@@ -56,38 +323,292 @@ class SEVPlumeRise(object):
             frp = 0.0
         else:
             logging.debug("Using passed in frp: %s", frp)
+        return frp
 
+    def _stability_terms(self, met_cell, met_locs):
+        """Returns list of the stability term of each of met_locs, hours
+        of the met column met_cell, looked up in, or added to,
+        STABILITY_CACHE; or None, if not caching
 
-        # loop over ordered list of hourly met data
-        for dt in sorted(local_met.keys()):
-            met_loc = local_met[dt]
-            if not met_loc.get('HGTS') or not met_loc.get('RELH') or not met_loc.get('TPOT'):
-                continue
-            hourly_data = {}
-            hourly_data['pressure'] = met_loc.get('pressure') # mb or hPa
-            hourly_data['height'] = met_loc.get('HGTS') # m
-            hourly_data['relative_humidity'] = met_loc.get('RELH') # %
-            hourly_data['potential_temperature'] = met_loc.get('TPOT') # Kelvin
-            hourly_data['wind_speed'] = met_loc.get('WSPD') # m/s
-            hourly_data['wind_direction'] = met_loc.get('WDIR') # degrees
-            hourly_data['temperature'] = met_loc.get('TEMP') # Celsius
-            hourly_data['press_vertical_v'] = met_loc.get('WWND') # mb/h
-            hourly_data['temp_at_2m'] = met_loc.get('TO2M') # Kelvin
-            hourly_data['rh_at_2m'] = met_loc.get('RH2M') # %
-            hourly_data['accum_precip_3hr'] = met_loc.get('TPP3') # m
-            hourly_data['accum_precip_6hr'] = met_loc.get('TPP6') # m
-            # The met file may spell this variable one of two ways
-            pbl = met_loc.get('HPBL') if met_loc.get('PBLH') is None else met_loc.get('PBLH')
-            hourly_data['height_abl'] = pbl                      # m
-            hourly_data['frp'] = frp   # Watts
-
-            plume_height = self.cal_smoke_height(hourly_data)
-            plume_top_meters = plume_height
-            plume_bottom_meters = plume_height * float(self.config("PLUME_BOTTOM_OVER_TOP"))
-
-            plume_rise['hours'][dt] = compute_plumerise_hour(smolder_fraction, plume_top_meters, plume_bottom_meters)
-
-        return plume_rise
+        The terms of all of the hours are computed together, and cached
+        under one key, so that fires sharing the column's met share them
+        at the cost of a single lookup.  An hour whose met doesn't yield a
+        term gets None, so that it's computed, or fails, as it would
+        without the cache.
+        """
+        cache = self.config("STABILITY_CACHE")
+        if met_cell is None or cache is None:
+            return None
+        # lowest two HGTS and TPOT levels, per hour
+        values = np.array([_met_values(m)[:4] for m in met_locs],
+            dtype=float).reshape(-1, 4)
+        gravity = float(self.config("GRAVITY"))
+        delta = float(self.config("DELTA"))
+        ref_n = float(self.config("REF_N"))
+        # includes the met the terms are computed from, so that revised
+        # met, e.g. from a new forecast cycle, isn't given stale terms
+        key = (met_cell, values.tobytes(), gravity, delta, ref_n)
+        terms = cache.get(key)
+        if terms is None:
+            height_0, height_1, theta_0, theta_1 = values.T
+            # same operations as calc_brunt_vaisala and
+            # calc_stability_term, in the same order, so that terms are
+            # identical; math.exp rather than np.exp, for the same reason
+            with np.errstate(all='ignore'):
+                nft = np.sqrt((gravity * 2) / (theta_0 + theta_1)
+                    * np.abs(theta_1 - theta_0) / (height_1 - height_0))
+                exponents = -1.0 * delta * ((nft * nft) / ref_n)
+            terms = [math.exp(e) if math.isfinite(e) else None
+                for e in exponents.tolist()]
+            cache.set(key, terms)
+        return terms
+
+    def _compute_hour(self, met_loc, frp, stability_term=None):
+        """Returns (plume_top_meters, plume_bottom_meters), or None if
+        met_loc is missing required data
+
+        stability_term, if specified, is used rather than computed
+        """
+        if not met_loc.get('HGTS') or not met_loc.get('RELH') or not met_loc.get('TPOT'):
+            return None
+        hourly_data = {}
+        hourly_data['pressure'] = met_loc.get('pressure') # mb or hPa
+        hourly_data['height'] = met_loc.get('HGTS') # m
+        hourly_data['relative_humidity'] = met_loc.get('RELH') # %
+        hourly_data['potential_temperature'] = met_loc.get('TPOT') # Kelvin
+        hourly_data['wind_speed'] = met_loc.get('WSPD') # m/s
+        hourly_data['wind_direction'] = met_loc.get('WDIR') # degrees
+        hourly_data['temperature'] = met_loc.get('TEMP') # Celsius
+        hourly_data['press_vertical_v'] = met_loc.get('WWND') # mb/h
+        hourly_data['temp_at_2m'] = met_loc.get('TO2M') # Kelvin
+        hourly_data['rh_at_2m'] = met_loc.get('RH2M') # %
+        hourly_data['accum_precip_3hr'] = met_loc.get('TPP3') # m
+        hourly_data['accum_precip_6hr'] = met_loc.get('TPP6') # m
+        # The met file may spell this variable one of two ways
+        pbl = met_loc.get('HPBL') if met_loc.get('PBLH') is None else met_loc.get('PBLH')
+        hourly_data['height_abl'] = pbl                      # m
+        hourly_data['frp'] = frp   # Watts
+
+        hourly_data['stability_term'] = stability_term
+
+        plume_height = self.cal_smoke_height(hourly_data)
+        plume_top_meters = plume_height
+        plume_bottom_meters = plume_height * float(self.config("PLUME_BOTTOM_OVER_TOP"))
+        return plume_top_meters, plume_bottom_meters
+
+    def compute_batch(self, height_abl, potential_temperature, height,
+            frp=None, smolder_fraction=0.0, fire_area=None):
+        """Vectorized version of compute, for many fires and hours at once
+
+        args
+         - height_abl -- PBL height (m); shape (n_fires, n_hours)
+         - potential_temperature -- TPOT levels (Kelvin); shape
+            (n_fires, n_hours, n_levels), n_levels >= 2; only the first
+            two levels are used
+         - height -- HGTS levels (m); same shape as potential_temperature
+        kwargs
+         - frp -- FRP values (in units of Watts); broadcastable to
+            (n_fires, n_hours), e.g. shape (n_fires, 1)
+         - smolder_fraction -- broadcastable to (n_fires, n_hours)
+         - fire_area -- used to approximate FRP, as in compute, if frp
+            isn't specified; broadcastable to (n_fires, n_hours)
+
+        Returns dict of 'plume_top_meters', 'plume_bottom_meters', and
+        'smolder_fraction' arrays, each of shape (n_fires, n_hours).
+        Results match compute's to within floating point rounding.
+        """
+        logging.info("Running vectorized SEV Plume Rise model")
+
+        height_abl = np.asarray(height_abl, dtype=float)
+        potential_temperature = np.asarray(potential_temperature, dtype=float)
+        height = np.asarray(height, dtype=float)
+
+        if frp is None:
+            if fire_area is None:
+                raise ValueError("Specify either frp or fire_area")
+            frp = 4180.8 * np.asarray(fire_area, dtype=float)
+        else:
+            frp = np.maximum(np.asarray(frp, dtype=float), 0.0)
+
+        with self._metrics.phase('compute_batch'):
+            plume_top_meters = self._smoke_height_array(height_abl, frp,
+                potential_temperature[..., 0], potential_temperature[..., 1],
+                height[..., 0], height[..., 1])
+        self._metrics.add('hours', plume_top_meters.size)
+        plume_bottom_meters = plume_top_meters * float(
+            self.config("PLUME_BOTTOM_OVER_TOP"))
+
+        return {
+            'plume_top_meters': plume_top_meters,
+            'plume_bottom_meters': plume_bottom_meters,
+            'smolder_fraction': np.broadcast_to(
+                np.asarray(smolder_fraction, dtype=float),
+                plume_top_meters.shape)
+        }
+
+    def compute_grid(self, height_abl, theta_0, theta_1, height_0,
+            height_1, frp, plume_top_out=None, plume_bottom_out=None,
+            max_chunk_bytes=256 * 1024 * 1024, dtype='float64'):
+        """Computes plume top and bottom over gridded met fields, e.g.
+        (time, y, x), in chunks, to bound memory use
+
+        Inputs and outputs may be .npy filenames, which are memory mapped,
+        so that fields larger than memory can be processed.
+
+        args
+         - height_abl -- PBL height (m) field
+         - theta_0, theta_1 -- lowest two TPOT levels (Kelvin), same shape
+            as height_abl
+         - height_0, height_1 -- lowest two HGTS levels (m), same shape
+         - frp -- FRP (in units of Watts); either scalar, same shape as
+            height_abl, or shaped like its trailing dimensions, e.g. (y, x)
+        kwargs
+         - plume_top_out, plume_bottom_out -- arrays or .npy filenames to
+            write output to; if not specified, arrays are allocated
+         - max_chunk_bytes -- approximate memory budget for each chunk
+         - dtype -- dtype of output files created
+
+        Returns (plume_top, plume_bottom) arrays (memory mapped, if
+        written to files)
+        """
+        logging.info("Running gridded SEV Plume Rise model")
+
+        inputs = [_load_array(a) for a in (height_abl, theta_0, theta_1,
+            height_0, height_1, frp)]
+        shape = inputs[0].shape
+        for a in inputs[1:5]:
+            if a.shape != shape:
+                raise ValueError("Met fields must all have shape {}".format(shape))
+
+        plume_top = _output_array(plume_top_out, shape, dtype)
+        plume_bottom = _output_array(plume_bottom_out, shape, dtype)
+        plume_bottom_over_top = float(self.config("PLUME_BOTTOM_OVER_TOP"))
+
+        # inputs, outputs, and temporaries, all as float64
+        bytes_per_element = 8 * 12
+        max_elements = max(1, max_chunk_bytes // bytes_per_element)
+        with self._metrics.phase('compute_grid'):
+            for chunk in _chunks(shape, max_elements):
+                (height_abl_c, theta_0_c, theta_1_c, height_0_c, height_1_c,
+                    frp_c) = [_chunk_of(a, chunk, len(shape)) for a in inputs]
+                top = self._smoke_height_array(height_abl_c,
+                    np.maximum(frp_c, 0.0), theta_0_c, theta_1_c,
+                    height_0_c, height_1_c)
+                plume_top[chunk] = top
+                plume_bottom[chunk] = top * plume_bottom_over_top
+        self._metrics.add('hours', plume_top.size)
+
+        for a in (plume_top, plume_bottom):
+            if isinstance(a, np.memmap):
+                a.flush()
+        return plume_top, plume_bottom
+
+    def compute_ensemble(self, parameters, height_abl,
+            potential_temperature, height, frp=None, fire_area=None,
+            max_chunk_bytes=256 * 1024 * 1024):
+        """Evaluates SEV for many sets of model parameters at once, e.g.
+        for calibration sweeps
+
+        args
+         - parameters -- dict mapping any of MODEL_PARAMETERS (e.g.
+            'ALPHA', or 'alpha') to sequences of n_sets values, such as
+            returned by parameter_grid; parameters not included take their
+            configured values
+         - height_abl, potential_temperature, height -- as passed to
+            compute_batch
+        kwargs
+         - frp, fire_area -- as passed to compute_batch
+         - max_chunk_bytes -- approximate memory budget for intermediate
+            arrays; parameter sets are evaluated in chunks within it
+
+        Returns dict of 'plume_top_meters' and 'plume_bottom_meters'
+        arrays, each of shape (n_sets,) + height_abl.shape
+        """
+        logging.info("Running SEV Plume Rise model parameter ensemble")
+
+        parameters = {k.upper(): np.asarray(v, dtype=float).ravel()
+            for k, v in parameters.items()}
+        unknown = set(parameters) - set(self.MODEL_PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown model parameters: {}".format(
+                ', '.join(sorted(unknown))))
+        n_sets = max([len(v) for v in parameters.values()] or [1])
+        for k in self.MODEL_PARAMETERS:
+            v = parameters.get(k, np.full(n_sets, float(self.config(k))))
+            if len(v) != n_sets:
+                raise ValueError("All parameters must have {} values".format(
+                    n_sets))
+            # shaped to broadcast against the fire-hours axes
+            parameters[k] = v.reshape((n_sets,) + (1,) * np.ndim(height_abl))
+
+        height_abl = np.asarray(height_abl, dtype=float)
+        potential_temperature = np.asarray(potential_temperature, dtype=float)
+        height = np.asarray(height, dtype=float)
+        if frp is None:
+            if fire_area is None:
+                raise ValueError("Specify either frp or fire_area")
+            frp = 4180.8 * np.asarray(fire_area, dtype=float)
+        else:
+            frp = np.maximum(np.asarray(frp, dtype=float), 0.0)
+
+        # Parameter independent terms, computed once.  N^2 is linear in
+        # GRAVITY, and (frp / REF_POWER) ^ GAMMA is
+        # exp(GAMMA * (log(frp) - log(REF_POWER))), so that each parameter
+        # set costs a single exp per fire-hour
+        theta_0 = potential_temperature[..., 0]
+        theta_1 = potential_temperature[..., 1]
+        stability = (2.0 / (theta_0 + theta_1) * np.abs(theta_1 - theta_0)
+            / (height[..., 1] - height[..., 0]))
+        with np.errstate(divide='ignore'):
+            log_frp = np.broadcast_to(np.log(frp), height_abl.shape)
+        stability = np.broadcast_to(stability, height_abl.shape)
+        # 0 ^ 0 is 1, but GAMMA * log(0) is NaN when GAMMA is 0
+        zero_frp = np.broadcast_to(frp == 0, height_abl.shape)
+        any_zero_frp = zero_frp.any()
+
+        shape = (n_sets,) + height_abl.shape
+        plume_top_meters = np.empty(shape)
+        # three (chunk,) + height_abl.shape float64 temporaries
+        step = max(1, max_chunk_bytes // (24 * max(height_abl.size, 1)))
+        with self._metrics.phase('compute_ensemble'):
+            for i in range(0, n_sets, step):
+                p = {k: v[i:i + step] for k, v in parameters.items()}
+                with np.errstate(invalid='ignore'):
+                    exponent = p['GAMMA'] * (log_frp - np.log(p['REF_POWER']))
+                if any_zero_frp:
+                    np.copyto(exponent, 0.0, where=(p['GAMMA'] == 0) & zero_frp)
+                exponent -= (p['DELTA'] * p['GRAVITY'] / p['REF_N']) * stability
+                top = plume_top_meters[i:i + step]
+                np.exp(exponent, out=top)
+                top *= p['BETA']
+                top += p['ALPHA'] * height_abl
+        self._metrics.add('hours', plume_top_meters.size)
+
+        return {
+            'plume_top_meters': plume_top_meters,
+            'plume_bottom_meters': (plume_top_meters
+                * parameters['PLUME_BOTTOM_OVER_TOP'])
+        }
+
+    def _smoke_height_array(self, height_abl, frp, theta_0, theta_1,
+            height_0, height_1):
+        """Array counterpart of cal_smoke_height and calc_brunt_vaisala"""
+        alpha = float(self.config("ALPHA"))
+        beta = float(self.config("BETA"))
+        ref_power = float(self.config("REF_POWER"))
+        gamma = float(self.config("GAMMA"))
+        delta = float(self.config("DELTA"))
+        ref_n = float(self.config("REF_N"))
+        gravity = float(self.config("GRAVITY"))
+
+        # N^2 is used directly; taking the square root only to square it
+        # again, as calc_brunt_vaisala's callers do, is wasted work
+        nft_squared = ((gravity * 2) / (theta_0 + theta_1)
+            * np.abs(theta_1 - theta_0) / (height_1 - height_0))
+
+        return ((alpha * height_abl)
+            + (beta * np.power(frp / ref_power, gamma))
+            * np.exp(-1.0 * delta * (nft_squared / ref_n)))
 
 
     # The two methods below represent all of the science in this model.
@@ -98,16 +619,26 @@ class SEVPlumeRise(object):
         beta = float(self.config("BETA"))      # >0 m, the contribution of fire intensity
         ref_power = float(self.config("REF_POWER"))  # reference fire power, Pf0 in paper
         gamma = float(self.config("GAMMA"))    # <0.5, determines power law dependence on FRP
-        delta = float(self.config("DELTA"))    # > or = 0, defines dependence on stability in the free troposphere (FT)
-        ref_n = float(self.config("REF_N"))    # Watts, Brunt-Vaisala reference frequency, N0^2 in paper
 
-        nft = self.calc_brunt_vaisala(hourly_data)
+        # met dependent only, and so may have been computed for another fire
+        stability_term = hourly_data.get('stability_term')
+        if stability_term is None:
+            stability_term = self.calc_stability_term(hourly_data)
 
         smoke_height = (alpha * float(hourly_data["height_abl"])) \
                        + (beta * math.pow(hourly_data["frp"] / ref_power, gamma)) \
-                       * math.exp(-1.0 * delta * ((nft * nft) / ref_n))
+                       * stability_term
         return smoke_height
 
+    def calc_stability_term(self, hourly_data):
+        """ Dependence of smoke height on stability in the free troposphere """
+        delta = float(self.config("DELTA"))    # > or = 0, defines dependence on stability in the free troposphere (FT)
+        ref_n = float(self.config("REF_N"))    # Watts, Brunt-Vaisala reference frequency, N0^2 in paper
+
+        nft = self.calc_brunt_vaisala(hourly_data)
+
+        return math.exp(-1.0 * delta * ((nft * nft) / ref_n))
+
     def calc_brunt_vaisala(self, hourly_data):
         """ The Brunt-Vaisala Frequency """
         gravity = float(self.config("GRAVITY"))  # m/s^2, gravitational constant
@@ -118,3 +649,80 @@ class SEVPlumeRise(object):
         nft = math.sqrt((gravity * 2) / (theta_0 + theta_1) * abs(theta_1 - theta_0) /
                         (hourly_data['height'][1] - hourly_data['height'][0]))
         return nft
+
+
+def _local_met_digest(local_met):
+    """Returns timestamps and digest of the met values SEV uses from dict
+    local_met; hashing all levels of all variables would cost many times
+    more than computing
+    """
+    dts = sorted(local_met.keys())
+    values = np.array([_met_values(local_met[dt]) for dt in dts], dtype=float)
+    return [dts, hashlib.sha256(values.tobytes()).hexdigest()]
+
+def _met_values(met_loc):
+    """Returns tuple of the met values SEV uses for an hour: the lowest
+    two HGTS and TPOT levels (None if missing), whether there's RELH, and
+    PBL height
+    """
+    hgts = list((met_loc.get('HGTS') or [])[:2])
+    tpot = list((met_loc.get('TPOT') or [])[:2])
+    pbl = met_loc.get('HPBL') if met_loc.get('PBLH') is None else met_loc.get('PBLH')
+    return tuple(hgts + [None] * (2 - len(hgts)) + tpot
+        + [None] * (2 - len(tpot))) + (bool(met_loc.get('RELH')), pbl)
+
+
+def parameter_grid(**values):
+    """Returns dict of parameter arrays covering every combination of the
+    given values, for SEVPlumeRise.compute_ensemble
+
+    e.g. parameter_grid(alpha=[0.2, 0.3], beta=[150, 170, 190]) returns
+    six sets of ALPHA and BETA
+    """
+    keys = sorted(values)
+    grids = np.meshgrid(*[np.asarray(values[k], dtype=float) for k in keys],
+        indexing='ij')
+    return {k.upper(): g.ravel() for k, g in zip(keys, grids)}
+
+
+def _load_array(a):
+    if isinstance(a, str):
+        return np.load(a, mmap_mode='r')
+    return np.asarray(a, dtype=float)
+
+def _output_array(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=dtype,
+            shape=shape)
+    if out.shape != shape:
+        raise ValueError("Output array must have shape {}".format(shape))
+    return out
+
+def _chunks(shape, max_elements):
+    """Yields tuples of slices, over the leading axes of shape, each
+    selecting at most max_elements elements (or a single element of the
+    last axis, if max_elements is smaller than that)
+    """
+    if not shape:
+        yield ()
+        return
+    inner = int(np.prod(shape[1:]))
+    if inner <= max_elements or len(shape) == 1:
+        step = max(1, max_elements // max(inner, 1))
+        for i in range(0, shape[0], step):
+            yield (slice(i, min(i + step, shape[0])),)
+    else:
+        # a single slab along the leading axis is too big; split it
+        for i in range(shape[0]):
+            for sub in _chunks(shape[1:], max_elements):
+                yield (slice(i, i + 1),) + sub
+
+def _chunk_of(a, chunk, ndim):
+    """Returns portion of a for chunk, which slices leading axes of the
+    full ndim-dimensional array; a may be shaped like just its trailing
+    dimensions, in which case slices of the axes it lacks are dropped
+    """
+    offset = ndim - a.ndim
+    return np.asarray(a[chunk[offset:]], dtype=float)
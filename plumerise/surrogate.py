@@ -0,0 +1,347 @@
+"""plumerise.surrogate
+"""
+
+__author__      = "Joel Dubowy"
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .batch import run_many
+from .feps import FEPSPlumeRise, engine_cache_key, error_stats
+
+# feps_plumerise output columns, as returned by a FEPS ENGINE
+COLUMNS = ('heat', 'smold_frac', 'plume_bot', 'plume_top')
+
+# Inputs seen by feps_weather and feps_plumerise.  A fire is described to
+# the table by these, as 'timeprofile.<key>' (per hour),
+# 'consumption.<key>' (per area, as passed to feps_plumerise), and
+# 'fire_location_info.<key>', any of which may be an axis of the table
+TIMEPROFILE_KEYS = ('area_fraction', 'flaming', 'smoldering', 'residual')
+CONSUMPTION_KEYS = ('flaming', 'smoldering', 'residual', 'duff')
+FIRE_LOCATION_INFO_KEYS = ('area', 'moisture_duff', 'sunset_hour',
+    'max_temp_hour', 'min_temp_hour', 'min_humid', 'max_humid', 'min_temp',
+    'max_temp', 'min_wind', 'max_wind', 'min_wind_aloft', 'max_wind_aloft')
+
+# Axes used by SurrogateTable.build when none are given: the inputs that
+# vary from fire to fire - area, on a log grid, each hour's timeprofile
+# values, on grids concentrated near zero, where most hours of most
+# profiles fall, and consumption per area, on a coarse grid spanning
+# typical fuel loadings (tons per acre).  Weather and duff moisture are
+# taken from the reference, so build one table per weather regime, or
+# pass axes covering them.
+TIMEPROFILE_GRID = [0.0, 0.01, 0.1, 1.0]
+CONSUMPTION_GRID = [0.0, 10.0, 100.0]
+DEFAULT_AXES = ([('fire_location_info.area',
+        [1.0, 10.0, 100.0, 1000.0, 10000.0, 100000.0])]
+    + [('timeprofile.' + k, TIMEPROFILE_GRID) for k in TIMEPROFILE_KEYS]
+    + [('consumption.' + k, CONSUMPTION_GRID) for k in CONSUMPTION_KEYS])
+
+# Max number of grid points SurrogateTable.build runs per task; grouping
+# them amortizes the worker pool's per-task overhead, which dominates with
+# in-process engines, while leaving several tasks per worker
+BUILD_CHUNK_SIZE = 100
+
+class SurrogateTable(object):
+    """Precomputed lookup table of FEPS output, for fast, approximate
+    plume rise
+
+    The table holds feps_plumerise output for every combination of the
+    values of its axes, for each hour of a run of up to n_hours hours, and
+    answers lookups by multilinear interpolation, vectorized over a fire's
+    hours.  It assumes that an hour's output depends only on that hour's
+    timeprofile values, its position in the run, and the fire's
+    consumption and location info; use validate to measure how well that,
+    and the interpolation, hold.
+
+    args
+     - axes -- list of (name, values) tuples, where name is one of the
+        inputs described above (e.g. 'consumption.flaming') and values
+        are increasing
+     - reference -- dict of values of all inputs that aren't axes, keyed
+        by name (see reference_inputs); fires whose inputs differ are
+        outside the table's domain
+     - values -- array of shape (len(values) of each axis, ...,
+        n_hours, len(COLUMNS))
+    """
+
+    def __init__(self, axes, reference, values):
+        self.axes = [(name, np.asarray(v, dtype=float)) for name, v in axes]
+        axis_names = set(name for name, v in self.axes)
+        self.reference = {k: float(v) for k, v in reference.items()
+            if k not in axis_names}
+        self.values = np.asarray(values, dtype=float)
+        self.n_hours = self.values.shape[-2]
+
+        unknown = axis_names - set(_input_names())
+        if unknown:
+            raise ValueError("Unknown surrogate table axes: {}".format(
+                ', '.join(sorted(unknown))))
+        for name, v in self.axes:
+            if len(v) < 2 or np.any(np.diff(v) <= 0):
+                raise ValueError("Values of axis {} must be increasing, "
+                    "and there must be at least two".format(name))
+        missing = set(_input_names()) - set(self.reference) - axis_names
+        if missing:
+            raise ValueError("Reference is missing values for: {}".format(
+                ', '.join(sorted(missing))))
+
+    @property
+    def digest(self):
+        """Identifies the table's content, e.g. for result cache keys"""
+        h = hashlib.sha256(self._metadata().encode())
+        h.update(self.values.tobytes())
+        return h.hexdigest()
+
+    ## Building, saving, and loading
+
+    @classmethod
+    def build(cls, engine, axes, reference, n_hours=24, max_workers=None):
+        """Builds table by running engine at every point of the grid
+
+        args
+         - engine -- callable taking timeprofile, consumption, and
+            fire_location_info, and returning feps_plumerise output rows,
+            e.g. FEPSPlumeRise().run_binaries
+         - axes, reference -- see class docstring; if axes is None,
+            DEFAULT_AXES are used
+        kwargs
+         - n_hours -- max number of hours of fires the table can be used for
+         - max_workers -- number of engine runs to make concurrently
+        """
+        if axes is None:
+            axes = DEFAULT_AXES
+        table = cls(axes, reference,
+            np.empty([len(v) for n, v in axes] + [n_hours, len(COLUMNS)]))
+        points = list(itertools.product(*[range(len(v))
+            for n, v in table.axes]))
+        logging.info("Building FEPS surrogate table of %d points",
+            len(points))
+
+        def run(chunk):
+            values = []
+            for point in chunk:
+                inputs = dict(table.reference)
+                inputs.update((name, v[i]) for (name, v), i in zip(
+                    table.axes, point))
+                timeprofile, consumption, fire_location_info = _fire(inputs,
+                    n_hours)
+                rows = engine(timeprofile, consumption, fire_location_info)
+                values.append([[float(row[c]) for c in COLUMNS]
+                    for row in rows])
+            return values
+
+        workers = max_workers or os.cpu_count() or 1
+        chunk_size = max(1, min(BUILD_CHUNK_SIZE,
+            len(points) // (4 * workers)))
+        chunks = [points[i:i + chunk_size]
+            for i in range(0, len(points), chunk_size)]
+        for i, values, error in run_many(run, chunks,
+                max_workers=max_workers):
+            if error:
+                raise error
+            for point, rows in zip(chunks[i], values):
+                table.values[point] = rows
+        return table
+
+    def save(self, filename):
+        """Saves table to .npz file"""
+        np.savez(filename, values=self.values,
+            metadata=np.array(self._metadata()))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as f:
+            metadata = json.loads(str(f['metadata']))
+            return cls(metadata['axes'], metadata['reference'], f['values'])
+
+    def _metadata(self):
+        return json.dumps({
+            'axes': [(name, v.tolist()) for name, v in self.axes],
+            'reference': self.reference
+        }, sort_keys=True)
+
+    ## Lookup
+
+    def lookup(self, timeprofile, consumption, fire_location_info):
+        """Returns interpolated feps_plumerise output rows, like those
+        returned by a FEPS ENGINE, or None if the fire is outside the
+        table's domain
+        """
+        if len(timeprofile) > self.n_hours:
+            return None
+        inputs = _inputs(timeprofile, consumption, fire_location_info)
+
+        for name, value in self.reference.items():
+            if not np.allclose(inputs[name], value, rtol=1e-9, atol=0):
+                return None
+
+        n = len(timeprofile)
+        # per axis, index of lower grid point and interpolation weight of
+        # upper one, for each hour
+        indices = []
+        weights = []
+        for name, grid in self.axes:
+            value = np.broadcast_to(inputs[name], (n,))
+            if np.any(value < grid[0]) or np.any(value > grid[-1]):
+                return None
+            i = np.clip(np.searchsorted(grid, value, side='right') - 1,
+                0, len(grid) - 2)
+            indices.append(i)
+            weights.append((value - grid[i]) / (grid[i + 1] - grid[i]))
+
+        hours = np.arange(n)
+        interpolated = np.zeros((n, len(COLUMNS)))
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            w = np.ones(n)
+            for c, weight in zip(corner, weights):
+                w = w * (weight if c else 1.0 - weight)
+            index = tuple(i + c for i, c in zip(indices, corner)) + (hours,)
+            interpolated += w[:, np.newaxis] * self.values[index]
+
+        return [dict(zip(COLUMNS, row)) for row in interpolated.tolist()]
+
+    def validate(self, engine, fires):
+        """Compares table's output with that of engine, e.g. the binaries,
+        for fires within its domain
+
+        args
+         - engine -- as passed to build
+         - fires -- iterable of dicts, each with 'timeprofile',
+            'consumption', and 'fire_location_info'
+
+        Returns dict with number of fires, number within the domain, and,
+        per output column, max and mean absolute error and RMSE over all
+        hours of fires within the domain
+        """
+        errors = []
+        n_fires = 0
+        n_in_domain = 0
+        for fire in fires:
+            n_fires += 1
+            fire_location_info = dict(fire['fire_location_info'])
+            FEPSPlumeRise()._fill_fire_location_info(fire_location_info)
+            args = (fire['timeprofile'], fire['consumption'],
+                fire_location_info)
+            approximate = self.lookup(*args)
+            if approximate is not None:
+                n_in_domain += 1
+                exact = engine(*args)
+                errors.extend([[float(e[c]) - a[c] for c in COLUMNS]
+                    for e, a in zip(exact, approximate)])
+
+        return {
+            'n_fires': n_fires,
+            'n_in_domain': n_in_domain,
+            'columns': error_stats(errors, COLUMNS)
+        }
+
+
+class SurrogateEngine(object):
+    """FEPS ENGINE answering from a SurrogateTable, and falling back to an
+    exact engine for fires outside the table's domain
+
+    e.g.
+
+        engine = SurrogateEngine(SurrogateTable.load('feps_table.npz'),
+            FEPSPlumeRise().run_binaries)
+        FEPSPlumeRise(engine=engine).compute(...)
+
+    args
+     - table -- SurrogateTable
+     - fallback -- exact engine, e.g. FEPSPlumeRise().run_binaries
+    """
+
+    def __init__(self, table, fallback):
+        self.table = table
+        self.fallback = fallback
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._digest = table.digest
+
+    def __call__(self, timeprofile, consumption, fire_location_info):
+        rows = self.table.lookup(timeprofile, consumption, fire_location_info)
+        with self._lock:
+            if rows is None:
+                self.fallbacks += 1
+            else:
+                self.hits += 1
+        if rows is None:
+            logging.debug("Fire outside surrogate table's domain; "
+                "running exact model")
+            rows = self.fallback(timeprofile, consumption, fire_location_info)
+        return rows
+
+    @property
+    def cache_key(self):
+        """Identifies table and fallback, for result cache keys; None if
+        the fallback has no identity, in which case results aren't cached
+        """
+        fallback_key = engine_cache_key(self.fallback)
+        if fallback_key is None:
+            return None
+        return ['surrogate', self._digest, fallback_key]
+
+    def __repr__(self):
+        return "SurrogateEngine({}, {!r})".format(self._digest,
+            engine_cache_key(self.fallback))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'fallbacks': self.fallbacks
+        }
+
+
+def reference_inputs(timeprofile_hour, consumption, fire_location_info):
+    """Returns dict of inputs of the given fire, for use as a
+    SurrogateTable's reference
+
+    args
+     - timeprofile_hour -- one hour's timeprofile values
+     - consumption, fire_location_info -- as passed to FEPSPlumeRise.compute
+    """
+    inputs = _inputs({'0': timeprofile_hour}, consumption, fire_location_info)
+    return {k: float(np.ravel(v)[0]) for k, v in inputs.items()}
+
+
+def _input_names():
+    return (['timeprofile.' + k for k in TIMEPROFILE_KEYS]
+        + ['consumption.' + k for k in CONSUMPTION_KEYS]
+        + ['fire_location_info.' + k for k in FIRE_LOCATION_INFO_KEYS])
+
+def _inputs(timeprofile, consumption, fire_location_info):
+    """Returns dict of a fire's inputs, keyed by name; timeprofile values
+    are per-hour arrays
+    """
+    fire_location_info = dict(fire_location_info)
+    FEPSPlumeRise()._fill_fire_location_info(fire_location_info)
+    area = float(fire_location_info['area'])
+    hours = [timeprofile[dt] for dt in sorted(timeprofile.keys())]
+    inputs = {}
+    for k in TIMEPROFILE_KEYS:
+        inputs['timeprofile.' + k] = np.array([float(h[k]) for h in hours])
+    for k in CONSUMPTION_KEYS:
+        inputs['consumption.' + k] = float(consumption.get(k, 0.0)) / area
+    for k in FIRE_LOCATION_INFO_KEYS:
+        inputs['fire_location_info.' + k] = float(fire_location_info[k])
+    return inputs
+
+def _fire(inputs, n_hours):
+    """Returns (timeprofile, consumption, fire_location_info) of a fire
+    with the given inputs, and the same timeprofile values each hour
+    """
+    fire_location_info = {k: inputs['fire_location_info.' + k]
+        for k in FIRE_LOCATION_INFO_KEYS}
+    area = fire_location_info['area']
+    consumption = {k: inputs['consumption.' + k] * area
+        for k in CONSUMPTION_KEYS}
+    hour = {k: inputs['timeprofile.' + k] for k in TIMEPROFILE_KEYS}
+    timeprofile = {"%04d" % (h): dict(hour) for h in range(n_hours)}
+    return timeprofile, consumption, fire_location_info
@@ -0,0 +1,120 @@
+"""plumerise.triage
+"""
+
+__author__      = "Joel Dubowy"
+
+import copy
+import logging
+
+from .cache import ResultCache
+from .result import make_result
+
+
+class Triage(object):
+    """Runs batches of fires through FEPSPlumeRise, computing each
+    distinct fire once and answering fires with nothing to burn directly
+
+    Fires are canonicalized before being compared: fire location info
+    defaults are filled in and, with the binary engine, inputs are reduced
+    to the input files and args the binaries see, so fires that differ
+    only in ways the binaries can't see (e.g. consumption digits beyond
+    those written, or unused keys) are duplicates.
+
+    Fires with zero total consumption release no heat, so their plume
+    bottom and top are zero every hour; they're answered without running
+    the model.  Their smolder fraction is zero_smolder_fraction, not
+    whatever feps_plumerise would report.
+
+    Fires that can't be triaged, e.g. for lack of inputs, are passed to the
+    model as is, so that it reports their errors.
+
+    args
+     - plume_rise -- FEPSPlumeRise object
+    kwargs
+     - zero_smolder_fraction -- smolder fraction of hours of zero fires
+    """
+
+    def __init__(self, plume_rise, zero_smolder_fraction=0.0):
+        self.plume_rise = plume_rise
+        self.zero_smolder_fraction = zero_smolder_fraction
+        self.stats = {'fires': 0, 'computed': 0, 'duplicates': 0, 'zero': 0}
+
+    def compute_many(self, fires, **kwargs):
+        """Computes plume rise for many fires
+
+        Generator yielding (index, plume_rise, error) per fire, in input
+        order, as FEPSPlumeRise.compute_many does.  fires is read in full
+        before any are computed.  Other kwargs are passed to
+        FEPSPlumeRise.compute_many.
+        """
+        fires = list(fires)
+        self.stats['fires'] += len(fires)
+
+        # index of first fire with each key, and of fires duplicating it
+        first = {}
+        duplicates = {}
+        zero = set()
+        for i, fire in enumerate(fires):
+            try:
+                if self._is_zero(fire):
+                    zero.add(i)
+                    continue
+                key = self._key(fire)
+            except Exception as e:
+                logging.debug("Failed to triage fire %d: %s", i, e)
+                key = ('untriaged', i)
+            if key in first:
+                duplicates.setdefault(first[key], []).append(i)
+            else:
+                first[key] = i
+        distinct = sorted(first.values())
+        n_duplicates = sum(len(v) for v in duplicates.values())
+        self.stats['computed'] += len(distinct)
+        self.stats['duplicates'] += n_duplicates
+        self.stats['zero'] += len(zero)
+        logging.info("Triaged %d fires: %d distinct, %d duplicates, %d zero",
+            len(fires), len(distinct), n_duplicates, len(zero))
+
+        results = {}
+        computed = self.plume_rise.compute_many(
+            (fires[i] for i in distinct), **dict(kwargs, ordered=True))
+        for i in range(len(fires)):
+            if i in zero:
+                yield i, self._zero_result(fires[i]), None
+            elif i not in results:
+                # next distinct fire; results are in input order
+                j, plume_rise, error = next(computed)
+                results[distinct[j]] = (plume_rise, error)
+                for d in duplicates.get(distinct[j], []):
+                    results[d] = (copy.deepcopy(plume_rise), error)
+                yield (i,) + results.pop(i)
+            else:
+                yield (i,) + results.pop(i)
+
+    def _is_zero(self, fire):
+        consumption = fire['consumption']
+        return sum(consumption.get(k) or 0.0
+            for k in ('flaming', 'smoldering', 'residual', 'duff')) == 0
+
+    def _key(self, fire):
+        plume_rise = self.plume_rise
+        fire_location_info = dict(fire['fire_location_info'])
+        plume_rise._fill_fire_location_info(fire_location_info)
+        timestamps = sorted(fire['timeprofile'].keys())
+        if plume_rise.config("ENGINE") == 'binary':
+            # what the binaries see, plus timestamps, which key results
+            return ResultCache.make_key([timestamps,
+                plume_rise._weather_file_contents(fire_location_info),
+                plume_rise._profile_file_contents(fire['timeprofile']),
+                plume_rise._consumption_file_contents(fire['consumption'],
+                    fire_location_info),
+                str(fire_location_info['area'])])
+        return ResultCache.make_key([fire['timeprofile'],
+            fire['consumption'], fire_location_info])
+
+    def _zero_result(self, fire):
+        timestamps = sorted(fire['timeprofile'].keys())
+        zeros = [0.0] * len(timestamps)
+        return make_result(self.plume_rise.config("RESULT_TYPE"), timestamps,
+            zeros, zeros, [self.zero_smolder_fraction] * len(timestamps),
+            num_layers=int(self.plume_rise.config("NUM_LAYERS")))
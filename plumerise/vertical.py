@@ -0,0 +1,69 @@
+"""plumerise.vertical
+"""
+
+__author__      = "Joel Dubowy"
+
+import numpy as np
+
+
+class VerticalAllocator(object):
+    """Allocates plume rise emissions onto a fixed set of vertical levels,
+    e.g. those of a dispersion model
+
+    Emissions are evenly distributed between plume bottom and top, as they
+    are among the layers of plume rise output, so the fraction falling in
+    each level is the fraction of the plume's depth that the level
+    overlaps.  Whole batches of hours are allocated at once, rather than
+    re-binning each hour's layer heights.
+
+    args
+     - levels -- increasing level boundary heights (m), n_levels + 1 of
+        them; emissions above the highest or below the lowest boundary
+        aren't allocated to any level
+    """
+
+    def __init__(self, levels):
+        self.levels = np.asarray(levels, dtype=float)
+        if self.levels.ndim != 1 or len(self.levels) < 2:
+            raise ValueError("Specify at least two level boundaries")
+        if np.any(np.diff(self.levels) <= 0):
+            raise ValueError("Level boundaries must be increasing")
+
+    @property
+    def num_levels(self):
+        return len(self.levels) - 1
+
+    def allocate(self, plume_bottom, plume_top, fraction=None):
+        """Returns (n_hours, n_levels) array of fraction of each hour's
+        emissions in each level
+
+        args
+         - plume_bottom, plume_top -- per-hour heights (m); NaN, for hours
+            without plume, results in all zeros
+        kwargs
+         - fraction -- optional per-hour (or scalar) multiplier, e.g. the
+            portion of emissions lofted by the plume
+        """
+        plume_bottom = np.asarray(plume_bottom, dtype=float).reshape(-1, 1)
+        plume_top = np.asarray(plume_top, dtype=float).reshape(-1, 1)
+        depth = plume_top - plume_bottom
+
+        # Fraction of each plume below each level boundary, i.e. the CDF
+        # of the uniform distribution between bottom and top, evaluated
+        # at the boundaries.  Plumes of zero depth are all below any
+        # boundary above them
+        with np.errstate(divide='ignore', invalid='ignore'):
+            below = np.where(depth > 0,
+                (self.levels - plume_bottom) / depth,
+                (self.levels > plume_bottom).astype(float))
+        np.clip(below, 0.0, 1.0, out=below)
+        allocation = np.diff(below, axis=1)
+
+        if fraction is not None:
+            allocation *= np.asarray(fraction, dtype=float).reshape(-1, 1)
+        return allocation
+
+    def allocate_result(self, plume_rise, fraction=None):
+        """Like allocate, but for a plumerise.result.PlumeRiseResult"""
+        return self.allocate(plume_rise.plume_bottom, plume_rise.plume_top,
+            fraction=fraction)
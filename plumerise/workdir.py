@@ -0,0 +1,221 @@
+"""plumerise.workdir
+"""
+
+__author__      = "Joel Dubowy"
+
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+
+class WorkingDirManager(object):
+    """Manages the scratch directories used for FEPS input and output files
+
+    kwargs
+     - root -- directory in which to create working dirs, e.g. '/dev/shm'
+        to keep files in memory; defaults to the system temp dir
+     - reuse -- keep working dirs after use, and hand them out again to
+        later calls, rather than creating and removing one per call; a dir
+        is only ever in use by one caller (thread or coroutine) at a time,
+        and is emptied before it's handed out again
+     - keep_on_failure -- don't remove a working dir if the computation
+        using it fails, to allow debugging
+     - max_bytes -- cap on total size of managed working dirs, including
+        those in use; if exceeded when a dir is acquired, dirs kept on failure are removed,
+        oldest first, and, if that's not enough, an exception is raised
+    """
+
+    PREFIX = 'plumerise-'
+
+    def __init__(self, root=None, reuse=False, keep_on_failure=False,
+            max_bytes=None):
+        self.root = root or tempfile.gettempdir()
+        self.reuse = reuse
+        self.keep_on_failure = keep_on_failure
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reused_dirs = set()
+        self._active_dirs = set()
+        self._idle_dirs = []
+        self._kept_dirs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, e_type, value, tb):
+        self.cleanup()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Context manager yielding a working dir"""
+        self._enforce_max_bytes()
+
+        working_dir = None
+        if self.reuse:
+            with self._lock:
+                if self._idle_dirs:
+                    working_dir = self._idle_dirs.pop()
+        if not working_dir:
+            working_dir = tempfile.mkdtemp(prefix=self.PREFIX, dir=self.root)
+            if self.reuse:
+                with self._lock:
+                    self._reused_dirs.add(working_dir)
+        with self._lock:
+            self._active_dirs.add(working_dir)
+
+        try:
+            yield working_dir
+
+        except BaseException:
+            if self.keep_on_failure:
+                logging.error("Keeping working dir %s of failed run",
+                    working_dir)
+                with self._lock:
+                    self._reused_dirs.discard(working_dir)
+                    self._kept_dirs.append(working_dir)
+            elif self.reuse:
+                self._release(working_dir)
+            else:
+                shutil.rmtree(working_dir, ignore_errors=True)
+            raise
+
+        else:
+            if self.reuse:
+                self._release(working_dir)
+            else:
+                shutil.rmtree(working_dir, ignore_errors=True)
+
+        finally:
+            with self._lock:
+                self._active_dirs.discard(working_dir)
+
+    def _release(self, working_dir):
+        # so that files left by one run, e.g. output the binaries failed to
+        # overwrite, can't be read by the next
+        _empty_dir(working_dir)
+        with self._lock:
+            if working_dir in self._reused_dirs:
+                self._idle_dirs.append(working_dir)
+
+    def usage(self):
+        """Returns total size, in bytes, of managed working dirs, including
+        those in use
+        """
+        with self._lock:
+            dirs = self._reused_dirs | self._active_dirs | set(self._kept_dirs)
+        return sum([_dir_size(d) for d in dirs])
+
+    def cleanup(self):
+        """Removes all reused and kept working dirs"""
+        with self._lock:
+            dirs = list(self._reused_dirs) + self._kept_dirs
+            self._reused_dirs = set()
+            self._idle_dirs = []
+            self._kept_dirs = []
+        for d in dirs:
+            shutil.rmtree(d, ignore_errors=True)
+
+    def _enforce_max_bytes(self):
+        if self.max_bytes is None:
+            return
+
+        usage = self.usage()
+        while usage > self.max_bytes:
+            with self._lock:
+                if not self._kept_dirs:
+                    break
+                d = self._kept_dirs.pop(0)
+            logging.info("Removing kept working dir %s to free scratch space", d)
+            shutil.rmtree(d, ignore_errors=True)
+            usage = self.usage()
+
+        if usage > self.max_bytes:
+            raise Exception("Scratch space usage ({} bytes) exceeds "
+                "max_bytes ({})".format(usage, self.max_bytes))
+
+
+def _empty_dir(d):
+    for name in os.listdir(d):
+        path = os.path.join(d, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _dir_size(d):
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(d):
+        for f in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, f)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class NamedPipes(object):
+    """Feeds and drains named pipes (FIFOs) in background threads
+
+    Lets an external program read its input from, and write its output to,
+    what look like files, without the data ever touching disk.  close must
+    be called after the program exits, even if it fails, to unblock and
+    join any threads whose pipes the program didn't open.
+    """
+
+    def __init__(self):
+        self._threads = []
+
+    def write(self, filename, contents):
+        """Creates pipe at filename, and writes contents to it"""
+        self._make_fifo(filename)
+        def _write():
+            try:
+                with open(filename, 'w') as f:
+                    f.write(contents)
+            except OSError as e:
+                logging.debug("Failed to write to named pipe %s: %s",
+                    filename, e)
+        self._start(filename, _write, os.O_RDONLY)
+
+    def read(self, filename):
+        """Creates pipe at filename, and returns list that, once close is
+        called, will contain what was written to it
+        """
+        self._make_fifo(filename)
+        contents = []
+        def _read():
+            with open(filename, 'r') as f:
+                contents.append(f.read())
+        self._start(filename, _read, os.O_WRONLY)
+        return contents
+
+    def close(self):
+        for thread, filename, unblock_flag in self._threads:
+            while thread.is_alive():
+                # the program never opened the other end of the pipe, so
+                # open and close it ourselves, which lets the thread's open
+                # return and its read or write end.  This is retried in case
+                # the thread hadn't yet reached its own open
+                try:
+                    os.close(os.open(filename, unblock_flag | os.O_NONBLOCK))
+                except OSError:
+                    pass
+                thread.join(0.1)
+        self._threads = []
+
+    def _make_fifo(self, filename):
+        if os.path.lexists(filename):
+            os.remove(filename)
+        os.mkfifo(filename)
+
+    def _start(self, filename, target, unblock_flag):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append((thread, filename, unblock_flag))
@@ -13,7 +13,10 @@ setup(
     author='Joel Dubowy',
     author_email='jdubowy@gmail.com',
     packages=find_packages(),
-    scripts=[],
+    scripts=[
+        'bin/plumerise',
+        'bin/plumerise-worker'
+    ],
     package_data={
     },
     classifiers=[
@@ -26,7 +29,13 @@ setup(
     ],
     url='https://github.com/pnwairfire/plumerise',
     description='Package for computing plume rise from time-profiled emissions output.',
-    install_requires=[],
+    install_requires=[
+        'numpy'
+    ],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'hdf5': ['h5py']
+    },
     dependency_links=[],
     tests_require=test_requirements
 )
@@ -0,0 +1,38 @@
+"""Fire and met inputs shared by the SEV, triage, and scheduler tests
+"""
+
+__author__      = "Joel Dubowy"
+
+import copy
+
+CONSUMPTION = {"flaming": 2000.0, "smoldering": 1000.0, "residual": 500.0}
+
+
+def timestamps(n_hours):
+    return ["2014-05-29T%02d:00:00" % (h) for h in range(n_hours)]
+
+def make_timeprofile(n_hours=3):
+    return {dt: {"area_fraction": 0.5, "flaming": 0.5, "smoldering": 0.5,
+        "residual": 0.5} for dt in timestamps(n_hours)}
+
+def make_local_met(n_hours=5, pbl_offset=0):
+    return {dt: {
+            "HGTS": [59.2 + h, 127.3 + 2 * h, 230.3],
+            "RELH": [28.0, 22.0, 18.2],
+            "TPOT": [293.4 + 0.1 * h, 295.6 + 0.3 * h, 296.9],
+            "PBLH": 255.0 + 20 * h + pbl_offset
+        } for h, dt in enumerate(timestamps(n_hours))}
+
+def make_fire(area=200, consumption=CONSUMPTION, timeprofile=None,
+        local_met=None, **location_info):
+    """Returns fire dict, as passed to FEPSPlumeRise.compute_many, with
+    'local_met' as well if given
+    """
+    fire = {
+        "timeprofile": copy.deepcopy(timeprofile or make_timeprofile()),
+        "consumption": dict(consumption),
+        "fire_location_info": dict(location_info, area=area)
+    }
+    if local_met is not None:
+        fire["local_met"] = local_met
+    return fire
@@ -0,0 +1,56 @@
+__author__      = "Joel Dubowy"
+
+import threading
+import time
+
+from plumerise.batch import run_many
+
+
+def _square(n):
+    if n == 3:
+        raise ValueError("three")
+    # make earlier items finish later
+    time.sleep(0.001 * (10 - n))
+    return n * n
+
+
+class TestRunMany(object):
+
+    def test_ordered(self):
+        results = list(run_many(_square, range(10), max_workers=4))
+        assert [r[0] for r in results] == list(range(10))
+        for i, result, error in results:
+            if i == 3:
+                assert result is None and isinstance(error, ValueError)
+            else:
+                assert result == i * i and error is None
+
+    def test_unordered(self):
+        results = list(run_many(_square, range(10), max_workers=4,
+            ordered=False))
+        assert sorted(r[0] for r in results) == list(range(10))
+
+    def test_bounded_input_consumption(self):
+        lock = threading.Lock()
+        consumed = []
+        started = []
+
+        def items():
+            for i in range(100):
+                with lock:
+                    consumed.append(i)
+                yield i
+
+        def func(i):
+            with lock:
+                started.append(len(consumed))
+            return i
+
+        assert len(list(run_many(func, items(), max_workers=2))) == 100
+        # never more than 2 * max_workers items read ahead
+        assert all(c - i <= 4 for i, c in enumerate(sorted(started)))
+
+    def test_processes(self):
+        results = list(run_many(_square, range(5), max_workers=2,
+            use_processes=True))
+        assert [r[1] for r in results] == [0, 1, 4, None, 16]
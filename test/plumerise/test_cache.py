@@ -0,0 +1,121 @@
+__author__      = "Joel Dubowy"
+
+import datetime
+import os
+import tempfile
+import time
+
+from plumerise.cache import (LRUCache, DiurnalCache, ResultCache,
+    StabilityCache)
+
+
+class TestLRUCache(object):
+
+    def test_eviction_and_stats(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' is now least recently used
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+        assert cache.stats() == {'size': 2, 'hits': 2, 'misses': 1,
+            'hit_rate': 2.0 / 3}
+
+
+class TestDiurnalCache(object):
+
+    def test_memory(self):
+        cache = DiurnalCache(max_size=1)
+        assert cache.get('w1') is None
+        cache.set('w1', 'd1')
+        assert cache.get('w1') == 'd1'
+        cache.set('w2', 'd2')
+        assert cache.get('w1') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 2
+
+    def test_disk(self):
+        cache_dir = tempfile.mkdtemp()
+        DiurnalCache(cache_dir=cache_dir).set('w1', 'd1')
+        # new cache object, e.g. in another process
+        cache = DiurnalCache(cache_dir=cache_dir)
+        assert cache.get('w1') == 'd1'
+        assert cache.get('w2') is None
+
+
+class TestResultCache(object):
+
+    def _cache(self, **kwargs):
+        return ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'),
+            **kwargs)
+
+    def test_make_key(self):
+        assert (ResultCache.make_key({'a': 1, 'b': [1.5, None]})
+            == ResultCache.make_key({'b': [1.5, None], 'a': 1}))
+        assert ResultCache.make_key({'a': 1}) != ResultCache.make_key({'a': 2})
+        # non-string keys
+        dt = datetime.datetime(2014, 5, 29, 22)
+        assert (ResultCache.make_key({dt: 1})
+            != ResultCache.make_key({dt + datetime.timedelta(hours=1): 1}))
+
+    def test_get_set_and_stats(self):
+        cache = self._cache()
+        assert cache.get('k') is None
+        cache.set('k', {'hours': {'2014-05-29T22:00:00': {'smolder_fraction': 0.1}}})
+        assert cache.get('k') == {'hours': {'2014-05-29T22:00:00': {'smolder_fraction': 0.1}}}
+        assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1,
+            'hit_rate': 0.5}
+
+    def test_datetimes(self):
+        cache = self._cache()
+        dts = [datetime.datetime(2014, 5, 29, h) for h in (22, 23)]
+        cache.set('hours', {'hours': {dt: {'smolder_fraction': 0.1}
+            for dt in dts}})
+        cache.set('columns', {'timestamps': dts, 'plume_top': [1.0, 2.0]})
+        # converted back, given the input's timestamps
+        assert list(cache.get('hours', timestamps=dts)['hours']) == dts
+        assert cache.get('columns', timestamps=dts)['timestamps'] == dts
+        assert cache.get('columns')['timestamps'] == [str(dt) for dt in dts]
+
+    def test_persistence(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'c.sqlite')
+        ResultCache(filename).set('k', [1, 2])
+        assert ResultCache(filename).get('k') == [1, 2]
+
+    def test_max_entries(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(time, 'time', lambda: now[0])
+        cache = self._cache(max_entries=2)
+        for k in ('a', 'b'):
+            cache.set(k, k)
+            now[0] += 1
+        cache.get('a')
+        now[0] += 1
+        cache.set('c', 'c')
+        assert cache.get('b') is None
+        assert cache.get('a') == 'a'
+        assert cache.get('c') == 'c'
+
+    def test_max_age(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(time, 'time', lambda: now[0])
+        cache = self._cache(max_age=10)
+        cache.set('a', 1)
+        now[0] += 11
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+
+class TestStabilityCache(object):
+
+    def test_get_set(self):
+        cache = StabilityCache(max_size=1)
+        assert cache.get(('c1', 'dt')) is None
+        cache.set(('c1', 'dt'), 0.5)
+        assert cache.get(('c1', 'dt')) == 0.5
+        cache.set(('c2', 'dt'), 0.4)
+        assert cache.get(('c1', 'dt')) is None
+        assert len(cache) == 1
+        assert cache.stats()['hits'] == 1
@@ -0,0 +1,116 @@
+__author__      = "Joel Dubowy"
+
+import json
+import os
+import tempfile
+
+from pytest import raises
+
+from plumerise.cli import main, write_checkpoint
+from plumerise.sev import SEVPlumeRise
+
+
+def _local_met(pbl):
+    return {
+        "2014-05-29T22:00:00": {
+            "HGTS": [59.2, 127.3],
+            "RELH": [28.0, 22.0],
+            "TPOT": [293.4, 295.6],
+            "PBLH": pbl
+        }
+    }
+
+def _write_input(fires):
+    filename = os.path.join(tempfile.mkdtemp(), 'fires.jsonl')
+    with open(filename, 'w') as f:
+        for fire in fires:
+            f.write((json.dumps(fire) if fire else '') + '\n')
+    return filename
+
+def _read_output(filename):
+    with open(filename) as f:
+        return [json.loads(l) for l in f]
+
+
+class TestCli(object):
+
+    def _fires(self):
+        return [
+            {'id': 'a', 'local_met': _local_met(255.0), 'fire_area': 200},
+            None,
+            {'id': 'b', 'local_met': _local_met(500.0), 'fire_area': 10,
+                'smolder_fraction': 0.2},
+            {'id': 'c'}
+        ]
+
+    def _check(self, output, config={}):
+        assert [o['line'] for o in output] == [1, 3, 4]
+        assert [o['id'] for o in output] == ['a', 'b', 'c']
+        assert output[0]['plumerise'] == SEVPlumeRise(**config).compute(
+            _local_met(255.0), 200)
+        assert output[1]['plumerise'] == SEVPlumeRise(**config).compute(
+            _local_met(500.0), 10, smolder_fraction=0.2)
+        assert 'error' in output[2] and 'plumerise' not in output[2]
+
+    def test_sev(self):
+        input_file = _write_input(self._fires())
+        output_file = os.path.join(tempfile.mkdtemp(), 'out.jsonl')
+        main(['-m', 'sev', '-i', input_file, '-o', output_file,
+            '-c', 'alpha=0.3'])
+        self._check(_read_output(output_file), {'alpha': 0.3})
+
+    def test_workers(self):
+        input_file = _write_input(self._fires())
+        output_file = os.path.join(tempfile.mkdtemp(), 'out.jsonl')
+        main(['-m', 'sev', '-i', input_file, '-o', output_file, '-w', '2'])
+        self._check(_read_output(output_file))
+
+    def test_resume(self):
+        input_file = _write_input(self._fires())
+        output_dir = tempfile.mkdtemp()
+        output_file = os.path.join(output_dir, 'out.jsonl')
+        checkpoint_file = os.path.join(output_dir, 'checkpoint.json')
+
+        main(['-m', 'sev', '-i', input_file, '-o', output_file,
+            '--resume', checkpoint_file, '--checkpoint-interval', '1'])
+        expected = _read_output(output_file)
+        self._check(expected)
+
+        with open(checkpoint_file) as f:
+            assert json.load(f) == {'lines_processed': 4,
+                'output_offset': os.path.getsize(output_file)}
+
+        # simulate crash after the second line
+        with open(output_file, 'w') as f:
+            f.write(json.dumps(expected[0]) + '\n')
+            offset = f.tell()
+        write_checkpoint(checkpoint_file, 2, offset)
+        main(['-m', 'sev', '-i', input_file, '-o', output_file,
+            '--resume', checkpoint_file])
+        assert expected == _read_output(output_file)
+
+    def test_resume_partial_output(self):
+        input_file = _write_input(self._fires())
+        output_dir = tempfile.mkdtemp()
+        output_file = os.path.join(output_dir, 'out.jsonl')
+        checkpoint_file = os.path.join(output_dir, 'checkpoint.json')
+        main(['-m', 'sev', '-i', input_file, '-o', output_file])
+        expected = _read_output(output_file)
+
+        # simulate crash, after the checkpoint, partway through writing
+        # the output of the third line
+        with open(output_file, 'w') as f:
+            f.write(json.dumps(expected[0]) + '\n')
+            offset = f.tell()
+            f.write(json.dumps(expected[1]) + '\n')
+            f.write(json.dumps(expected[2])[:10])
+        write_checkpoint(checkpoint_file, 2, offset)
+        main(['-m', 'sev', '-i', input_file, '-o', output_file,
+            '--resume', checkpoint_file])
+        assert expected == _read_output(output_file)
+
+    def test_invalid_args(self):
+        with raises(SystemExit):
+            main(['-m', 'sev', '-c', 'alpha'])
+        with raises(SystemExit):
+            main(['-m', 'sev', '--resume', 'foo.json'])
@@ -0,0 +1,71 @@
+__author__      = "Joel Dubowy"
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+import pytest
+
+from plumerise import export
+from plumerise.result import PlumeRiseResult
+
+TIMESTAMPS = ["2014-05-29T22:00:00", "2014-05-29T23:00:00"]
+
+
+def _results():
+    return [
+        ('fire1', PlumeRiseResult(TIMESTAMPS, [614.0, np.nan],
+            [18160.0, np.nan], [0.05, 0.4])),
+        ('fire2', PlumeRiseResult(TIMESTAMPS[:1], [36.6], [73.3], [0.49]))
+    ]
+
+def _assert_equal(actual, expected):
+    assert sorted(actual) == sorted(dict(expected))
+    for fire_id, result in expected:
+        assert actual[fire_id].to_dict() == result.to_dict()
+
+
+class TestStructured(object):
+
+    def test_round_trip(self):
+        array = export.to_structured(_results())
+        assert len(array) == 3
+        assert array.dtype.names == export.COLUMNS
+        assert_array_equal(array['fire_id'], ['fire1', 'fire1', 'fire2'])
+        assert array['time'][1] == np.datetime64(TIMESTAMPS[1])
+        _assert_equal(export.from_structured(array), _results())
+
+    def test_dict_results_and_layers(self):
+        results = [(i, r.to_dict()) for i, (f, r) in enumerate(_results())]
+        array = export.to_structured(results, layers=True)
+        assert array['heights'].shape == (3, 21)
+        assert_allclose(array['heights'][2, [0, -1]], [36.6, 73.3])
+        assert_allclose(array['emission_fractions'][0], [0.05] * 20)
+        assert sorted(export.from_structured(array)) == [0, 1]
+
+
+class TestParquet(object):
+
+    def test_round_trip(self, tmp_path):
+        pytest.importorskip('pyarrow')
+        filename = str(tmp_path / 'plumerise.parquet')
+        # row groups of about one fire each
+        assert export.write_parquet(filename, iter(_results()),
+            layers=True, row_group_size=1) == 3
+        import pyarrow.parquet
+        assert pyarrow.parquet.ParquetFile(filename).num_row_groups == 2
+        _assert_equal(export.read_parquet(filename), _results())
+
+    def test_record_batch(self):
+        pytest.importorskip('pyarrow')
+        batch = export.to_record_batch(_results())
+        assert batch.num_rows == 3
+        assert batch.schema.names == list(export.COLUMNS)
+
+    def test_record_batch_ids_and_zones(self):
+        pa = pytest.importorskip('pyarrow')
+        results = [(i, PlumeRiseResult([t + 'Z' for t in TIMESTAMPS],
+            [614.0, 36.6], [18160.0, 73.3], [0.05, 0.4])) for i in (1, 2)]
+        batch = export.to_record_batch(results)
+        assert batch.column(0).type == pa.int64()
+        assert batch.column(0).to_pylist() == [1, 1, 2, 2]
+        assert batch.column(1).to_pylist()[1] == np.datetime64(
+            TIMESTAMPS[1]).astype(object)
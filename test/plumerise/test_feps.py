@@ -1,14 +1,72 @@
 __author__      = "Joel Dubowy"
 
+import asyncio
 import copy
+import datetime
 import os
 import subprocess
+import sys
 import tempfile
+import time
 
 #from numpy.testing import assert_approx_equal
 from pytest import raises
 
-from plumerise.feps import FEPSPlumeRise
+from plumerise.cache import DiurnalCache, ResultCache
+from plumerise.feps import FEPSPlumeRise, compare_engines, engine_cache_key
+from plumerise.metrics import Metrics
+from plumerise.workdir import WorkingDirManager
+
+TIMEPROFILE = {
+    "2014-05-29T22:00:00": {
+        "area_fraction": 0.3333333333333333,
+        "flaming": 0.3333333333333333,
+        "residual": 0.3333333333333333,
+        "smoldering": 0.3333333333333333
+    },
+    "2014-05-29T23:00:00": {
+        "area_fraction": 0.3333333333333333,
+        "flaming": 0.3333333333333333,
+        "residual": 0.3333333333333333,
+        "smoldering": 0.3333333333333333
+    },
+    "2014-05-30T00:00:00": {
+        "area_fraction": 0.3333333333333333,
+        "flaming": 0.3333333333333333,
+        "residual": 0.3333333333333333,
+        "smoldering": 0.3333333333333333
+    }
+}
+CONSUMPTION = {
+    "flaming": 2165.6831964258654,
+    "residual": 1761.0414186789003,
+    "smoldering": 2091.3473506535884,
+    "total": 6018.071965758354
+}
+LOCATION_INFO = {
+    "area": 200,
+    "ecoregion": "southern",
+    "latitude": 47.4316976,
+    "longitude": -121.3990506,
+    "max_humid": 80,
+    "max_temp": 30,
+    "max_temp_hour": 14,
+    "max_wind": 6,
+    "max_wind_aloft": 6,
+    "min_humid": 40,
+    "min_temp": 13,
+    "min_temp_hour": 4,
+    "min_wind": 6,
+    "min_wind_aloft": 6,
+    "moisture_duff": 100.0,
+    "rain_days": 8,
+    "snow_month": 5,
+    "sunrise_hour": 3,
+    "sunset_hour": 19,
+    "utc_offset": "-09:00"
+}
+PLUME_FILE_CONTENT = 'hour, heat, smold_frac, plume_bot, plume_top\n0, 2082570545595.600342, 0.050000, 614.072536, 18160.408515\n1, 1110703180280.029053, 0.493334, 614.072536, 16164.954419\n2, 1110703180280.029053, 0.493334, 614.072536, 16156.323741\n'
+
 
 class TestFEPSPlumeRise(object):
 
@@ -29,54 +87,9 @@ class TestFEPSPlumeRise(object):
         """
         monkeypatch.setattr(subprocess, "check_output", lambda *args: None)
 
-        timeprofile = {
-            "2014-05-29T22:00:00": {
-                "area_fraction": 0.3333333333333333,
-                "flaming": 0.3333333333333333,
-                "residual": 0.3333333333333333,
-                "smoldering": 0.3333333333333333
-            },
-            "2014-05-29T23:00:00": {
-                "area_fraction": 0.3333333333333333,
-                "flaming": 0.3333333333333333,
-                "residual": 0.3333333333333333,
-                "smoldering": 0.3333333333333333
-            },
-            "2014-05-30T00:00:00": {
-                "area_fraction": 0.3333333333333333,
-                "flaming": 0.3333333333333333,
-                "residual": 0.3333333333333333,
-                "smoldering": 0.3333333333333333
-            }
-        }
-        consumption = {
-            "flaming": 2165.6831964258654,
-            "residual": 1761.0414186789003,
-            "smoldering": 2091.3473506535884,
-            "total": 6018.071965758354
-        }
-        location_info = {
-            "area": 200,
-            "ecoregion": "southern",
-            "latitude": 47.4316976,
-            "longitude": -121.3990506,
-            "max_humid": 80,
-            "max_temp": 30,
-            "max_temp_hour": 14,
-            "max_wind": 6,
-            "max_wind_aloft": 6,
-            "min_humid": 40,
-            "min_temp": 13,
-            "min_temp_hour": 4,
-            "min_wind": 6,
-            "min_wind_aloft": 6,
-            "moisture_duff": 100.0,
-            "rain_days": 8,
-            "snow_month": 5,
-            "sunrise_hour": 3,
-            "sunset_hour": 19,
-            "utc_offset": "-09:00"
-        }
+        timeprofile = copy.deepcopy(TIMEPROFILE)
+        consumption = copy.deepcopy(CONSUMPTION)
+        location_info = copy.deepcopy(LOCATION_INFO)
 
         expected_plumerise = {
             "2014-05-29T22:00:00": {
@@ -181,7 +194,7 @@ class TestFEPSPlumeRise(object):
         expected_consumption_file_contents = 'cons_flm=10.828416\ncons_sts=10.456737\ncons_lts=8.805207\ncons_duff=0.000000\nmoist_duff=100.000000\n'
 
         working_dir = tempfile.mkdtemp()
-        plume_file_content = 'hour, heat, smold_frac, plume_bot, plume_top\n0, 2082570545595.600342, 0.050000, 614.072536, 18160.408515\n1, 1110703180280.029053, 0.493334, 614.072536, 16164.954419\n2, 1110703180280.029053, 0.493334, 614.072536, 16156.323741\n'
+        plume_file_content = PLUME_FILE_CONTENT
         with open(os.path.join(working_dir, 'plume.txt'), 'w') as f:
             f.write(plume_file_content)
         # diurnal_file_contents = 'hour, temp, humid, wind_flame, modified_wind, stability, dif_temp_grad\n0, 15.270439, 74.657791, 6.000000, 5.364000, F, 0.025000\n1, 14.626840, 76.172140, 6.000000, 5.000000, F, 0.025000\n2, 14.165682, 77.257219, 6.000000, 5.000000, F, 0.025000\n3, 13.835248, 78.034711, 6.000000, 5.000000, F, 0.025000\n4, 13.000000, 80.000000, 6.000000, 5.000000, F, 0.025000\n5, 15.659386, 73.742621, 6.000000, 5.000000, B, -0.008000\n6, 18.253289, 67.639320, 6.000000, 5.000000, B, -0.008000\n7, 20.717838, 61.840380, 6.000000, 5.000000, B, -0.008000\n8, 22.992349, 56.488590, 6.000000, 5.000000, B, -0.008000\n9, 25.020815, 51.715729, 6.000000, 5.000000, B, -0.008000\n10, 26.753289, 47.639320, 6.000000, 5.000000, B, -0.008000\n11, 28.147111, 44.359739, 6.000000, 5.000000, B, -0.008000\n12, 29.167961, 41.957739, 6.000000, 5.000000, B, -0.008000\n13, 29.790702, 40.492466, 6.000000, 5.000000, B, -0.008000\n14, 30.000000, 40.000000, 6.000000, 5.000000, B, -0.008000\n15, 29.790702, 40.492466, 6.000000, 5.000000, B, -0.008000\n16, 29.167961, 41.957739, 6.000000, 5.000000, B, -0.008000\n17, 28.147111, 44.359739, 6.000000, 5.000000, B, -0.008000\n18, 26.753289, 47.639320, 6.000000, 5.000000, B, -0.008000\n19, 25.020815, 51.715729, 6.000000, 5.000000, B, -0.008000\n20, 21.613291, 59.733434, 6.000000, 5.000000, F, 0.025000\n21, 19.171692, 65.478371, 6.000000, 5.000000, F, 0.025000\n22, 17.422211, 69.594798, 6.000000, 5.000000, F, 0.025000\n23, 16.168653, 72.544347, 6.000000, 5.000000, F, 0.025000\n'
@@ -193,3 +206,452 @@ class TestFEPSPlumeRise(object):
         assert expected_weather_file_contents == open(os.path.join(working_dir, 'weather.txt'), 'r').read()
         assert expected_timeprofile_file_contents == open(os.path.join(working_dir, 'profile.txt'), 'r').read()
         assert expected_consumption_file_contents == open(os.path.join(working_dir, 'cons.txt'), 'r').read()
+
+
+def _plume_rows():
+    lines = PLUME_FILE_CONTENT.splitlines()
+    keys = [k.strip() for k in lines[0].split(',')]
+    return [dict(zip(keys, [float(v) for v in l.split(',')]))
+        for l in lines[1:]]
+
+def _binary_compute(monkeypatch, **config):
+    """Runs the binary engine, with the plume file pre-written"""
+    monkeypatch.setattr(subprocess, "check_output", lambda *args, **kwargs: None)
+    working_dir = tempfile.mkdtemp()
+    with open(os.path.join(working_dir, 'plume.txt'), 'w') as f:
+        f.write(PLUME_FILE_CONTENT)
+    return FEPSPlumeRise(**config).compute(copy.deepcopy(TIMEPROFILE),
+        copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO), working_dir)
+
+
+class TestFEPSPlumeRiseEngine(object):
+
+    def test_callable_engine(self, monkeypatch):
+        expected = _binary_compute(monkeypatch)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("shouldn't be called")
+        monkeypatch.setattr(subprocess, "check_output", fail)
+        monkeypatch.setattr(tempfile, "mkdtemp", fail)
+
+        calls = []
+        def engine(timeprofile, consumption, fire_location_info):
+            calls.append(fire_location_info)
+            return _plume_rows()
+
+        location_info = copy.deepcopy(LOCATION_INFO)
+        location_info.pop('moisture_duff')
+        actual = FEPSPlumeRise(engine=engine).compute(
+            copy.deepcopy(TIMEPROFILE), copy.deepcopy(CONSUMPTION),
+            location_info)
+        assert expected == actual
+        # defaults are filled in before the engine is called
+        assert calls[0]['moisture_duff'] == 100.0
+
+    def test_run_binaries_as_engine(self, monkeypatch):
+        expected = _binary_compute(monkeypatch)
+        working_dir = tempfile.mkdtemp()
+        with open(os.path.join(working_dir, 'plume.txt'), 'w') as f:
+            f.write(PLUME_FILE_CONTENT)
+        binaries = FEPSPlumeRise()
+        engine = lambda *args: binaries.run_binaries(*args,
+            working_dir=working_dir)
+        actual = FEPSPlumeRise(engine=engine).compute(
+            copy.deepcopy(TIMEPROFILE), copy.deepcopy(CONSUMPTION),
+            copy.deepcopy(LOCATION_INFO))
+        assert expected == actual
+
+    def test_compare_engines(self):
+        def reference(timeprofile, consumption, fire_location_info):
+            return _plume_rows()
+        def engine(timeprofile, consumption, fire_location_info):
+            return [dict(r, plume_bot=float(r['plume_bot']) + 1.0)
+                for r in _plume_rows()]
+
+        fires = [{'timeprofile': TIMEPROFILE, 'consumption': CONSUMPTION,
+            'fire_location_info': LOCATION_INFO}] * 2
+        comparison = compare_engines(engine, reference, fires)
+        assert comparison['n_fires'] == 2
+        assert comparison['columns']['plume_bot']['max_abs_error'] == 1.0
+        assert comparison['columns']['plume_top']['rmse'] == 0.0
+
+    def test_native_engine(self, monkeypatch):
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        def fail(*args, **kwargs):
+            raise RuntimeError("shouldn't be called")
+        monkeypatch.setattr(subprocess, "check_output", fail)
+        monkeypatch.setattr(tempfile, "mkdtemp", fail)
+
+        feps = FEPSPlumeRise(engine='native', result_cache=cache)
+        for i in range(2):
+            actual = feps.compute(copy.deepcopy(TIMEPROFILE),
+                copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO))
+            assert sorted(actual['hours']) == sorted(TIMEPROFILE)
+        assert (cache.hits, cache.misses) == (1, 1)
+        hour = actual['hours']["2014-05-29T23:00:00"]
+        assert abs(hour['heights'][0] - 614.072536) < 1e-3
+        assert abs(hour['smolder_fraction'] - 0.493334) < 1e-5
+
+    def test_unknown_engine(self):
+        with raises(Exception):
+            FEPSPlumeRise(engine='foo').compute(copy.deepcopy(TIMEPROFILE),
+                copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO))
+
+
+class TestFEPSPlumeRiseCopy(object):
+
+    def test_copy(self):
+        class SubclassedFEPSPlumeRise(FEPSPlumeRise):
+            pass
+        feps = SubclassedFEPSPlumeRise(num_layers=10)
+        copied = feps.copy(NUM_LAYERS=5, plume_top_behavior='briggs')
+        assert type(copied) is SubclassedFEPSPlumeRise
+        assert copied.config("NUM_LAYERS") == 5
+        assert copied.config("PLUME_TOP_BEHAVIOR") == 'briggs'
+        assert feps.config("NUM_LAYERS") == 10
+
+    def test_with_deadline(self):
+        feps = FEPSPlumeRise(num_layers=10)
+        with_deadline = feps.with_deadline(123.0)
+        assert with_deadline.config("DEADLINE") == 123.0
+        assert with_deadline.config("NUM_LAYERS") == 10
+        assert feps.config("DEADLINE") is None
+
+
+class TestFEPSPlumeRiseComputeMany(object):
+
+    def _fires(self, n):
+        fires = []
+        for i in range(n):
+            location_info = copy.deepcopy(LOCATION_INFO)
+            location_info['area'] = i
+            fires.append({
+                'timeprofile': copy.deepcopy(TIMEPROFILE),
+                'consumption': copy.deepcopy(CONSUMPTION),
+                'fire_location_info': location_info
+            })
+        return fires
+
+    def test_order_and_failures(self):
+        def engine(timeprofile, consumption, fire_location_info):
+            if fire_location_info['area'] == 3:
+                raise RuntimeError("bad fire")
+            rows = _plume_rows()
+            for r in rows:
+                r['plume_bot'] = fire_location_info['area']
+            return rows
+
+        results = list(FEPSPlumeRise(engine=engine).compute_many(
+            self._fires(10), max_workers=3))
+        assert [r[0] for r in results] == list(range(10))
+        for index, plume_rise, error in results:
+            if index == 3:
+                assert plume_rise is None
+                assert isinstance(error, RuntimeError)
+            else:
+                assert error is None
+                assert plume_rise['hours']["2014-05-29T22:00:00"]['heights'][0] == index
+
+    def test_unordered(self):
+        engine = lambda *args: _plume_rows()
+        results = list(FEPSPlumeRise(engine=engine).compute_many(
+            self._fires(10), max_workers=4, ordered=False))
+        assert sorted(r[0] for r in results) == list(range(10))
+
+    def test_processes_with_process_local_settings(self):
+        feps = FEPSPlumeRise(metrics=Metrics())
+        with raises(ValueError):
+            list(feps.compute_many(self._fires(2), use_processes=True))
+
+    def test_subprocess_timeout(self, monkeypatch):
+        calls = []
+        def check_output(args, timeout=None):
+            calls.append(timeout)
+            raise subprocess.TimeoutExpired(args, timeout)
+        monkeypatch.setattr(subprocess, "check_output", check_output)
+
+        results = list(FEPSPlumeRise(subprocess_timeout=5).compute_many(
+            self._fires(2), max_workers=2))
+        assert [type(r[2]) for r in results] == [subprocess.TimeoutExpired] * 2
+        assert calls == [5, 5]
+
+    def test_deadline(self, monkeypatch):
+        calls = []
+        def check_output(args, timeout=None):
+            calls.append(timeout)
+            raise subprocess.TimeoutExpired(args, timeout)
+        monkeypatch.setattr(subprocess, "check_output", check_output)
+
+        # time left is less than SUBPROCESS_TIMEOUT
+        feps = FEPSPlumeRise(subprocess_timeout=5,
+            deadline=time.monotonic() + 2)
+        results = list(feps.compute_many(self._fires(1)))
+        assert type(results[0][2]) == subprocess.TimeoutExpired
+        assert len(calls) == 1 and 1 < calls[0] <= 2
+
+        # passed; binaries aren't run
+        feps = FEPSPlumeRise(deadline=time.monotonic() - 1)
+        results = list(feps.compute_many(self._fires(1)))
+        assert type(results[0][2]) == subprocess.TimeoutExpired
+        assert len(calls) == 1
+
+
+class TestFEPSPlumeRiseDiurnalCache(object):
+
+    def test_reuses_diurnal_output(self, monkeypatch):
+        calls = []
+        def check_output(args):
+            calls.append(args[0])
+            if args[0] == 'feps_weather':
+                with open(args[args.index('-o') + 1], 'w') as f:
+                    f.write('diurnal')
+            else:
+                with open(args[args.index('-o') + 1], 'w') as f:
+                    f.write(PLUME_FILE_CONTENT)
+        monkeypatch.setattr(subprocess, "check_output", check_output)
+
+        feps = FEPSPlumeRise(diurnal_cache=DiurnalCache())
+        results = []
+        for area in (100, 200):
+            working_dir = tempfile.mkdtemp()
+            location_info = copy.deepcopy(LOCATION_INFO)
+            location_info['area'] = area
+            results.append(feps.compute(copy.deepcopy(TIMEPROFILE),
+                copy.deepcopy(CONSUMPTION), location_info, working_dir))
+            with open(os.path.join(working_dir, 'diurnal.txt')) as f:
+                assert f.read() == 'diurnal'
+
+        assert calls == ['feps_weather', 'feps_plumerise', 'feps_plumerise']
+        assert results[0] == results[1]
+
+
+class TestFEPSPlumeRiseResultCache(object):
+
+    def test_cache(self):
+        calls = []
+        def make_engine(plume_top, cache_key=None):
+            def engine(*args):
+                calls.append(1)
+                return [dict(row, plume_top=plume_top)
+                    for row in _plume_rows()]
+            if cache_key:
+                engine.cache_key = cache_key
+            return engine
+
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        engine = make_engine(1000.0, cache_key=['engine', 1000.0])
+        feps = FEPSPlumeRise(engine=engine, result_cache=cache)
+        args = (TIMEPROFILE, CONSUMPTION, LOCATION_INFO)
+        first = feps.compute(*copy.deepcopy(args))
+        assert first == feps.compute(*copy.deepcopy(args))
+        assert len(calls) == 1
+
+        # different config
+        FEPSPlumeRise(engine=engine, result_cache=cache,
+            plume_top_behavior='feps').compute(*copy.deepcopy(args))
+        assert len(calls) == 2
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 2
+
+        # another engine from the same factory
+        other = FEPSPlumeRise(engine=make_engine(5000.0,
+            cache_key=['engine', 5000.0]), result_cache=cache).compute(
+            *copy.deepcopy(args))
+        assert len(calls) == 3
+        assert other['hours']["2014-05-29T22:00:00"]['heights'][-1] == 5000.0
+
+        # engines without cache_key aren't cached
+        feps = FEPSPlumeRise(engine=make_engine(1000.0), result_cache=cache)
+        feps.compute(*copy.deepcopy(args))
+        feps.compute(*copy.deepcopy(args))
+        assert len(calls) == 5
+        assert cache.stats()['misses'] == 3
+
+    def test_cache_datetime_timeprofile(self):
+        engine = lambda *args: _plume_rows()
+        engine.cache_key = 'engine'
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        timeprofile = {datetime.datetime.strptime(dt, '%Y-%m-%dT%H:%M:%S'): h
+            for dt, h in TIMEPROFILE.items()}
+        feps = FEPSPlumeRise(engine=engine, result_cache=cache)
+        args = (timeprofile, CONSUMPTION, LOCATION_INFO)
+        miss = feps.compute(*copy.deepcopy(args))
+        assert feps.compute(*copy.deepcopy(args)) == miss
+        assert sorted(miss['hours']) == sorted(timeprofile)
+        assert cache.stats()['hits'] == 1
+
+    def test_run_binaries_engine_key(self, tmp_path):
+        binaries = []
+        for name in ('a', 'b'):
+            binary = tmp_path / name
+            binary.write_text(name)
+            binaries.append(str(binary))
+        keys = [engine_cache_key(FEPSPlumeRise(feps_plumerise_binary=b,
+            ).run_binaries) for b in binaries]
+        assert keys[0] and keys[1] and keys[0] != keys[1]
+        assert engine_cache_key(lambda *args: None) is None
+
+
+class TestFEPSPlumeRiseWorkingDirs(object):
+
+    def _mock_binaries(self, monkeypatch, fail=False):
+        inputs = {}
+        def check_output(args):
+            if args[0] == 'feps_plumerise':
+                if fail:
+                    raise subprocess.CalledProcessError(1, args)
+                for flag in ('-p', '-c'):
+                    filename = args[args.index(flag) + 1]
+                    inputs[flag] = (os.path.exists(filename) and
+                        not os.path.isfile(filename))
+                    with open(filename) as f:
+                        inputs[flag + 'content'] = f.read()
+                with open(args[args.index('-o') + 1], 'w') as f:
+                    f.write(PLUME_FILE_CONTENT)
+        monkeypatch.setattr(subprocess, "check_output", check_output)
+        return inputs
+
+    def test_manager(self, monkeypatch):
+        expected = _binary_compute(monkeypatch)
+        self._mock_binaries(monkeypatch)
+        root = tempfile.mkdtemp()
+        feps = FEPSPlumeRise(working_dir_manager=WorkingDirManager(root=root))
+        actual = feps.compute(copy.deepcopy(TIMEPROFILE),
+            copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO))
+        assert expected == actual
+        assert os.listdir(root) == []
+
+    def test_named_pipes(self, monkeypatch):
+        expected = _binary_compute(monkeypatch)
+        inputs = self._mock_binaries(monkeypatch)
+        actual = FEPSPlumeRise(use_named_pipes=True).compute(
+            copy.deepcopy(TIMEPROFILE), copy.deepcopy(CONSUMPTION),
+            copy.deepcopy(LOCATION_INFO), tempfile.mkdtemp())
+        assert expected == actual
+        assert inputs['-p'] and inputs['-c']
+        assert inputs['-ccontent'] == 'cons_flm=10.828416\ncons_sts=10.456737\ncons_lts=8.805207\ncons_duff=0.000000\nmoist_duff=100.000000\n'
+
+    def test_named_pipes_failure(self, monkeypatch):
+        self._mock_binaries(monkeypatch, fail=True)
+        with raises(subprocess.CalledProcessError):
+            FEPSPlumeRise(use_named_pipes=True).compute(
+                copy.deepcopy(TIMEPROFILE), copy.deepcopy(CONSUMPTION),
+                copy.deepcopy(LOCATION_INFO), tempfile.mkdtemp())
+
+
+class TestFEPSPlumeRiseAsync(object):
+
+    def _binaries(self, tmp_path, plumerise_sleep=0):
+        """Writes stand-in feps_weather and feps_plumerise executables"""
+
+        weather = tmp_path / 'feps_weather'
+        weather.write_text("#!{}\nimport sys\n"
+            "open(sys.argv[sys.argv.index('-o') + 1], 'w').write('diurnal')\n"
+            .format(sys.executable))
+        plumerise = tmp_path / 'feps_plumerise'
+        plumerise.write_text("#!{}\nimport sys, time\ntime.sleep({})\n"
+            "open(sys.argv[sys.argv.index('-o') + 1], 'w').write({!r})\n"
+            .format(sys.executable, plumerise_sleep, PLUME_FILE_CONTENT))
+        for f in (weather, plumerise):
+            f.chmod(0o755)
+        return dict(feps_weather_binary=str(weather),
+            feps_plumerise_binary=str(plumerise))
+
+    def test_compute_async(self, monkeypatch, tmp_path):
+        expected = _binary_compute(monkeypatch)
+        monkeypatch.undo()
+
+        feps = FEPSPlumeRise(**self._binaries(tmp_path))
+        working_dir = tempfile.mkdtemp()
+        actual = asyncio.run(feps.compute_async(copy.deepcopy(TIMEPROFILE),
+            copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO),
+            working_dir))
+        assert expected == actual
+        with open(os.path.join(working_dir, 'profile.txt')) as f:
+            assert f.read() == 'hour, area_fract, flame, smolder, residual\n0, 0.333333, 0.333333, 0.333333, 0.333333\n1, 0.333333, 0.333333, 0.333333, 0.333333\n2, 0.333333, 0.333333, 0.333333, 0.333333\n'
+
+    def test_compute_many_async(self, tmp_path):
+        fires = [{
+            'timeprofile': copy.deepcopy(TIMEPROFILE),
+            'consumption': copy.deepcopy(CONSUMPTION),
+            'fire_location_info': copy.deepcopy(LOCATION_INFO)
+        } for i in range(4)]
+        fires[2]['consumption'] = None
+
+        feps = FEPSPlumeRise(**self._binaries(tmp_path))
+        results = asyncio.run(feps.compute_many_async(fires,
+            max_concurrency=2))
+        assert [r[0] for r in results] == [0, 1, 2, 3]
+        assert [r[1] is None for r in results] == [False, False, True, False]
+        assert isinstance(results[2][2], TypeError)
+
+    def test_subprocess_timeout(self, tmp_path):
+        feps = FEPSPlumeRise(subprocess_timeout=0.2,
+            **self._binaries(tmp_path, plumerise_sleep=30))
+        with raises(subprocess.TimeoutExpired):
+            asyncio.run(feps.compute_async(copy.deepcopy(TIMEPROFILE),
+                copy.deepcopy(CONSUMPTION), copy.deepcopy(LOCATION_INFO)))
+
+
+class TestFEPSPlumeRiseResultType(object):
+
+    def test_array(self, monkeypatch):
+        expected = _binary_compute(monkeypatch)
+        actual = _binary_compute(monkeypatch, result_type='array')
+        assert actual.plume_bottom.tolist() == [614.072536] * 3
+        assert expected == actual.to_dict()
+
+    def test_array_cached(self, monkeypatch):
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        expected = _binary_compute(monkeypatch, result_type='array',
+            result_cache=cache).to_dict()
+        assert expected == _binary_compute(monkeypatch, result_type='array',
+            result_cache=cache).to_dict()
+        assert cache.stats()['hits'] == 1
+
+
+
+class TestFEPSPlumeRiseReadPlumerise(object):
+
+    PLUME_FILE_CONTENT = ('hour, heat, smold_frac, plume_bot, plume_top\n'
+        '0, 0.000000, 0.050000, 614.072536, 18160.408515\n'
+        '1, 1110703180280.029053, 0.493334, 614.072536, 16164.954419\n'
+        '2, 1110703180280.029053, 0.493334, 614.072536, 300.500000\n')
+
+    def _read(self, behavior, content=None):
+        filename = os.path.join(tempfile.mkdtemp(), 'plume.txt')
+        with open(filename, 'w') as f:
+            f.write(self.PLUME_FILE_CONTENT if content is None else content)
+        timestamps = sorted(TIMEPROFILE.keys())
+        plume_rise = FEPSPlumeRise(plume_top_behavior=behavior,
+            result_type='array')._read_plumerise(filename, timestamps)
+        return plume_rise.plume_bottom.tolist(), plume_rise.plume_top.tolist()
+
+    def test_plume_top_behavior(self):
+        assert self._read('briggs') == ([0.0, 614.072536, 614.072536],
+            [0.0, 16164.954419, 300.5])
+        assert self._read('FEPS') == ([0.0, 614.072536, 614.072536],
+            [0.0, 1228.145072, 1228.145072])
+        assert self._read('auto') == ([0.0, 614.072536, 614.072536],
+            [0.0, 16164.954419, 1228.145072])
+        with raises(Exception):
+            self._read('foo')
+
+    def test_empty(self):
+        assert self._read('auto', self.PLUME_FILE_CONTENT.splitlines()[0]
+            + '\n') == ([], [])
+        assert self._read('auto', '') == ([], [])
+
+class TestFEPSPlumeRiseMetrics(object):
+
+    def test_metrics(self, monkeypatch):
+        metrics = Metrics()
+        _binary_compute(monkeypatch, metrics=metrics)
+        d = metrics.as_dict()
+        assert set(d['phases']) == set(['compute', 'write_inputs',
+            'feps_weather', 'feps_plumerise', 'read_plumerise'])
+        assert d['phases']['write_inputs']['count'] == 2
+        assert d['totals']['hours'] == 3
+        assert d['totals']['bytes_read'] == len(PLUME_FILE_CONTENT)
+        # weather, profile, and consumption files
+        assert d['totals']['bytes_written'] == 212 + 164 + 98
@@ -0,0 +1,85 @@
+__author__      = "Joel Dubowy"
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import pytest
+from pytest import raises
+
+from plumerise.met import LocalMet
+
+LOCAL_MET = {
+    "2014-05-29T01:00:00": {
+        "HGTS": [60.2, 129.3, 230.3],
+        "RELH": [28.0, 22.0, 18.2],
+        "TPOT": [293.5, 295.9, 296.9],
+        "HPBL": 275.0
+    },
+    "2014-05-29T00:00:00": {
+        "HGTS": [59.2, 127.3, 230.3],
+        "RELH": [28.0, 22.0, 18.2],
+        "TPOT": [293.4, 295.6, 296.9],
+        "PBLH": 255.0
+    },
+    "2014-05-29T02:00:00": {
+        "HGTS": [59.2, 127.3, 230.3],
+        "TPOT": [293.4, 295.6, 296.9],
+        "PBLH": 255.0
+    }
+}
+
+
+class TestLocalMet(object):
+
+    def test_from_dict(self):
+        met = LocalMet.from_dict(LOCAL_MET)
+        assert len(met) == 3
+        assert_array_equal(met.timestamps, ["2014-05-29T00:00:00",
+            "2014-05-29T01:00:00", "2014-05-29T02:00:00"])
+        assert_array_equal(met.height_abl, [255.0, 275.0, 255.0])
+        assert_array_equal(met.height[1], [60.2, 129.3])
+        assert_array_equal(met.potential_temperature[0], [293.4, 295.6])
+        # no RELH
+        assert_array_equal(met.valid, [True, True, False])
+
+    def test_timestamps_kept_as_given(self, tmp_path):
+        local_met = {dt.replace(':00:00', ':00:00Z'): v
+            for dt, v in LOCAL_MET.items()}
+        met = LocalMet.from_dict(local_met)
+        expected = sorted(local_met.keys())
+        assert met.timestamps.tolist() == expected
+        assert met.digest != LocalMet.from_dict(LOCAL_MET).digest
+
+        met.save(str(tmp_path / 'met.npz'))
+        assert (LocalMet.load(str(tmp_path / 'met.npz')).timestamps.tolist()
+            == expected)
+
+        # datetimes
+        met = LocalMet(met.times, met.height_abl, met.height,
+            met.potential_temperature)
+        assert met.timestamps.tolist() == sorted(LOCAL_MET.keys())
+
+    def test_npz(self, tmp_path):
+        met = LocalMet.from_dict(LOCAL_MET)
+        filename = str(tmp_path / 'met.npz')
+        met.save(filename)
+        loaded = LocalMet.load(filename)
+        assert loaded.digest == met.digest
+        assert loaded.times.dtype == np.dtype('datetime64[s]')
+
+    def test_hdf5(self, tmp_path):
+        pytest.importorskip('h5py')
+        met = LocalMet.from_dict(LOCAL_MET)
+        filename = str(tmp_path / 'met.h5')
+        met.save_hdf5(filename, group='fire1')
+        assert LocalMet.load_hdf5(filename, group='fire1').digest == met.digest
+
+        # timestamps as given
+        met = LocalMet.from_dict({dt + 'Z': v for dt, v in LOCAL_MET.items()})
+        met.save_hdf5(filename, group='fire2')
+        loaded = LocalMet.load_hdf5(filename, group='fire2')
+        assert loaded.timestamps.tolist() == met.timestamps.tolist()
+        assert loaded.timestamps[0].endswith('Z')
+
+    def test_invalid_shapes(self):
+        with raises(ValueError):
+            LocalMet(["2014-05-29T00:00:00"], [255.0], [[59.2]], [[293.4]])
@@ -0,0 +1,66 @@
+__author__      = "Joel Dubowy"
+
+import subprocess
+import sys
+
+from pytest import raises
+
+from plumerise.metrics import Metrics, NULL_METRICS
+
+
+class TestMetrics(object):
+
+    def test_phases_and_totals(self):
+        recorded = []
+        metrics = Metrics(callback=lambda p, t: recorded.append(p))
+        for i in range(2):
+            with metrics.phase('a'):
+                pass
+        metrics.add('hours', 3)
+        metrics.add('hours', 2)
+
+        d = metrics.as_dict()
+        assert d['phases']['a']['count'] == 2
+        assert d['phases']['a']['wall_time'] >= 0
+        assert d['totals'] == {'hours': 5}
+        assert recorded == ['a', 'a']
+
+    def test_child_process(self):
+        metrics = Metrics()
+        with metrics.child_process('python'):
+            subprocess.check_output([sys.executable, '-c',
+                'sum(range(1000000))'])
+        d = metrics.as_dict()
+        assert d['phases']['python']['count'] == 1
+        assert d['totals']['child_user_time'] + d['totals']['child_system_time'] > 0
+        assert d['totals']['child_max_rss'] > 0
+
+    def test_failed_child_process(self):
+        metrics = Metrics()
+        with raises(subprocess.CalledProcessError):
+            with metrics.child_process('python'):
+                subprocess.check_output([sys.executable, '-c',
+                    'sum(range(1000000)); raise SystemExit(1)'])
+        d = metrics.as_dict()
+        assert d['totals']['child_user_time'] + d['totals']['child_system_time'] > 0
+        assert d['totals']['child_max_rss'] > 0
+
+    def test_merge(self):
+        a = Metrics()
+        b = Metrics()
+        with a.phase('x'):
+            pass
+        with b.phase('x'):
+            pass
+        a.add('bytes_read', 10)
+        b.add('bytes_read', 5)
+        b.totals['child_max_rss'] = 7
+        d = a.merge(b).as_dict()
+        assert d['phases']['x']['count'] == 2
+        assert d['totals']['bytes_read'] == 15
+        assert d['totals']['child_max_rss'] == 7
+
+    def test_null_metrics(self):
+        with NULL_METRICS.phase('a'):
+            with NULL_METRICS.child_process('b'):
+                NULL_METRICS.add('hours', 1)
@@ -0,0 +1,74 @@
+__author__      = "Joel Dubowy"
+
+import copy
+import csv
+import io
+
+from pytest import raises
+
+from plumerise.feps import compare_engines
+from plumerise.native import NativeEngine
+from test_feps import (CONSUMPTION, LOCATION_INFO, PLUME_FILE_CONTENT,
+    TIMEPROFILE)
+
+# feps_weather output for LOCATION_INFO
+DIURNAL_FILE_CONTENT = 'hour, temp, humid, wind_flame, modified_wind, stability, dif_temp_grad\n0, 15.270439, 74.657791, 6.000000, 5.364000, F, 0.025000\n1, 14.626840, 76.172140, 6.000000, 5.000000, F, 0.025000\n2, 14.165682, 77.257219, 6.000000, 5.000000, F, 0.025000\n3, 13.835248, 78.034711, 6.000000, 5.000000, F, 0.025000\n4, 13.000000, 80.000000, 6.000000, 5.000000, F, 0.025000\n5, 15.659386, 73.742621, 6.000000, 5.000000, B, -0.008000\n6, 18.253289, 67.639320, 6.000000, 5.000000, B, -0.008000\n7, 20.717838, 61.840380, 6.000000, 5.000000, B, -0.008000\n8, 22.992349, 56.488590, 6.000000, 5.000000, B, -0.008000\n9, 25.020815, 51.715729, 6.000000, 5.000000, B, -0.008000\n10, 26.753289, 47.639320, 6.000000, 5.000000, B, -0.008000\n11, 28.147111, 44.359739, 6.000000, 5.000000, B, -0.008000\n12, 29.167961, 41.957739, 6.000000, 5.000000, B, -0.008000\n13, 29.790702, 40.492466, 6.000000, 5.000000, B, -0.008000\n14, 30.000000, 40.000000, 6.000000, 5.000000, B, -0.008000\n15, 29.790702, 40.492466, 6.000000, 5.000000, B, -0.008000\n16, 29.167961, 41.957739, 6.000000, 5.000000, B, -0.008000\n17, 28.147111, 44.359739, 6.000000, 5.000000, B, -0.008000\n18, 26.753289, 47.639320, 6.000000, 5.000000, B, -0.008000\n19, 25.020815, 51.715729, 6.000000, 5.000000, B, -0.008000\n20, 21.613291, 59.733434, 6.000000, 5.000000, F, 0.025000\n21, 19.171692, 65.478371, 6.000000, 5.000000, F, 0.025000\n22, 17.422211, 69.594798, 6.000000, 5.000000, F, 0.025000\n23, 16.168653, 72.544347, 6.000000, 5.000000, F, 0.025000\n'
+
+
+def _rows(content):
+    return list(csv.DictReader(io.StringIO(content), skipinitialspace=True))
+
+
+class TestNativeEngineDiurnal(object):
+
+    def test_matches_feps_weather(self):
+        diurnal = NativeEngine().diurnal(LOCATION_INFO)
+        for row in _rows(DIURNAL_FILE_CONTENT):
+            h = int(row['hour'])
+            for k in ('temp', 'humid', 'wind_flame', 'dif_temp_grad'):
+                assert abs(diurnal[k][h] - float(row[k])) < 1e-6
+            assert diurnal['stability'][h] == row['stability']
+            if h > 0:
+                # feps_weather's midnight value isn't reproduced
+                assert diurnal['modified_wind'][h] == float(
+                    row['modified_wind'])
+
+    def test_hours_out_of_order(self):
+        with raises(ValueError):
+            NativeEngine().diurnal(dict(LOCATION_INFO, max_temp_hour=3))
+
+
+class TestNativeEngine(object):
+
+    def test_compare_with_binaries(self):
+        reference = lambda *args: _rows(PLUME_FILE_CONTENT)
+        fire = {
+            'timeprofile': copy.deepcopy(TIMEPROFILE),
+            'consumption': copy.deepcopy(CONSUMPTION),
+            'fire_location_info': copy.deepcopy(LOCATION_INFO)
+        }
+        columns = compare_engines(NativeEngine(), reference, [fire])['columns']
+        assert columns['heat']['max_abs_error'] < 1e-5 * 2.1e12
+        assert columns['smold_frac']['max_abs_error'] < 1e-5
+        assert columns['plume_bot']['max_abs_error'] < 1e-3
+        # off by 10% in the first hour, and by 0.1 m after
+        assert columns['plume_top']['max_abs_error'] < 0.1 * 18160
+        assert columns['plume_top']['mean_abs_error'] < 0.04 * 18160
+
+    def test_rows(self):
+        rows = NativeEngine()(copy.deepcopy(TIMEPROFILE), CONSUMPTION,
+            LOCATION_INFO)
+        assert [r['hour'] for r in rows] == [0, 1, 2]
+        assert set(rows[0]) == set(['hour', 'heat', 'smold_frac',
+            'plume_bot', 'plume_top'])
+
+    def test_no_consumption(self):
+        consumption = dict((k, 0.0) for k in CONSUMPTION)
+        rows = NativeEngine()(copy.deepcopy(TIMEPROFILE), consumption,
+            LOCATION_INFO)
+        assert [r['heat'] for r in rows] == [0.0, 0.0, 0.0]
+
+    def test_cache_key(self):
+        assert NativeEngine().cache_key == NativeEngine().cache_key
+        assert NativeEngine().cache_key != NativeEngine(
+            heat_per_ton=1e9).cache_key
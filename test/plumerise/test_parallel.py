@@ -0,0 +1,94 @@
+"""test_parallel.py
+"""
+
+__author__      = "Joel Dubowy"
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+import pytest
+from pytest import raises
+
+from plumerise.met import LocalMet
+from plumerise.parallel import ParallelSEV
+from plumerise.sev import SEVPlumeRise
+
+
+def _met_arrays(n_fires, n_hours, seed=0):
+    rng = np.random.RandomState(seed)
+    height_abl = rng.uniform(100, 2000, (n_fires, n_hours))
+    height = np.stack([rng.uniform(20, 80, (n_fires, n_hours)),
+        rng.uniform(100, 200, (n_fires, n_hours))], axis=-1)
+    potential_temperature = np.stack([rng.uniform(280, 300, (n_fires, n_hours)),
+        rng.uniform(300, 310, (n_fires, n_hours))], axis=-1)
+    return height_abl, potential_temperature, height
+
+
+@pytest.fixture(scope='module')
+def parallel_sev():
+    with ParallelSEV(SEVPlumeRise(alpha=0.3), processes=2) as p:
+        yield p
+
+
+class TestParallelSEV(object):
+
+    def test_matches_compute_batch(self, parallel_sev):
+        height_abl, potential_temperature, height = _met_arrays(37, 5)
+        frp = np.linspace(-1.0, 1.0e8, 37).reshape(37, 1)
+
+        expected = SEVPlumeRise(alpha=0.3).compute_batch(height_abl,
+            potential_temperature, height, frp=frp, smolder_fraction=0.2)
+        result = parallel_sev.compute_batch(height_abl,
+            potential_temperature, height, frp=frp, smolder_fraction=0.2)
+        for k in ('plume_top_meters', 'plume_bottom_meters',
+                'smolder_fraction'):
+            assert_allclose(result[k], expected[k], rtol=1e-12)
+
+    def test_fire_area(self, parallel_sev):
+        height_abl, potential_temperature, height = _met_arrays(3, 2, seed=1)
+        expected = SEVPlumeRise(alpha=0.3).compute_batch(height_abl,
+            potential_temperature, height, fire_area=200)
+        result = parallel_sev.compute_batch(height_abl,
+            potential_temperature, height, fire_area=200)
+        assert_allclose(result['plume_top_meters'],
+            expected['plume_top_meters'], rtol=1e-12)
+
+        with raises(ValueError):
+            parallel_sev.compute_batch(height_abl, potential_temperature,
+                height)
+
+    def test_compute_local_mets(self, parallel_sev):
+        height_abl, potential_temperature, height = _met_arrays(4, 3, seed=2)
+        times = ["2014-05-29T00:00:00", "2014-05-29T01:00:00",
+            "2014-05-29T02:00:00"]
+        local_mets = [LocalMet(times, height_abl[i], height[i],
+            potential_temperature[i], valid=[True, i != 1, True])
+            for i in range(4)]
+        result = parallel_sev.compute_local_mets(local_mets, fire_area=100)
+
+        sev = SEVPlumeRise(alpha=0.3, result_type='array')
+        for i, m in enumerate(local_mets):
+            expected = sev.compute(m, 100)
+            top = result['plume_top_meters'][i]
+            assert_allclose(top[m.valid], expected.plume_top, rtol=1e-12)
+            assert np.isnan(top[~m.valid]).all()
+        assert_array_equal(result['timestamps'], times)
+
+        # per-fire areas and smolder fractions, with n_fires == n_hours
+        local_mets = local_mets[:3]
+        result = parallel_sev.compute_local_mets(local_mets,
+            fire_area=[10, 200, 3000], smolder_fraction=[0.1, 0.2, 0.3])
+        for i, (m, area, sf) in enumerate(zip(local_mets, [10, 200, 3000],
+                [0.1, 0.2, 0.3])):
+            expected = sev.compute(m, area, smolder_fraction=sf)
+            assert_allclose(result['plume_top_meters'][i][m.valid],
+                expected.plume_top, rtol=1e-12)
+            assert_allclose(result['smolder_fraction'][i][m.valid],
+                expected.smolder_fraction)
+        with raises(ValueError):
+            parallel_sev.compute_local_mets(local_mets, fire_area=[10, 200])
+
+        other = LocalMet(times[:2], height_abl[0, :2], height[0, :2],
+            potential_temperature[0, :2])
+        with raises(ValueError):
+            parallel_sev.compute_local_mets([local_mets[0], other],
+                fire_area=100)
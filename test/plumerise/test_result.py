@@ -0,0 +1,69 @@
+__author__      = "Joel Dubowy"
+
+import math
+import warnings
+
+import numpy as np
+from pytest import raises
+
+from plumerise import compute_plumerise_hour
+from plumerise.result import PlumeRiseResult, make_result
+
+
+TIMESTAMPS = ["2014-05-29T22:00:00", "2014-05-29T23:00:00"]
+BOTTOMS = [614.072536, 36.64500890444568]
+TOPS = [18160.408515, 73.29001780889136]
+SMOLDER_FRACTIONS = [0.05, 0.493334]
+
+
+class TestPlumeRiseResult(object):
+
+    def test_to_dict(self):
+        result = PlumeRiseResult(TIMESTAMPS, BOTTOMS, TOPS, SMOLDER_FRACTIONS)
+        expected = {'hours': {dt: compute_plumerise_hour(sf, top, bottom)
+            for dt, bottom, top, sf in zip(TIMESTAMPS, BOTTOMS, TOPS,
+                SMOLDER_FRACTIONS)}}
+        assert expected == result.to_dict()
+        assert expected == make_result('dict', TIMESTAMPS, BOTTOMS, TOPS,
+            SMOLDER_FRACTIONS)
+
+    def test_layers(self):
+        result = PlumeRiseResult(TIMESTAMPS, BOTTOMS, TOPS, SMOLDER_FRACTIONS)
+        assert result.heights.shape == (2, 21)
+        assert result.heights[1].tolist() == compute_plumerise_hour(
+            0.0, TOPS[1], BOTTOMS[1])['heights']
+        assert result.emission_fractions.shape == (2, 20)
+        assert result.emission_fractions[0].tolist() == [0.05] * 20
+        assert result.datetimes[0] == np.datetime64("2014-05-29T22:00:00")
+
+        result = PlumeRiseResult(TIMESTAMPS, BOTTOMS, TOPS, SMOLDER_FRACTIONS,
+            num_layers=4)
+        assert result.heights.shape == (2, 5)
+        assert result.to_dict()['hours'][TIMESTAMPS[0]]['emission_fractions'] == [0.25] * 4
+
+    def test_zoned_timestamps(self):
+        timestamps = ["2014-05-29T22:00:00Z", "2014-05-29T22:00:00-09:00",
+            "2014-05-30T03:30:00+0530"]
+        result = PlumeRiseResult(timestamps, BOTTOMS + BOTTOMS[:1],
+            TOPS + TOPS[:1], SMOLDER_FRACTIONS + SMOLDER_FRACTIONS[:1])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            datetimes = result.datetimes
+        assert datetimes.tolist() == np.array(["2014-05-29T22:00:00",
+            "2014-05-30T07:00:00", "2014-05-29T22:00:00"],
+            dtype='datetime64[s]').tolist()
+
+    def test_no_plume(self):
+        result = PlumeRiseResult(TIMESTAMPS[:1], [math.nan], [math.nan], [0.1])
+        assert result.to_dict() == {'hours': {TIMESTAMPS[0]: {'smolder_fraction': 0.1}}}
+
+    def test_round_trips(self):
+        result = PlumeRiseResult(TIMESTAMPS, BOTTOMS, TOPS, SMOLDER_FRACTIONS)
+        assert PlumeRiseResult.from_columns(result.to_columns()).to_dict() == result.to_dict()
+        from_dict = PlumeRiseResult.from_dict(result.to_dict())
+        assert from_dict.plume_bottom.tolist() == BOTTOMS
+        assert from_dict.smolder_fraction.tolist() == SMOLDER_FRACTIONS
+
+    def test_unknown_type(self):
+        with raises(Exception):
+            make_result('foo', TIMESTAMPS, BOTTOMS, TOPS, SMOLDER_FRACTIONS)
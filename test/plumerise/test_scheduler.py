@@ -0,0 +1,116 @@
+"""test_scheduler.py
+"""
+
+__author__      = "Joel Dubowy"
+
+import sys
+import time
+
+from fixtures import make_fire, make_local_met
+from plumerise.feps import FEPSPlumeRise
+from plumerise.scheduler import DeadlineScheduler
+from plumerise.sev import SEVPlumeRise
+
+
+def _fire(area):
+    return make_fire(area, local_met=make_local_met(3))
+
+def _feps(seconds):
+    def engine(timeprofile, consumption, fire_location_info):
+        time.sleep(seconds)
+        return [{"heat": 1.0e9, "smold_frac": 0.1, "plume_bot": 100.0,
+            "plume_top": 1000.0} for dt in timeprofile]
+    return FEPSPlumeRise(engine=engine)
+
+
+class TestDeadlineScheduler(object):
+
+    def test_within_budget(self):
+        fires = [_fire(a) for a in (100, 300, 200)]
+        scheduler = DeadlineScheduler(_feps(0.01), SEVPlumeRise(), 10.0,
+            max_workers=2, feps_cost=0.01)
+        results = sorted(scheduler.compute_many(fires), key=lambda r: r[0])
+
+        assert [r[0] for r in results] == [0, 1, 2]
+        assert all(r[1] == 'feps' and r[3] is None for r in results)
+        assert results[0][2]['hours']["2014-05-29T00:00:00"]['heights'][-1] == 1000.0
+        assert scheduler.stats['feps'] == 3
+        assert scheduler.stats['degraded_after'] is None
+
+    def test_degrades_to_sev(self):
+        areas = [10, 60, 20, 50, 30, 40]
+        fires = [_fire(a) for a in areas]
+        sev = SEVPlumeRise()
+        scheduler = DeadlineScheduler(_feps(0.2), sev, 0.5, max_workers=1,
+            feps_cost=0.2)
+        t = time.monotonic()
+        results = list(scheduler.compute_many(fires))
+        elapsed = time.monotonic() - t
+
+        assert elapsed < 0.5
+        assert sorted(r[0] for r in results) == list(range(6))
+        assert all(r[3] is None for r in results)
+        models = {areas[r[0]]: r[1] for r in results}
+        # largest fires first
+        assert models == {60: 'feps', 50: 'feps', 40: 'sev', 30: 'sev',
+            20: 'sev', 10: 'sev'}
+        assert scheduler.stats['feps'] == 2
+        assert scheduler.stats['sev'] == 4
+        assert scheduler.stats['degraded_after'] is not None
+        i = areas.index(10)
+        expected = sev.compute(fires[i]["local_met"], 10)
+        assert [r[2] for r in results if r[0] == i] == [expected]
+
+    def test_costs_observed(self):
+        scheduler = DeadlineScheduler(_feps(0.05), SEVPlumeRise(), 10.0,
+            max_workers=1, feps_cost=1.0)
+        list(scheduler.compute_many([_fire(a) for a in (10, 20, 30)]))
+        assert 0.05 < scheduler.costs['feps'] < 1.0
+
+    def test_error(self):
+        def engine(timeprofile, consumption, fire_location_info):
+            raise RuntimeError("failed")
+        scheduler = DeadlineScheduler(FEPSPlumeRise(engine=engine),
+            SEVPlumeRise(), 10.0, feps_cost=0.01)
+        results = list(scheduler.compute_many([_fire(10)]))
+        assert len(results) == 1
+        assert results[0][:3] == (0, 'feps', None)
+        assert isinstance(results[0][3], RuntimeError)
+
+    def test_binaries_meet_deadline(self, tmp_path):
+        # each binary alone fits in the budget, but not both
+        binaries = {}
+        for name in ('feps_weather', 'feps_plumerise'):
+            binary = tmp_path / name
+            binary.write_text("#!{}\nimport time\ntime.sleep(1)\n".format(
+                sys.executable))
+            binary.chmod(0o755)
+            binaries[name + '_binary'] = str(binary)
+        feps = FEPSPlumeRise(subprocess_timeout=10, **binaries)
+        scheduler = DeadlineScheduler(feps, SEVPlumeRise(), 1.5,
+            max_workers=2, feps_cost=1.0)
+
+        t = time.monotonic()
+        results = list(scheduler.compute_many([_fire(10), _fire(20)]))
+        elapsed = time.monotonic() - t
+
+        assert elapsed < 1.5
+        assert sorted(r[0] for r in results) == [0, 1]
+        assert all(r[1] == 'sev' and r[3] is None for r in results)
+        assert scheduler.stats['feps_timeouts'] == 2
+        # time spent waiting on the timeouts is observed
+        assert scheduler.costs['feps'] > 1.0
+
+    def test_feps_subclass(self):
+        class SubclassedFEPSPlumeRise(FEPSPlumeRise):
+            def compute(self, *args, **kwargs):
+                computed.append(self.config("DEADLINE"))
+                return super(SubclassedFEPSPlumeRise, self).compute(*args,
+                    **kwargs)
+        computed = []
+        feps = SubclassedFEPSPlumeRise(engine=_feps(0.01).config("ENGINE"))
+        scheduler = DeadlineScheduler(feps, SEVPlumeRise(), 10.0,
+            feps_cost=0.01)
+        results = list(scheduler.compute_many([_fire(10)]))
+        assert results[0][1] == 'feps'
+        assert len(computed) == 1 and computed[0] is not None
@@ -0,0 +1,69 @@
+__author__      = "Joel Dubowy"
+
+import os
+import socket
+import threading
+
+from pytest import fixture, raises
+
+from plumerise.server import (PlumeRiseClient, PlumeRiseServer,
+    recv_message, send_message)
+from plumerise.sev import SEVPlumeRise
+
+
+def _local_met(pbl):
+    return {
+        "2014-05-29T22:00:00": {
+            "HGTS": [59.2, 127.3],
+            "RELH": [28.0, 22.0],
+            "TPOT": [293.4, 295.6],
+            "PBLH": pbl
+        }
+    }
+
+@fixture
+def socket_path(tmp_path):
+    path = str(tmp_path / 'plumerise.sock')
+    server = PlumeRiseServer(path, config={'plume_bottom_over_top': 0.4},
+        max_workers=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+class TestPlumeRiseServer(object):
+
+    def test_pipelined_compute(self, socket_path):
+        config = {'plume_bottom_over_top': 0.4}
+        with PlumeRiseClient(socket_path) as client:
+            futures = [client.submit('sev', {'local_met': _local_met(pbl),
+                'fire_area': 200}) for pbl in range(100, 600, 50)]
+            for pbl, future in zip(range(100, 600, 50), futures):
+                assert future.result(10) == SEVPlumeRise(**config).compute(
+                    _local_met(pbl), 200)
+
+            health = client.health(10)
+            assert health['status'] == 'ok'
+            assert health['completed'] == 10
+            assert health['queue_depth'] == 0
+
+    def test_errors(self, socket_path):
+        with PlumeRiseClient(socket_path) as client:
+            with raises(Exception) as e:
+                client.compute('sev', {'local_met': _local_met(100)}, 10)
+            assert 'fire_area' in str(e.value)
+            with raises(Exception):
+                client.compute('foo', {}, 10)
+            # connection is still usable
+            assert client.health(10)['failed'] == 2
+
+    def test_protocol(self, socket_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        with sock, sock.makefile('rb') as f:
+            send_message(sock, {'id': 'x', 'op': 'bar'})
+            assert recv_message(f) == {'id': 'x', 'error': 'Unknown op: bar'}
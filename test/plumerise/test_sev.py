@@ -1,11 +1,21 @@
 __author__      = "Joel Dubowy"
 
 import copy
+import datetime
+import json
+import os
+import tempfile
 
+import numpy as np
 #from numpy.testing import assert_approx_equal
+from numpy.testing import assert_allclose
 from pytest import raises
 
-from plumerise.sev import SEVPlumeRise
+from fixtures import make_local_met
+from plumerise.cache import ResultCache, StabilityCache
+from plumerise.met import LocalMet
+from plumerise.metrics import Metrics
+from plumerise.sev import SEVPlumeRise, parameter_grid
 
 class TestSEVPlumeRise(object):
 
@@ -114,3 +124,396 @@ class TestSEVPlumeRise(object):
         }
         actual = SEVPlumeRise().compute(local_met, fire_area)
         assert expected_plumerise == actual['hours']
+
+
+class TestSEVPlumeRiseComputeBatch(object):
+
+    def test_matches_compute(self):
+        fires = [(make_local_met(), 200, None, 0.0),
+            (make_local_met(pbl_offset=50), 10, 5.0e7, 0.2),
+            (make_local_met(pbl_offset=150), 30, -1.0, 0.5)]
+
+        sev = SEVPlumeRise()
+        expected = [sev.compute(m, a, smolder_fraction=s, frp=f)['hours']
+            for m, a, f, s in fires]
+
+        dts = sorted(fires[0][0].keys())
+        pbl = [[m[dt]['PBLH'] for dt in dts] for m, a, f, s in fires]
+        tpot = [[m[dt]['TPOT'] for dt in dts] for m, a, f, s in fires]
+        hgts = [[m[dt]['HGTS'] for dt in dts] for m, a, f, s in fires]
+        frp = [[4180.8 * a if f is None else f] for m, a, f, s in fires]
+        smolder_fraction = [[s] for m, a, f, s in fires]
+
+        actual = sev.compute_batch(pbl, tpot, hgts, frp=frp,
+            smolder_fraction=smolder_fraction)
+
+        assert actual['plume_top_meters'].shape == (3, 5)
+        for i, hours in enumerate(expected):
+            for j, dt in enumerate(dts):
+                assert_allclose(actual['plume_top_meters'][i, j],
+                    hours[dt]['heights'][-1], rtol=1e-12)
+                assert_allclose(actual['plume_bottom_meters'][i, j],
+                    hours[dt]['heights'][0], rtol=1e-12)
+                assert actual['smolder_fraction'][i, j] == hours[dt]['smolder_fraction']
+
+    def test_fire_area(self):
+        sev = SEVPlumeRise()
+        with raises(ValueError):
+            sev.compute_batch([[255.0]], [[[293.4, 295.6]]], [[[59.2, 127.3]]])
+        a = sev.compute_batch([[255.0]], [[[293.4, 295.6]]],
+            [[[59.2, 127.3]]], fire_area=[[200]])
+        b = sev.compute_batch([[255.0]], [[[293.4, 295.6]]],
+            [[[59.2, 127.3]]], frp=[[4180.8 * 200]])
+        assert a['plume_top_meters'] == b['plume_top_meters']
+
+
+class TestSEVPlumeRiseResultCache(object):
+
+    def test_cache(self, monkeypatch):
+        local_met = make_local_met()
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        expected = SEVPlumeRise().compute(local_met, 200)
+        assert expected == SEVPlumeRise(result_cache=cache).compute(local_met, 200)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("shouldn't be called")
+        monkeypatch.setattr(SEVPlumeRise, '_compute', fail)
+        assert expected == SEVPlumeRise(result_cache=cache).compute(local_met, 200)
+        with raises(RuntimeError):
+            SEVPlumeRise(result_cache=cache, alpha=0.3).compute(local_met, 200)
+
+    def test_keyed_on_used_met(self):
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        sev = SEVPlumeRise(result_cache=cache)
+        local_met = make_local_met()
+        sev.compute(local_met, 200)
+        dt = sorted(local_met)[0]
+        # levels and variables SEV doesn't use
+        local_met[dt]["HGTS"] = local_met[dt]["HGTS"][:2] + [999.0]
+        local_met[dt]["WSPD"] = [5.0, 6.0, 7.0]
+        sev.compute(local_met, 200)
+        assert cache.stats()['hits'] == 1
+        local_met[dt]["TPOT"] = [293.0] + local_met[dt]["TPOT"][1:]
+        assert sev.compute(local_met, 200) == SEVPlumeRise().compute(
+            local_met, 200)
+        assert cache.stats()['misses'] == 2
+
+    def test_datetime_keys(self):
+        local_met = {datetime.datetime(2014, 5, 29, h): met_loc for h, (dt,
+            met_loc) in enumerate(sorted(make_local_met().items()))}
+        cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'c.sqlite'))
+        for result_type in ('dict', 'array'):
+            sev = SEVPlumeRise(result_cache=cache, result_type=result_type)
+            miss = sev.compute(local_met, 200)
+            hit = sev.compute(local_met, 200)
+            if result_type == 'dict':
+                assert hit == miss
+                assert sorted(hit['hours']) == sorted(local_met)
+            else:
+                assert hit.timestamps.tolist() == miss.timestamps.tolist()
+                assert_allclose(hit.plume_top, miss.plume_top)
+        # both result types are computed from the same cached columns
+        assert cache.stats()['misses'] == 1
+
+
+class TestSEVPlumeRiseResultType(object):
+
+    def test_array(self):
+        local_met = make_local_met()
+        expected = SEVPlumeRise().compute(local_met, 200, smolder_fraction=0.1)
+        actual = SEVPlumeRise(result_type='array').compute(local_met, 200,
+            smolder_fraction=0.1)
+        assert len(actual) == 5
+        assert expected == actual.to_dict()
+
+
+class TestSEVPlumeRiseIterCompute(object):
+
+    def test_matches_compute(self):
+        local_met = make_local_met()
+        # hour without required data is skipped
+        local_met["2014-05-29T05:00:00"] = {"PBLH": 100.0}
+        expected = SEVPlumeRise().compute(local_met, 200, smolder_fraction=0.1)
+
+        consumed = []
+        def met_iter():
+            for dt in sorted(local_met):
+                consumed.append(dt)
+                yield dt, local_met[dt]
+
+        results = SEVPlumeRise().iter_compute(met_iter(), 200,
+            smolder_fraction=0.1)
+        # lazily consumed
+        dt, hour = next(results)
+        assert consumed == ["2014-05-29T00:00:00"]
+        assert hour == expected['hours'][dt]
+        rest = list(results)
+        assert len(rest) == 4
+        assert dict([(dt, hour)] + rest) == expected['hours']
+
+
+class TestSEVPlumeRiseMetrics(object):
+
+    def test_metrics(self):
+        metrics = Metrics()
+        local_met = make_local_met()
+        SEVPlumeRise(metrics=metrics).compute(local_met, 200)
+        list(SEVPlumeRise(metrics=metrics).iter_compute(
+            sorted(local_met.items()), 200))
+        d = metrics.as_dict()
+        assert d['phases']['compute']['count'] == 1
+        assert d['totals']['hours'] == 10
+
+
+class TestSEVPlumeRiseComputeGrid(object):
+
+    def _fields(self):
+        rng = np.random.default_rng(0)
+        shape = (3, 4, 5)
+        height_0 = rng.uniform(50, 100, shape)
+        return {
+            'height_abl': rng.uniform(50, 3000, shape),
+            'theta_0': 290 + rng.uniform(0, 2, shape),
+            'theta_1': 293 + rng.uniform(0, 2, shape),
+            'height_0': height_0,
+            'height_1': height_0 + rng.uniform(50, 200, shape),
+            'frp': rng.uniform(1e6, 1e9, shape[1:])
+        }
+
+    def _expected(self, f):
+        shape = f['height_abl'].shape
+        n = int(np.prod(shape))
+        r = SEVPlumeRise().compute_batch(f['height_abl'].reshape(n, 1),
+            np.stack([f['theta_0'], f['theta_1']], axis=-1).reshape(n, 1, 2),
+            np.stack([f['height_0'], f['height_1']], axis=-1).reshape(n, 1, 2),
+            frp=np.broadcast_to(f['frp'], shape).reshape(n, 1))
+        return (r['plume_top_meters'].reshape(shape),
+            r['plume_bottom_meters'].reshape(shape))
+
+    def test_matches_compute_batch(self):
+        f = self._fields()
+        expected_top, expected_bottom = self._expected(f)
+        # budgets forcing chunks across time steps, rows, and cells
+        for max_chunk_bytes in (10 ** 9, 96 * 20, 96 * 3, 1):
+            top, bottom = SEVPlumeRise().compute_grid(
+                max_chunk_bytes=max_chunk_bytes, **f)
+            assert_allclose(top, expected_top, rtol=1e-12)
+            assert_allclose(bottom, expected_bottom, rtol=1e-12)
+
+    def test_npy_files(self, tmp_path):
+        f = self._fields()
+        expected_top, expected_bottom = self._expected(f)
+        filenames = {}
+        for k, v in f.items():
+            filenames[k] = str(tmp_path / (k + '.npy'))
+            np.save(filenames[k], v)
+        top_file = str(tmp_path / 'top.npy')
+        bottom_file = str(tmp_path / 'bottom.npy')
+
+        top, bottom = SEVPlumeRise().compute_grid(plume_top_out=top_file,
+            plume_bottom_out=bottom_file, max_chunk_bytes=96 * 7,
+            **filenames)
+        assert isinstance(top, np.memmap)
+        assert_allclose(np.load(top_file), expected_top, rtol=1e-12)
+        assert_allclose(np.load(bottom_file), expected_bottom, rtol=1e-12)
+
+
+class TestSEVPlumeRiseComputeEnsemble(object):
+
+    def test_matches_compute_batch(self):
+        local_met = make_local_met()
+        dts = sorted(local_met)
+        pbl = [[local_met[dt]['PBLH'] for dt in dts]] * 2
+        tpot = [[local_met[dt]['TPOT'] for dt in dts]] * 2
+        hgts = [[local_met[dt]['HGTS'] for dt in dts]] * 2
+        frp = [[8.0e5], [3.0e8]]
+
+        params = parameter_grid(alpha=[0.2, 0.24], delta=[0.5, 0.6, 0.7],
+            plume_bottom_over_top=[0.4])
+        assert len(params['ALPHA']) == 6
+
+        # tiny budget, to evaluate one parameter set at a time
+        for max_chunk_bytes in (10 ** 9, 1):
+            actual = SEVPlumeRise(beta=180).compute_ensemble(params, pbl,
+                tpot, hgts, frp=frp, max_chunk_bytes=max_chunk_bytes)
+            assert actual['plume_top_meters'].shape == (6, 2, 5)
+            for i in range(6):
+                config = {k.lower(): v[i] for k, v in params.items()}
+                expected = SEVPlumeRise(beta=180, **config).compute_batch(
+                    pbl, tpot, hgts, frp=frp)
+                assert_allclose(actual['plume_top_meters'][i],
+                    expected['plume_top_meters'], rtol=1e-12)
+                assert_allclose(actual['plume_bottom_meters'][i],
+                    expected['plume_bottom_meters'], rtol=1e-12)
+
+    def test_zero_gamma_and_frp(self):
+        # negative FRP is clamped to zero
+        pbl, tpot, hgts = [100.0] * 3, [[290, 291]] * 3, [[10, 100]] * 3
+        frp = [0.0, -5.0, 1e6]
+        actual = SEVPlumeRise().compute_ensemble({'gamma': [0.0, 0.35]},
+            pbl, tpot, hgts, frp=frp)
+        for i, gamma in enumerate((0.0, 0.35)):
+            expected = SEVPlumeRise(gamma=gamma).compute_batch(pbl, tpot,
+                hgts, frp=frp)
+            assert_allclose(actual['plume_top_meters'][i],
+                expected['plume_top_meters'], rtol=1e-12)
+        # with GAMMA of zero, FRP doesn't matter
+        assert_allclose(actual['plume_top_meters'][0],
+            [actual['plume_top_meters'][0][2]] * 3, rtol=1e-12)
+
+    def test_invalid_parameters(self):
+        with raises(ValueError):
+            SEVPlumeRise().compute_ensemble({'foo': [1]}, [100.0],
+                [[290, 291]], [[10, 100]], frp=[1e6])
+        with raises(ValueError):
+            SEVPlumeRise().compute_ensemble({'alpha': [1, 2], 'beta': [1]},
+                [100.0], [[290, 291]], [[10, 100]], frp=[1e6])
+
+
+class TestSEVPlumeRiseStabilityCache(object):
+
+    def test_shared_across_fires(self):
+        local_met = make_local_met()
+        expected = [SEVPlumeRise().compute(local_met, a) for a in (10, 200)]
+
+        cache = StabilityCache()
+        sev = SEVPlumeRise(stability_cache=cache)
+        actual = [sev.compute(local_met, a, met_cell=(3, 4))
+            for a in (10, 200)]
+        # results are identical, not just close; one entry holds the terms
+        # of all hours
+        assert actual == expected
+        assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1,
+            'hit_rate': 0.5}
+
+        # streaming, too, an hour at a time
+        for i in range(2):
+            assert dict(sev.iter_compute(sorted(local_met.items()), 10,
+                met_cell=(3, 4))) == expected[0]['hours']
+        assert cache.stats()['hits'] == 6
+        assert len(cache) == 6
+
+        # not used without met_cell, or with different parameters
+        sev.compute(local_met, 10)
+        SEVPlumeRise(stability_cache=cache, delta=0.5).compute(local_met, 10,
+            met_cell=(3, 4))
+        assert cache.stats()['hits'] == 6
+        assert len(cache) == 7
+
+    def test_missing_met(self):
+        local_met = make_local_met()
+        dts = sorted(local_met)
+        del local_met[dts[1]]["RELH"]
+        local_met[dts[3]] = {"PBLH": 100.0}
+        expected = SEVPlumeRise().compute(local_met, 200)
+        sev = SEVPlumeRise(stability_cache=StabilityCache())
+        assert sev.compute(local_met, 200, met_cell=0) == expected
+
+        # met that can't be computed fails as it does without the cache
+        local_met[dts[2]]["HGTS"] = [None, None]
+        for s in (SEVPlumeRise(), sev):
+            with raises(TypeError):
+                s.compute(local_met, 200, met_cell=0)
+
+
+class TestSEVPlumeRiseComputeIncremental(object):
+
+    def test_reuses_unchanged_hours(self):
+        local_met = make_local_met()
+        dts = sorted(local_met)
+        for result_type in ('dict', 'array'):
+            metrics = Metrics()
+            sev = SEVPlumeRise(result_type=result_type, metrics=metrics)
+
+            first_met = {dt: local_met[dt] for dt in dts[:3]}
+            plume_rise, digests = sev.compute_incremental(first_met, 200)
+            assert metrics.totals['hours'] == 3
+
+            # one hour revised and two appended
+            revised = copy.deepcopy(local_met)
+            revised[dts[2]]['PBLH'] += 100
+            plume_rise, digests = sev.compute_incremental(revised, 200,
+                previous=plume_rise, previous_digests=digests)
+            assert metrics.totals['hours'] == 6
+            assert metrics.totals['hours_reused'] == 2
+            expected = SEVPlumeRise(result_type=result_type).compute(
+                revised, 200)
+            if result_type == 'array':
+                plume_rise, expected = plume_rise.to_dict(), expected.to_dict()
+            assert plume_rise == expected
+
+    def test_recomputes_all_if_fire_changes(self):
+        local_met = make_local_met()
+        metrics = Metrics()
+        sev = SEVPlumeRise(metrics=metrics)
+        plume_rise, digests = sev.compute_incremental(local_met, 200)
+        plume_rise, digests = sev.compute_incremental(local_met, 300,
+            previous=plume_rise, previous_digests=digests)
+        assert metrics.totals['hours'] == 10
+        assert plume_rise == SEVPlumeRise().compute(local_met, 300)
+
+    def test_json_digests(self):
+        local_met = make_local_met()
+        metrics = Metrics()
+        sev = SEVPlumeRise(metrics=metrics)
+        plume_rise, digests = sev.compute_incremental(local_met, 200)
+        digests = json.loads(json.dumps(digests))
+        sev.compute_incremental(local_met, 200, previous=plume_rise,
+            previous_digests=digests)
+        assert metrics.totals['hours'] == 5
+        assert metrics.totals['hours_reused'] == 5
+
+    def test_revised_met_with_stability_cache(self):
+        local_met = make_local_met()
+        dts = sorted(local_met)
+        sev = SEVPlumeRise(stability_cache=StabilityCache())
+        plume_rise, digests = sev.compute_incremental(local_met, 200,
+            met_cell=(3, 4))
+
+        revised = copy.deepcopy(local_met)
+        revised[dts[2]]['TPOT'][1] += 2.0
+        plume_rise, digests = sev.compute_incremental(revised, 200,
+            previous=plume_rise, previous_digests=digests, met_cell=(3, 4))
+        assert plume_rise == SEVPlumeRise().compute(revised, 200)
+        assert plume_rise != SEVPlumeRise().compute(local_met, 200)
+
+
+class TestSEVPlumeRiseNumLayers(object):
+
+    def test_num_layers(self):
+        local_met = make_local_met()
+        for result_type in ('dict', 'array'):
+            plume_rise = SEVPlumeRise(num_layers=5,
+                result_type=result_type).compute(local_met, 200)
+            if result_type == 'array':
+                plume_rise = plume_rise.to_dict()
+            for hour in plume_rise['hours'].values():
+                assert len(hour['heights']) == 6
+                assert hour['emission_fractions'] == [0.2] * 5
+
+
+class TestSEVPlumeRiseLocalMet(object):
+
+    def test_matches_dict_form(self):
+        local_met = make_local_met()
+        local_met["2014-05-29T02:00:00"].pop("RELH")
+        met = LocalMet.from_dict(local_met)
+        for result_type in ('dict', 'array'):
+            sev = SEVPlumeRise(result_type=result_type)
+            expected = sev.compute(local_met, 200, smolder_fraction=0.1)
+            actual = sev.compute(met, 200, smolder_fraction=0.1)
+            if result_type == 'array':
+                expected, actual = expected.to_dict(), actual.to_dict()
+            assert sorted(actual['hours']) == sorted(expected['hours'])
+            assert len(actual['hours']) == 4
+            for dt, hour in expected['hours'].items():
+                assert actual['hours'][dt]['smolder_fraction'] == 0.1
+                assert_allclose(actual['hours'][dt]['heights'],
+                    hour['heights'], rtol=1e-12)
+
+    def test_keys_as_given(self):
+        local_met = {dt + 'Z': v for dt, v in
+            make_local_met().items()}
+        sev = SEVPlumeRise()
+        assert (sorted(sev.compute(LocalMet.from_dict(local_met), 200)['hours'])
+            == sorted(sev.compute(local_met, 200)['hours']))
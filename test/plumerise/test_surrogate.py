@@ -0,0 +1,169 @@
+__author__      = "Joel Dubowy"
+
+import copy
+
+from numpy.testing import assert_allclose
+from pytest import raises
+
+from plumerise.feps import FEPSPlumeRise
+from plumerise.surrogate import SurrogateEngine, SurrogateTable, reference_inputs
+
+TIMEPROFILE_HOUR = {"area_fraction": 0.1, "flaming": 0.1,
+    "smoldering": 0.1, "residual": 0.1}
+CONSUMPTION = {"flaming": 1000.0, "smoldering": 500.0, "residual": 200.0,
+    "duff": 100.0}
+LOCATION_INFO = {"area": 100.0}
+AXES = [
+    ("timeprofile.flaming", [0.0, 0.5, 1.0]),
+    ("consumption.flaming", [0.0, 10.0, 20.0, 40.0]),
+    ("fire_location_info.moisture_duff", [50.0, 150.0])
+]
+
+
+def engine(timeprofile, consumption, fire_location_info):
+    """Stand-in for the binaries, linear in each table axis"""
+    cons_flaming = consumption["flaming"] / fire_location_info["area"]
+    rows = []
+    for hour, dt in enumerate(sorted(timeprofile)):
+        flaming = timeprofile[dt]["flaming"]
+        rows.append({
+            "heat": 1000 * flaming * cons_flaming,
+            "smold_frac": 0.01 * fire_location_info["moisture_duff"],
+            "plume_bot": 100 * cons_flaming + 500 * flaming + 10 * hour,
+            "plume_top": 3 * cons_flaming * flaming
+                + fire_location_info["moisture_duff"] + 2000
+        })
+    return rows
+
+def _fire(flamings, cons_flaming, moisture_duff=100.0):
+    timeprofile = {"2015-08-05T%02d:00:00" % (h): dict(TIMEPROFILE_HOUR,
+        flaming=f) for h, f in enumerate(flamings)}
+    consumption = dict(CONSUMPTION, flaming=cons_flaming * 100.0)
+    return {
+        "timeprofile": timeprofile,
+        "consumption": consumption,
+        "fire_location_info": dict(LOCATION_INFO, moisture_duff=moisture_duff)
+    }
+
+
+class TestSurrogateTable(object):
+
+    def _table(self):
+        return SurrogateTable.build(engine, AXES, reference_inputs(
+            TIMEPROFILE_HOUR, CONSUMPTION, LOCATION_INFO), n_hours=6)
+
+    def test_lookup(self):
+        table = self._table()
+        fire = _fire([0.05, 0.3, 0.9], 27.5, moisture_duff=80.0)
+        args = (fire["timeprofile"], fire["consumption"],
+            fire["fire_location_info"])
+        actual = table.lookup(*args)
+        expected = engine(*copy.deepcopy(args))
+        assert len(actual) == 3
+        for a, e in zip(actual, expected):
+            for k in e:
+                assert_allclose(a[k], e[k], rtol=1e-12, atol=1e-9)
+
+    def test_outside_domain(self):
+        table = self._table()
+        # too many hours, axis value out of range, and non-axis value
+        # differing from reference
+        for fire in (_fire([0.1] * 7, 10.0), _fire([0.1], 50.0),
+                dict(_fire([0.1], 10.0), fire_location_info={"area": 5.0})):
+            assert table.lookup(fire["timeprofile"], fire["consumption"],
+                fire["fire_location_info"]) is None
+
+    def test_default_axes(self):
+        table = SurrogateTable.build(engine, None, reference_inputs(
+            TIMEPROFILE_HOUR, CONSUMPTION, LOCATION_INFO), n_hours=3)
+        # fires of any area, profile, and fuel loading, with the
+        # reference's weather
+        for area, flamings, loading in ((2.5, [0.02, 0.5, 0.08], 1.0),
+                (4000.0, [0.2], 0.3), (700.0, [0.04] * 3, 7.0)):
+            fire = _fire(flamings, 10.0)
+            fire["fire_location_info"]["area"] = area
+            fire["consumption"] = {k: loading * v / 100.0 * area
+                for k, v in CONSUMPTION.items()}
+            args = (fire["timeprofile"], fire["consumption"],
+                fire["fire_location_info"])
+            actual = table.lookup(*args)
+            assert actual is not None
+            for a, e in zip(actual, engine(*copy.deepcopy(args))):
+                for k in e:
+                    assert_allclose(a[k], e[k], rtol=1e-9, atol=1e-9)
+
+    def test_save_load(self, tmp_path):
+        table = self._table()
+        filename = str(tmp_path / "table.npz")
+        table.save(filename)
+        loaded = SurrogateTable.load(filename)
+        assert loaded.digest == table.digest
+        fire = _fire([0.2, 0.4], 5.0)
+        assert (loaded.lookup(fire["timeprofile"], fire["consumption"],
+            fire["fire_location_info"]) == table.lookup(fire["timeprofile"],
+            fire["consumption"], fire["fire_location_info"]))
+
+    def test_validate(self):
+        table = self._table()
+        report = table.validate(engine, [_fire([0.2, 0.7], 15.0),
+            _fire([0.2], 100.0)])
+        assert report["n_fires"] == 2
+        assert report["n_in_domain"] == 1
+        assert report["columns"]["plume_bot"]["max_abs_error"] < 1e-9
+
+    def test_invalid_axes(self):
+        reference = reference_inputs(TIMEPROFILE_HOUR, CONSUMPTION,
+            LOCATION_INFO)
+        with raises(ValueError):
+            SurrogateTable([("foo", [0, 1])], reference, [[[0, 0, 0, 0]]] * 2)
+        with raises(ValueError):
+            SurrogateTable([("timeprofile.flaming", [1, 0])], reference,
+                [[[0, 0, 0, 0]]] * 2)
+
+
+class TestSurrogateEngine(object):
+
+    def test_fallback(self):
+        table = SurrogateTable.build(engine, AXES, reference_inputs(
+            TIMEPROFILE_HOUR, CONSUMPTION, LOCATION_INFO), n_hours=6)
+        fallback_calls = []
+        def fallback(*args):
+            fallback_calls.append(args)
+            return engine(*args)
+
+        surrogate = SurrogateEngine(table, fallback)
+        feps = FEPSPlumeRise(engine=surrogate)
+        inside = _fire([0.2, 0.7], 15.0)
+        outside = _fire([0.2, 0.7], 100.0)
+        for fire in (inside, outside):
+            actual = feps.compute(fire["timeprofile"], fire["consumption"],
+                fire["fire_location_info"])
+            expected = FEPSPlumeRise(engine=engine).compute(
+                fire["timeprofile"], fire["consumption"],
+                fire["fire_location_info"])
+            for dt, hour in expected["hours"].items():
+                assert_allclose(actual["hours"][dt]["heights"],
+                    hour["heights"], rtol=1e-12)
+        assert len(fallback_calls) == 1
+        assert surrogate.stats() == {"hits": 1, "fallbacks": 1}
+        # fallback has no identity, so neither has the surrogate
+        assert surrogate.cache_key is None
+
+    def test_cache_key(self):
+        table = SurrogateTable.build(engine, AXES, reference_inputs(
+            TIMEPROFILE_HOUR, CONSUMPTION, LOCATION_INFO), n_hours=2)
+        def fallback_a(*args):
+            return engine(*args)
+        fallback_a.cache_key = "a"
+        def fallback_b(*args):
+            return engine(*args)
+        fallback_b.cache_key = "b"
+
+        a = SurrogateEngine(table, fallback_a)
+        b = SurrogateEngine(table, fallback_b)
+        assert a.cache_key == ["surrogate", table.digest, "a"]
+        assert a.cache_key != b.cache_key
+        assert repr(a) != repr(b)
+        run_binaries = FEPSPlumeRise().run_binaries
+        assert (SurrogateEngine(table, run_binaries).cache_key[2][0]
+            == "run_binaries")
@@ -0,0 +1,102 @@
+__author__      = "Joel Dubowy"
+
+import copy
+import threading
+
+from fixtures import CONSUMPTION, make_fire, make_timeprofile
+from plumerise.feps import FEPSPlumeRise
+from plumerise.triage import Triage
+
+
+class TestTriage(object):
+
+    def test_compute_many(self):
+        calls = []
+        lock = threading.Lock()
+        def engine(timeprofile, consumption, fire_location_info):
+            with lock:
+                calls.append(fire_location_info['area'])
+            return [{"heat": 1.0e9, "smold_frac": 0.1,
+                "plume_bot": fire_location_info['area'],
+                "plume_top": 2 * fire_location_info['area']}
+                for dt in timeprofile]
+
+        zero_consumption = {"flaming": 0.0, "smoldering": 0.0,
+            "residual": 0.0}
+        fires = [
+            make_fire(),
+            make_fire(area=300),
+            # duplicates, including one with defaults filled in
+            make_fire(),
+            make_fire(moisture_duff=100.0),
+            # zero fires
+            make_fire(consumption=zero_consumption),
+            make_fire(area=400, consumption=zero_consumption),
+            make_fire(area=300)
+        ]
+        feps = FEPSPlumeRise(engine=engine)
+        triage = Triage(feps, zero_smolder_fraction=0.1)
+        results = list(triage.compute_many(copy.deepcopy(fires),
+            max_workers=2))
+
+        assert sorted(calls) == [200, 300]
+        assert [r[0] for r in results] == list(range(7))
+        assert all(r[2] is None for r in results)
+        for i in (0, 1, 2, 3, 6):
+            f = fires[i]
+            assert results[i][1] == FEPSPlumeRise(engine=engine).compute(
+                f["timeprofile"], f["consumption"], f["fire_location_info"])
+        # not shared
+        assert results[0][1] is not results[2][1]
+        for i in (4, 5):
+            for hour in results[i][1]["hours"].values():
+                assert hour["heights"] == [0.0] * 21
+                assert hour["smolder_fraction"] == 0.1
+        assert triage.stats == {"fires": 7, "computed": 2,
+            "duplicates": 3, "zero": 2}
+
+    def test_errors_fan_out(self):
+        def engine(*args):
+            raise RuntimeError("failed")
+        results = list(Triage(FEPSPlumeRise(engine=engine)).compute_many(
+            [make_fire(), make_fire()]))
+        assert [str(r[2]) for r in results] == ["failed", "failed"]
+
+    def test_untriageable_fires_passed_to_model(self):
+        def engine(timeprofile, consumption, fire_location_info):
+            return [{"heat": consumption["flaming"], "smold_frac": 0.1,
+                "plume_bot": 100.0, "plume_top": 200.0} for dt in timeprofile]
+        feps = FEPSPlumeRise(engine=engine)
+        bad = make_fire()
+        bad["consumption"] = None
+        fires = [make_fire(), bad, copy.deepcopy(bad), make_fire()]
+
+        results = list(Triage(feps).compute_many(copy.deepcopy(fires)))
+        expected = list(feps.compute_many(copy.deepcopy(fires)))
+        assert [r[0] for r in results] == [0, 1, 2, 3]
+        assert [type(r[2]) for r in results] == [type(r[2]) for r in expected]
+        assert [r[1] is None for r in results] == [False, True, True, False]
+        assert results[3][1] == expected[3][1]
+
+    def test_zero_area_fraction_computed(self):
+        calls = []
+        def engine(timeprofile, consumption, fire_location_info):
+            calls.append(1)
+            return [{"heat": 0.0, "smold_frac": 0.3, "plume_bot": 0.0,
+                "plume_top": 0.0} for dt in timeprofile]
+        zero_profile = {dt: dict(h, area_fraction=0.0)
+            for dt, h in make_timeprofile().items()}
+        triage = Triage(FEPSPlumeRise(engine=engine))
+        results = list(triage.compute_many([make_fire(timeprofile=zero_profile)]))
+        # smolder fraction is the model's
+        assert len(calls) == 1
+        for hour in results[0][1]["hours"].values():
+            assert hour["smolder_fraction"] == 0.3
+        assert triage.stats["zero"] == 0
+
+    def test_binary_engine_keys_on_input_files(self):
+        triage = Triage(FEPSPlumeRise())
+        # differences the binaries don't see
+        assert (triage._key(make_fire()) == triage._key(make_fire(latitude=45.0,
+            consumption=dict(CONSUMPTION, flaming=2000.0000000001))))
+        assert triage._key(make_fire()) != triage._key(make_fire(area=201))
@@ -0,0 +1,55 @@
+__author__      = "Joel Dubowy"
+
+import numpy as np
+from numpy.testing import assert_allclose
+from pytest import raises
+
+from plumerise import compute_plumerise_hour
+from plumerise.result import PlumeRiseResult
+from plumerise.vertical import VerticalAllocator
+
+LEVELS = [0, 100, 500, 1000, 2000, 5000]
+
+
+class TestVerticalAllocator(object):
+
+    def _rebin(self, bottom, top):
+        """Re-bins an hour's layers onto LEVELS, one layer at a time"""
+        hour = compute_plumerise_hour(0.0, top, bottom, num_layers=20)
+        allocation = np.zeros(len(LEVELS) - 1)
+        for lo, hi, f in zip(hour['heights'][:-1], hour['heights'][1:],
+                hour['emission_fractions']):
+            for i in range(len(LEVELS) - 1):
+                overlap = min(hi, LEVELS[i + 1]) - max(lo, LEVELS[i])
+                if overlap > 0:
+                    allocation[i] += f * overlap / (hi - lo)
+        return allocation
+
+    def test_matches_rebinned_layers(self):
+        bottoms = [50.0, 450.0, 1000.0, 3000.0]
+        tops = [150.0, 1900.0, 2000.0, 6000.0]
+        allocation = VerticalAllocator(LEVELS).allocate(bottoms, tops,
+            fraction=[1.0, 1.0, 0.5, 1.0])
+        assert allocation.shape == (4, 5)
+        for i, (b, t) in enumerate(zip(bottoms, tops)):
+            expected = self._rebin(b, t) * (0.5 if i == 2 else 1.0)
+            assert_allclose(allocation[i], expected, atol=1e-12)
+        # above the highest level boundary
+        assert_allclose(allocation[3].sum(), 2.0 / 3)
+
+    def test_no_plume_and_zero_depth(self):
+        allocation = VerticalAllocator(LEVELS).allocate([np.nan, 700.0],
+            [np.nan, 700.0])
+        assert_allclose(allocation, [[0, 0, 0, 0, 0], [0, 0, 1, 0, 0]])
+
+    def test_allocate_result(self):
+        result = PlumeRiseResult(["2014-05-29T00:00:00"], [50.0], [150.0],
+            [0.1], num_layers=5)
+        assert_allclose(VerticalAllocator(LEVELS).allocate_result(result),
+            [[0.5, 0.5, 0, 0, 0]])
+
+    def test_invalid_levels(self):
+        with raises(ValueError):
+            VerticalAllocator([100])
+        with raises(ValueError):
+            VerticalAllocator([0, 100, 50])
@@ -0,0 +1,113 @@
+__author__      = "Joel Dubowy"
+
+import os
+import tempfile
+import threading
+
+from pytest import raises
+
+from plumerise.workdir import WorkingDirManager, NamedPipes
+
+
+class TestWorkingDirManager(object):
+
+    def test_removed_after_use(self):
+        manager = WorkingDirManager(root=tempfile.mkdtemp())
+        with manager.acquire() as working_dir:
+            assert os.path.dirname(working_dir) == manager.root
+            open(os.path.join(working_dir, 'a.txt'), 'w').close()
+        assert not os.path.exists(working_dir)
+
+        with raises(RuntimeError):
+            with manager.acquire() as working_dir:
+                raise RuntimeError("failed")
+        assert not os.path.exists(working_dir)
+
+    def test_keep_on_failure(self):
+        manager = WorkingDirManager(root=tempfile.mkdtemp(),
+            keep_on_failure=True)
+        with raises(RuntimeError):
+            with manager.acquire() as working_dir:
+                raise RuntimeError("failed")
+        assert os.path.isdir(working_dir)
+        manager.cleanup()
+        assert not os.path.exists(working_dir)
+
+    def test_reuse(self):
+        with WorkingDirManager(root=tempfile.mkdtemp(), reuse=True) as manager:
+            with manager.acquire() as d1:
+                pass
+            with manager.acquire() as d2:
+                pass
+            assert d1 == d2 and os.path.isdir(d1)
+
+            # files left by one user aren't seen by the next
+            with manager.acquire() as d:
+                open(os.path.join(d, 'plume.txt'), 'w').close()
+                os.mkdir(os.path.join(d, 'sub'))
+            with manager.acquire() as d:
+                assert d == d1 and os.listdir(d) == []
+
+            # a dir in use isn't handed out to another thread
+            other = []
+            def acquire():
+                with manager.acquire() as d:
+                    other.append(d)
+            with manager.acquire() as d3:
+                t = threading.Thread(target=acquire)
+                t.start()
+                t.join()
+            assert d3 == d1 and other[0] != d1
+        assert not os.path.exists(d1) and not os.path.exists(other[0])
+
+    def test_max_bytes(self):
+        manager = WorkingDirManager(root=tempfile.mkdtemp(),
+            keep_on_failure=True, max_bytes=10)
+        with raises(RuntimeError):
+            with manager.acquire() as kept_dir:
+                with open(os.path.join(kept_dir, 'a.txt'), 'w') as f:
+                    f.write('x' * 20)
+                raise RuntimeError("failed")
+        assert manager.usage() == 20
+
+        # the kept dir is removed to make room
+        with manager.acquire() as working_dir:
+            assert not os.path.exists(kept_dir)
+
+        # dirs in use count, whether or not they're reused
+        for reuse in (False, True):
+            manager = WorkingDirManager(root=tempfile.mkdtemp(), reuse=reuse,
+                max_bytes=10)
+            with manager.acquire() as working_dir:
+                with open(os.path.join(working_dir, 'a.txt'), 'w') as f:
+                    f.write('x' * 20)
+                assert manager.usage() == 20
+                with raises(Exception):
+                    with manager.acquire() as other_dir:
+                        pass
+            assert manager.usage() == 0
+
+
+class TestNamedPipes(object):
+
+    def test_read_and_write(self):
+        working_dir = tempfile.mkdtemp()
+        in_file = os.path.join(working_dir, 'in.txt')
+        out_file = os.path.join(working_dir, 'out.txt')
+
+        pipes = NamedPipes()
+        pipes.write(in_file, 'abc\n')
+        out = pipes.read(out_file)
+        # stand-in for an external program
+        with open(in_file) as f_in, open(out_file, 'w') as f_out:
+            f_out.write(f_in.read().upper())
+        pipes.close()
+        assert out == ['ABC\n']
+
+    def test_unopened_pipes(self):
+        working_dir = tempfile.mkdtemp()
+        pipes = NamedPipes()
+        pipes.write(os.path.join(working_dir, 'in.txt'), 'abc\n')
+        out = pipes.read(os.path.join(working_dir, 'out.txt'))
+        pipes.close()
+        assert out == ['']